@@ -0,0 +1,150 @@
+import os
+import time
+import logging
+import threading
+
+import numpy as np
+
+from graftm.read_decoder import _FASTA_HEADER_REGEX
+
+class CaptureIndexLoader:
+    '''Loads the index of a ReadCapture in a separate thread while the
+    capture is being written, i.e. while the reads are being searched, so
+    that once the search has finished the reads which hit can be extracted
+    without reading through the whole index. Read names are held as their
+    hash together with the offset of their record, 16 bytes per read, and
+    the name in each record extracted is checked against the names asked
+    for.'''
+    # Seconds to wait for more of the index to be written
+    _POLL_INTERVAL = 0.05
+    # Bytes of the index read at a time
+    _BLOCK_SIZE = 4*1024*1024
+
+    def __init__(self, capture):
+        '''Start loading the index of the capture
+
+        Parameters
+        ----------
+        capture: ReadCapture
+            capture to load the index of, which may not yet have been written
+        '''
+        self._capture = capture
+        self._stopped = False
+        self._error = None
+        # Hashes of the read names in sorted order, the index of the read of
+        # each, and the offset of each read in capture order
+        self._hashes = None
+        self._order = None
+        self._offsets = None
+        self._thread = threading.Thread(target=self._load)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _wait(self):
+        '''Wait for more of the index to be written. Return False if loading
+        has been stopped or the capture has been removed.'''
+        if self._stopped or \
+            not os.path.isdir(os.path.dirname(self._capture.index_path)):
+            return False
+        time.sleep(self._POLL_INTERVAL)
+        return True
+
+    def _open_index(self):
+        '''Return the index file, open while it is being written if it is
+        not yet complete, or None if loading was stopped'''
+        while True:
+            for path in (self._capture.index_path+'.partial',
+                         self._capture.index_path):
+                try:
+                    return open(path)
+                except IOError:
+                    pass
+            if not self._wait():
+                return None
+
+    def _load(self):
+        try:
+            index = self._open_index()
+            if index is None:
+                return
+            hashes = []
+            offsets = []
+            leftover = ''
+            with index:
+                while True:
+                    # The capture is checked before reading so that nothing
+                    # written before it was completed is missed
+                    complete = self._capture.is_complete()
+                    data = index.read(self._BLOCK_SIZE)
+                    if data:
+                        lines = (leftover+data).split('\n')
+                        leftover = lines.pop()
+                        if lines:
+                            fields = '\t'.join(lines).split('\t')
+                            names = fields[0::2]
+                            hashes.append(np.fromiter(
+                                (hash(name) for name in names),
+                                dtype=np.int64, count=len(names)))
+                            offsets.append(np.array(fields[1::2],
+                                                    dtype=np.int64))
+                    elif complete:
+                        break
+                    elif not self._wait():
+                        return
+            if hashes:
+                offsets = np.concatenate(offsets)
+                hashes = np.concatenate(hashes)
+            else:
+                offsets = np.zeros(0, dtype=np.int64)
+                hashes = np.zeros(0, dtype=np.int64)
+            # Sorted here so that this is also done during the search
+            self._order = np.argsort(hashes, kind='mergesort')
+            self._hashes = hashes[self._order]
+            self._offsets = offsets
+        except Exception, e:
+            self._error = e
+
+    def stop(self):
+        '''Stop loading, e.g. because the search failed'''
+        self._stopped = True
+        self._thread.join()
+
+    def extract(self, read_names, output_path):
+        '''Wait for the capture to be complete and its index loaded, then
+        extract reads as ReadCapture.extract does.'''
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+        if self._hashes is None:
+            raise Exception("Programming error: capture index was not loaded")
+        logging.debug("Extracting reads using the index of %i captured reads" % \
+                      len(self._offsets))
+
+        wanted = set(read_names)
+        wanted_hashes = np.array([hash(name) for name in wanted],
+                                 dtype=np.int64)
+        starts = np.searchsorted(self._hashes, wanted_hashes, 'left')
+        ends = np.searchsorted(self._hashes, wanted_hashes, 'right')
+        if len(wanted_hashes) > 0:
+            # Indices of records whose name has a wanted hash, in capture order
+            records = np.sort(np.concatenate(
+                [self._order[s:e] for s, e in zip(starts, ends)])).tolist()
+        else:
+            records = []
+
+        fasta_size = os.path.getsize(self._capture.fasta_path)
+        num_written = 0
+        with open(self._capture.fasta_path, 'rb') as fasta:
+            with open(output_path, 'w') as out:
+                for record in records:
+                    start = int(self._offsets[record])
+                    if record+1 < len(self._offsets):
+                        end = int(self._offsets[record+1])
+                    else:
+                        end = fasta_size
+                    fasta.seek(start)
+                    data = fasta.read(end-start)
+                    if _FASTA_HEADER_REGEX.match(data).group(1) in wanted:
+                        out.write(data)
+                        num_written += 1
+        return num_written
@@ -26,6 +26,7 @@ from graftm.sequence_io import SequenceIO
 from graftm.graftm_package import GraftMPackageVersion3, GraftMPackage
 from graftm.decorator import Decorator
 from graftm.greengenes_taxonomy import GreenGenesTaxonomy
+from graftm import kmer_prefilter
 from graftm.sequence_searcher import SequenceSearcher
 
 class InsufficientGraftMPackageVersion(Exception):
@@ -438,6 +439,30 @@ graftM create --taxtastic_taxonomy %s --taxtastic_seqinfo %s --alignment %s  --r
         cmd = "diamond makedb --in '%s' -d '%s'" % (unaligned_sequences_path, daa_output)
         extern.run(cmd)
 
+    def _create_kmer_prefilter(self, unaligned_sequences_path, output_path,
+                               package_type):
+        '''
+        Build a k-mer prefilter index of sequences, a KmerPrefilter for
+        protein packages or a MinimizerPrefilter for nucleotide packages
+
+        Parameters
+        ----------
+        unaligned_sequences_path: str
+            path to a FASTA file containing unaligned sequences
+        output_path: str
+            path to write the index to
+        package_type: str
+            Create._PROTEIN_PACKAGE_TYPE or Create._NUCLEOTIDE_PACKAGE_TYPE
+        '''
+        logging.debug("Building k-mer prefilter")
+        with open(unaligned_sequences_path) as f:
+            prefilter = kmer_prefilter.build(
+                (seq for _, seq, _ in SequenceIO().each(f)),
+                package_type == Create._PROTEIN_PACKAGE_TYPE)
+        logging.debug("K-mer prefilter contains %.4f%% of possible k-mers" % \
+                      (prefilter.fraction_filled()*100))
+        prefilter.write(output_path)
+
     def _align_and_create_hmm(self, sequences, alignment, user_hmm,
                               output_align_hmm, output_alignment, threads):
 
@@ -555,6 +580,7 @@ graftM create --taxtastic_taxonomy %s --taxtastic_seqinfo %s --alignment %s  --r
         graftm_package = kwargs.pop('graftm_package',False)
         dereplication_level = kwargs.pop('dereplication_level',False)
         threads = kwargs.pop('threads',5)
+        kmer_prefilter = kwargs.pop('kmer_prefilter', False)
 
         if len(kwargs) > 0:
             raise Exception("Unexpected arguments detected: %s" % kwargs)
@@ -830,6 +856,16 @@ in the final GraftM package. If you are sure these sequences are correct, turn o
         else:
             diamondb = None
 
+        kmer_prefilter_path = None
+        if kmer_prefilter:
+            if sequences:
+                logging.info("Creating k-mer prefilter")
+                kmer_prefilter_path = '%s.kmers' % base
+                self._create_kmer_prefilter(sequences, kmer_prefilter_path,
+                                            ptype)
+            else:
+                logging.warn("A k-mer prefilter can only be created from unaligned sequences, so not creating one")
+
         if sequences:
             # Get range
             max_range = self._define_range(sequences)
@@ -840,7 +876,8 @@ in the final GraftM package. If you are sure these sequences are correct, turn o
         logging.info("Compiling gpkg")
 
         GraftMPackageVersion3.compile(output_gpkg_path, refpkg, align_hmm, diamondb,
-                                      max_range, sequences, search_hmm_files=search_hmm_files)
+                                      max_range, sequences, search_hmm_files=search_hmm_files,
+                                      kmer_prefilter=kmer_prefilter_path)
 
         logging.info("Cleaning up")
         self._cleanup(self.the_trash)
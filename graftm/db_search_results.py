@@ -4,11 +4,15 @@ class DBSearchResult:
     '''
     DBSearchResult - Class for containing results from search pipeline in GraftM
     '''
-    def __init__(self, output_reads, search_result, hit_read_count, slash_endings):
+    def __init__(self, output_reads, search_result, hit_read_count, slash_endings,
+                 diamond_result=None):
         self.output_reads   = output_reads
         self.search_result = search_result
         self.hit_count     = hit_read_count
         self.slash_endings = slash_endings
+        # DiamondSearchResult of the sequences in output_reads, if they have
+        # already been searched with diamond, e.g. when searching for them
+        self.diamond_result = diamond_result
     
     def hit_fasta(self): # Return the path to the fasta file of hits
         return self.output_reads
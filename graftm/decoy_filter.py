@@ -1,4 +1,10 @@
+import os
+import shutil
+import hashlib
 import logging
+import tempfile
+import extern
+import numpy as np
 from graftm.diamond import Diamond
 from graftm.unpack_sequences import UnpackRawReads
 from graftm.sequence_search_results import SequenceSearchResult
@@ -19,7 +25,17 @@ class DecoyFilter:
         '''
         self._decoy_diamond = decoy_diamond
         self._proper_hits_diamond = proper_hits_diamond
+        # DiamondSearchResult of the last sequences filtered against the
+        # non-decoy database
+        self.proper_hits = None
         
+    def _best_bit_scores(self, search_result):
+        '''Return a dict of each query in search_result to its highest bit
+        score'''
+        rows = search_result.best_rows()
+        bit_scores = search_result.column(SequenceSearchResult.ALIGNMENT_BIT_SCORE)
+        return dict(zip(search_result.queries(), bit_scores[rows].tolist()))
+
     def filter(self, candidate_sequences_fasta_path, filtered_output_fasta_path):
         '''Filter the fasta file by only keeping sequences that hit a proper sequence
         better than the decoy database.
@@ -37,19 +53,14 @@ class DecoyFilter:
         False if no sequences remain after filtering, else True.
         '''
         # Run query sequences against the proper database
-        seq_ids_and_bitscores = {}
         logging.debug("Running diamond against the non-decoy sequences")
         pd = self._proper_hits_diamond.run(
             candidate_sequences_fasta_path,
             UnpackRawReads.PROTEIN_SEQUENCE_TYPE)
-        for res in pd.each([SequenceSearchResult.QUERY_ID_FIELD,
-                            SequenceSearchResult.ALIGNMENT_BIT_SCORE]):
-            seq = res[0]
-            score = float(res[1])
-            # Possible a single sequence gets 2 split up hits (maybe), so take
-            # the highest bitscore.
-            if seq not in seq_ids_and_bitscores or seq_ids_and_bitscores[seq] < score:
-                seq_ids_and_bitscores[seq] = score
+        self.proper_hits = pd
+        # Possible a single sequence gets 2 split up hits (maybe), so take
+        # the highest bitscore.
+        seq_ids_and_bitscores = self._best_bit_scores(pd)
 
         num_before_decoy_removal = len(seq_ids_and_bitscores)
         logging.info("Found %i sequences which hit the non-decoy sequences" %\
@@ -64,10 +75,7 @@ class DecoyFilter:
             pd = self._decoy_diamond.run(
                 candidate_sequences_fasta_path,
                 UnpackRawReads.PROTEIN_SEQUENCE_TYPE)
-            for res in pd.each([SequenceSearchResult.QUERY_ID_FIELD,
-                                SequenceSearchResult.ALIGNMENT_BIT_SCORE]):
-                seq = res[0]
-                score = float(res[1])
+            for seq, score in self._best_bit_scores(pd).iteritems():
                 if seq in seq_ids_and_bitscores and seq_ids_and_bitscores[seq] < score:
                     logging.debug("Removing sequence with better hit to the decoy database: %s" % seq)
                     del seq_ids_and_bitscores[seq]
@@ -85,3 +93,162 @@ class DecoyFilter:
                                     candidate_sequences_fasta_path,
                                     filtered_output_fasta_path)
         return True
+
+class MergedDecoyDatabase:
+    '''A directory of diamond databases, each of the sequences of a non-decoy
+    database together with those of a decoy database, whose names are
+    prefixed with DECOY_LABEL. Merged databases are named by a hash of the
+    paths, sizes and modification times of the databases they are made from,
+    so they are made again if either database changes. The number of letters
+    of the non-decoy database is kept beside each merged database (see
+    proper_size), so that it can be searched with the E-values of the
+    non-decoy database.'''
+    # Without separators, so that diamond's parsing of sequence IDs such as
+    # sp|P12345|NAME keeps the label
+    DECOY_LABEL = 'graftm_decoy__'
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path(self, proper_database, decoy_database):
+        '''Return the path of the merged database of the two databases,
+        which may not have been made yet'''
+        sha1 = hashlib.sha1(self.DECOY_LABEL+'\n')
+        for database in (proper_database, decoy_database):
+            stat = os.stat(database)
+            sha1.update('%s %i %r\n' % (os.path.realpath(database),
+                                         stat.st_size, stat.st_mtime))
+        return os.path.join(self.directory, sha1.hexdigest()+'.dmnd')
+
+    @staticmethod
+    def _size_path(merged_database):
+        return os.path.splitext(merged_database)[0]+'.letters'
+
+    @staticmethod
+    def proper_size(merged_database):
+        '''Return the number of letters of the non-decoy database a merged
+        database was made from'''
+        with open(MergedDecoyDatabase._size_path(merged_database)) as f:
+            return int(f.read())
+
+    def acquire(self, proper_database, decoy_database):
+        '''Return the path of the merged database of the two databases,
+        making it if it is not already in the directory. It is made in a
+        temporary directory and then moved into place, so that incomplete
+        databases are never used.
+
+        Parameters
+        ----------
+        proper_database: str
+            path to the diamond database of non-decoy sequences
+        decoy_database: str
+            path to the diamond database of decoy sequences
+
+        Returns
+        -------
+        path to the merged diamond database
+        '''
+        path = self.path(proper_database, decoy_database)
+        if os.path.exists(path) and os.path.exists(self._size_path(path)):
+            logging.debug("Using merged decoy database %s" % path)
+            return path
+
+        logging.info("Creating merged decoy database %s" % path)
+        if not os.path.isdir(self.directory):
+            try:
+                os.makedirs(self.directory)
+            except OSError:
+                # Made by a concurrent run
+                if not os.path.isdir(self.directory):
+                    raise
+        partial = tempfile.mkdtemp(prefix='partial', dir=self.directory)
+        try:
+            sequences = os.path.join(partial, 'merged.faa')
+            extern.run("diamond getseq -d '%s' > '%s'" % (proper_database,
+                                                          sequences))
+            with open(sequences) as f:
+                letters = sum(len(line.strip()) for line in f \
+                              if not line.startswith('>'))
+            extern.run("diamond getseq -d '%s' |sed 's/^>/>%s/' >> '%s'" % \
+                       (decoy_database, self.DECOY_LABEL, sequences))
+            base = os.path.join(partial, 'merged')
+            extern.run("diamond makedb --in '%s' -d '%s'" % (sequences, base))
+            # The database is moved into place last, since its presence
+            # marks the merged database as complete
+            with open(base+'.letters', 'w') as f:
+                f.write('%i\n' % letters)
+            os.rename(base+'.letters', self._size_path(path))
+            os.rename(base+'.dmnd', path)
+        finally:
+            shutil.rmtree(partial)
+        return path
+
+class MergedDecoyFilter(DecoyFilter):
+    '''A DecoyFilter which searches the candidate sequences once, against a
+    MergedDecoyDatabase, rather than against the non-decoy and decoy
+    databases in turn. E-values are calculated for the size of the non-decoy
+    database, so the hits to it are those of searching it alone.'''
+    # Number of hits reported for each query, so that the best non-decoy hit
+    # is found even when the query has better hits to decoy sequences
+    MAX_TARGET_SEQS = 25
+
+    def __init__(self, merged_database, proper_database, threads=None,
+                 evalue=None):
+        '''
+        Parameters
+        ----------
+        merged_database: str
+            path to the merged diamond database, from MergedDecoyDatabase
+        proper_database: str
+            path to the non-decoy diamond database it was made from
+        threads: int or None
+            number of threads diamond uses
+        evalue: float or None
+            E-value cutoff, or None for diamond's default
+        '''
+        self._diamond = Diamond(
+            merged_database, threads=threads, evalue=evalue,
+            max_target_seqs=self.MAX_TARGET_SEQS,
+            dbsize=MergedDecoyDatabase.proper_size(merged_database))
+        self._proper_database = proper_database
+        self.proper_hits = None
+
+    def filter(self, candidate_sequences_fasta_path, filtered_output_fasta_path):
+        '''As per DecoyFilter.filter'''
+        logging.debug("Running diamond against the merged decoy database")
+        res = self._diamond.run(candidate_sequences_fasta_path,
+                                UnpackRawReads.PROTEIN_SEQUENCE_TYPE)
+        numbers, names = res.name_numbers(SequenceSearchResult.HIT_ID_FIELD)
+        is_decoy = np.array([name.startswith(MergedDecoyDatabase.DECOY_LABEL) \
+                             for name in names], dtype=bool)[numbers]
+
+        proper = res.subset(np.flatnonzero(~is_decoy))
+        # Only the best hit of each query to the non-decoy sequences, as if
+        # it had been searched against them alone
+        self.proper_hits = proper.subset(proper.best_rows())
+        self.proper_hits.database = self._proper_database
+        self.proper_hits.evalue = res.evalue
+        self.proper_hits.evalue_database = self._proper_database
+        seq_ids_and_bitscores = self._best_bit_scores(proper)
+        num_before_decoy_removal = len(seq_ids_and_bitscores)
+        logging.info("Found %i sequences which hit the non-decoy sequences" %\
+                     num_before_decoy_removal)
+
+        decoy_bitscores = self._best_bit_scores(
+            res.subset(np.flatnonzero(is_decoy)))
+        for seq, score in decoy_bitscores.iteritems():
+            if seq in seq_ids_and_bitscores and seq_ids_and_bitscores[seq] < score:
+                logging.debug("Removing sequence with better hit to the decoy database: %s" % seq)
+                del seq_ids_and_bitscores[seq]
+        logging.info("Removed %i"
+                     " sequences which hit the decoy sequences better"
+                     " than the non-decoy sequences" %\
+                     (num_before_decoy_removal-len(seq_ids_and_bitscores)))
+        if len(seq_ids_and_bitscores) == 0:
+            return False
+
+        logging.debug("Extracting query sequences")
+        SequenceExtractor().extract(seq_ids_and_bitscores.keys(),
+                                    candidate_sequences_fasta_path,
+                                    filtered_output_fasta_path)
+        return True
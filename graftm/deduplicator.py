@@ -14,12 +14,16 @@ class Deduplicator:
             
         Returns
         -------
-        Array of arrays of Sequence objects"""
+        Array of arrays of Sequence objects. Sequences in the same group
+        share a single copy of their (identical) seq string, so that
+        duplicates do not each keep their own copy in memory."""
         
         sequence_to_groups = {}
         for s in aligned_sequence_objects:
             try:
-                sequence_to_groups[s.seq].append(s)
+                group = sequence_to_groups[s.seq]
+                s.seq = group[0].seq
+                group.append(s)
             except KeyError:
                 sequence_to_groups[s.seq] = [s]
         return sequence_to_groups.values()
@@ -1,31 +1,46 @@
 from graftm.sequence_search_results import DiamondSearchResult
+import subprocess
 import tempfile
+import logging
 import extern
 import os
 from graftm.unpack_sequences import UnpackRawReads
 
 class Diamond:
-    def __init__(self, database, threads=None, evalue=None):
-        self._database = database
-        self._threads = threads
-        self._evalue = evalue
-        
-    def run(self, input_sequence_file, input_sequence_type, daa_file_basename=None):
-        '''Run input sequences in either blastp or blastx mode against the
-        database specified in __init__.
-            
+    # diamond uses roughly this many GB of memory per unit of --block-size
+    # (billions of sequence letters)
+    MEMORY_PER_BLOCK_SIZE = 6.0
+    # E-value cutoff diamond uses when none is given
+    DEFAULT_EVALUE = 0.001
+
+    def __init__(self, database, threads=None, evalue=None, memory_limit=None,
+                 max_target_seqs=1, dbsize=None):
+        '''
         Parameters
         ----------
-        input_sequence_file: str
-            path to query sequences
-        input_sequence_type: either 'nucleotide' or 'protein'
-            the input_sequences are this kind of sequence
-            
-        Returns
-        -------
-        DiamondSearchResult
+        database: str
+            path to the .dmnd database
+        threads: int or None
+            number of threads diamond uses
+        evalue: float or None
+            E-value cutoff
+        memory_limit: float or None
+            approximate memory in GB diamond may use, which sets the block
+            size it searches queries in, or None to use diamond's default
+        max_target_seqs: int
+            maximum number of hits reported for each query
+        dbsize: int or None
+            number of letters of the database E-values are calculated for,
+            or None for the size of the database itself
         '''
-        
+        self._database = database
+        self._threads = threads
+        self._evalue = evalue
+        self._memory_limit = memory_limit
+        self._max_target_seqs = max_target_seqs
+        self._dbsize = dbsize
+
+    def _command_list(self, input_sequence_file, input_sequence_type):
         cmd_list = ["diamond"]
         if input_sequence_type == UnpackRawReads.PROTEIN_SEQUENCE_TYPE:
             cmd_list.append('blastp')
@@ -33,20 +48,12 @@ class Diamond:
             cmd_list.append('blastx')
         else:
             raise Exception("Programming error")
-        
-        basename = daa_file_basename
-        if basename is None:
-            with tempfile.NamedTemporaryFile(prefix='graftm_diamond') as t:
-                # we are just stealing the name, don't need the file itself
-                basename = t.name
-            
-        for c in ['-k 1',
+
+        for c in ['-k %i' % self._max_target_seqs,
                   "-d",
                     self._database,
                     "-q",
-                    "%s" % input_sequence_file,
-                    "-a",
-                    basename]:
+                    "%s" % input_sequence_file]:
             cmd_list.append(c)
         if self._threads:
             cmd_list.append("--threads")
@@ -54,19 +61,151 @@ class Diamond:
         if self._evalue:
             cmd_list.append("--evalue")
             cmd_list.append(str(self._evalue))
+        if self._memory_limit:
+            cmd_list.append("--block-size")
+            cmd_list.append("%g" % (self._memory_limit / self.MEMORY_PER_BLOCK_SIZE))
+        if self._dbsize:
+            cmd_list.append("--dbsize")
+            cmd_list.append(str(self._dbsize))
+        return cmd_list
 
+    def _run_tabular(self, cmd_list, read_function):
+        '''Run diamond with tabular output to a pipe, returning the result of
+        read_function given diamond's stdout'''
+        cmd_list.append("--outfmt 6")
         cmd = ' '.join(cmd_list)
-        extern.run(cmd)
-        
-        daa_name = "%s.daa" % basename
-        res = DiamondSearchResult.import_from_daa_file(daa_name)
-        
-        if daa_file_basename is None:
-            # Diamond makes an extra file, need to remove this
-            os.remove(daa_name)
-            
+        logging.debug("Running cmd: %s" % cmd)
+        with tempfile.TemporaryFile() as stderr:
+            process = subprocess.Popen(["bash", "-c", cmd],
+                                       stdout=subprocess.PIPE,
+                                       stderr=stderr)
+            res = read_function(process.stdout)
+            process.stdout.close()
+            if process.wait() != 0:
+                stderr.seek(0)
+                raise Exception("Problem running diamond with cmd: '%s', "
+                                "stderr was %s" % (cmd, stderr.read()))
+        return res
+
+    def run(self, input_sequence_file, input_sequence_type, daa_file_basename=None,
+            keep_daa=True):
+        '''Run input sequences in either blastp or blastx mode against the
+        database specified in __init__. Unless a .daa file is to be kept, the
+        results are read from diamond as it writes them in tabular format,
+        rather than written to a .daa file and then viewed.
+
+        Parameters
+        ----------
+        input_sequence_file: str
+            path to query sequences
+        input_sequence_type: either 'nucleotide' or 'protein'
+            the input_sequences are this kind of sequence
+        daa_file_basename: str or None
+            write diamond's .daa file to this path, with .daa appended. The
+            hits are named after the .daa file (see HMM_NAME_FIELD), even if
+            it is not kept.
+        keep_daa: bool
+            if False, do not write the .daa file of daa_file_basename
+
+        Returns
+        -------
+        DiamondSearchResult
+        '''
+        cmd_list = self._command_list(input_sequence_file, input_sequence_type)
+
+        if daa_file_basename is not None and keep_daa:
+            cmd_list.append("-a")
+            cmd_list.append(daa_file_basename)
+            cmd = ' '.join(cmd_list)
+            extern.run(cmd)
+            res = DiamondSearchResult.import_from_daa_file(
+                "%s.daa" % daa_file_basename)
+        else:
+            if daa_file_basename is None:
+                name = os.path.basename(self._database)
+            else:
+                name = os.path.basename("%s.daa" % daa_file_basename)
+            res = self._run_tabular(
+                cmd_list,
+                lambda stdout: DiamondSearchResult.import_from_tabular(stdout, name))
+        self._describe(res)
         return res
-            
-            
-            
-                
\ No newline at end of file
+
+    def _describe(self, result):
+        '''Record the database and E-value cutoff used in a result, and the
+        database whose size its E-values were calculated from, so that its
+        hits can be reused (see covers)'''
+        result.database = self._database
+        result.evalue = self._evalue
+        result.evalue_database = self._database if self._dbsize is None else None
+
+    def covers(self, result):
+        '''Return True if result, a DiamondSearchResult from Diamond.run(),
+        contains all the hits this Diamond would find for the same query
+        sequences, i.e. it was searched against the same database with an E-value
+        cutoff at least as permissive, and its E-values were calculated from
+        the size of that database. The hits with an E-value above this
+        Diamond's cutoff must be ignored.'''
+        for database in (getattr(result, 'database', None),
+                         getattr(result, 'evalue_database', None)):
+            if database is None or \
+                os.path.realpath(database) != os.path.realpath(self._database):
+                return False
+        try:
+            evalue = float(self._evalue) if self._evalue else self.DEFAULT_EVALUE
+            result_evalue = float(result.evalue) if result.evalue else self.DEFAULT_EVALUE
+        except ValueError:
+            return False
+        return result_evalue >= evalue
+
+    def run_batch(self, input_sequence_files, input_sequence_type,
+                  daa_file_basenames=None):
+        '''Search the sequences of several files with a single diamond
+        process, so that the database is only loaded once, e.g. for many small
+        samples. Each query is tagged with the number of its file, and the
+        results are split back into one DiamondSearchResult per file. No .daa
+        files are written.
+
+        Parameters
+        ----------
+        input_sequence_files: list of str
+            paths to query sequences, in FASTA format
+        input_sequence_type: either 'nucleotide' or 'protein'
+            the input_sequences are this kind of sequence
+        daa_file_basenames: list of str or None
+            as per run(), naming the hits of each file
+
+        Returns
+        -------
+        list of DiamondSearchResult, one for each of input_sequence_files
+        '''
+        if daa_file_basenames is None:
+            names = [os.path.basename(self._database)]*len(input_sequence_files)
+        else:
+            names = [os.path.basename("%s.daa" % b) for b in daa_file_basenames]
+
+        with tempfile.NamedTemporaryFile(prefix='graftm_diamond_batch', suffix='.fa') as queries:
+            for i, path in enumerate(input_sequence_files):
+                with open(path) as f:
+                    for line in f:
+                        if line.startswith('>'):
+                            queries.write('>%i_%s' % (i, line[1:]))
+                        else:
+                            queries.write(line)
+            queries.flush()
+            logging.debug("Searching the sequences of %i files together with diamond" % \
+                          len(input_sequence_files))
+
+            def demultiplex(stdout):
+                lines = [[] for _ in input_sequence_files]
+                for line in stdout:
+                    tag, line = line.split('_', 1)
+                    lines[int(tag)].append(line)
+                return [DiamondSearchResult.import_from_tabular(l, name) \
+                        for l, name in zip(lines, names)]
+            results = self._run_tabular(
+                self._command_list(queries.name, input_sequence_type),
+                demultiplex)
+        for res in results:
+            self._describe(res)
+        return results
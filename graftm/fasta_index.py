@@ -0,0 +1,112 @@
+import os
+import mmap
+
+class FastaIndex:
+    r"""Offsets of each record in a FASTA file, similar to a samtools faidx
+    index, so that records can be extracted by name with seeks rather than a
+    scan of the whole file. The file is memory-mapped, and records are copied
+    to the output without being parsed.
+
+    Records are looked up by the first word of their header. Records which
+    share a name are all kept, and records are always returned in the order
+    they occur in the file."""
+
+    def __init__(self, fasta_path):
+        r"""Index a FASTA file.
+
+        Parameters
+        ----------
+        fasta_path: str
+            path to the FASTA file. The file must be seekable, so it cannot be
+            a pipe.
+        """
+        self._fasta_path = fasta_path
+        self._spans = {}
+        self._file = open(fasta_path, 'rb')
+        if os.path.getsize(fasta_path) == 0:
+            # Empty files cannot be memory-mapped
+            self._mmap = ''
+        else:
+            self._mmap = mmap.mmap(self._file.fileno(), 0,
+                                   access=mmap.ACCESS_READ)
+        self._build()
+
+    def _build(self):
+        data = self._mmap
+        size = len(data)
+        if size == 0:
+            return
+        if data[0] == '>':
+            start = 0
+        else:
+            start = data.find('\n>')+1
+            if start == 0:
+                return
+        while True:
+            next_header = data.find('\n>', start)
+            end = size if next_header == -1 else next_header+1
+            header_end = data.find('\n', start, end)
+            if header_end == -1: header_end = end
+            words = data[start+1:header_end].split(None, 1)
+            name = words[0] if words else ''
+            try:
+                self._spans[name].append((start, end))
+            except KeyError:
+                self._spans[name] = [(start, end)]
+            if end == size:
+                break
+            start = end
+
+    def __len__(self):
+        return sum(len(spans) for spans in self._spans.itervalues())
+
+    def __contains__(self, name):
+        return name in self._spans
+
+    def names(self):
+        r"""Return the distinct record names, in no particular order"""
+        return self._spans.keys()
+
+    def records(self, names):
+        r"""Return the FASTA records with the given names as a list of str,
+        each ending in a newline, in file order. Names without a record are
+        ignored."""
+        spans = []
+        for name in set(names):
+            if name in self._spans:
+                spans.extend(self._spans[name])
+        spans.sort()
+        records = [self._mmap[start:end] for start, end in spans]
+        if records and not records[-1].endswith('\n'):
+            records[-1] += '\n'
+        return records
+
+    def write_records(self, names, output_io):
+        r"""Write the FASTA records with the given names to an open file, in
+        file order.
+
+        Parameters
+        ----------
+        names: iterable of str
+            names of records to write
+        output_io: file
+            where to write the records
+
+        Returns
+        -------
+        The number of records written
+        """
+        records = self.records(names)
+        output_io.write(''.join(records))
+        return len(records)
+
+    def close(self):
+        if self._mmap:
+            self._mmap.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
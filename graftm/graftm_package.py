@@ -31,6 +31,7 @@ class GraftMPackage:
     HMM_TRUSTED_CUTOFF_KEY = "trusted_cutoff"
     RANGE_KEY = "range"
     UNALIGNED_SEQUENCE_DATABASE_KEY = "unaligned_sequence_database"
+    KMER_PREFILTER_KEY = "kmer_prefilter"
     _CONTENTS_FILE_NAME = 'CONTENTS.json'
 
     _CURRENT_VERSION = 3
@@ -189,6 +190,8 @@ class GraftMPackageVersion2(GraftMPackage):
             use these HMMs for search instead of the hmm_path. All
             basenames of these paths must be unique, and not the same as
             hmm_path.
+        kmer_prefilter: str or None
+            path to a KmerPrefilter index of the unaligned sequences
             
         Returns
         -------
@@ -245,6 +248,16 @@ class GraftMPackageVersion3(GraftMPackageVersion2):
         else:
             return None
 
+    def kmer_prefilter_path(self):
+        '''Return the path to the KmerPrefilter index of the unaligned
+        sequences, or None if the package does not have one. Packages need not
+        have this key, so it is not required.'''
+        path = self._contents_hash.get(GraftMPackage.KMER_PREFILTER_KEY)
+        if path:
+            return os.path.join(self._base_directory, path)
+        else:
+            return None
+
     def create_diamond_db(self):
         '''Create a diamond database from the unaligned sequences in this package.
 
@@ -305,7 +318,8 @@ class GraftMPackageVersion3(GraftMPackageVersion2):
     @staticmethod
     def compile(output_package_path, refpkg_path, hmm_path, diamond_database_file, 
                 max_range, unaligned_sequence_database=None, 
-                trusted_cutoff=False, search_hmm_files=None):
+                trusted_cutoff=False, search_hmm_files=None,
+                kmer_prefilter=None):
         '''Create a new GraftM package with the given inputs. Any files
         specified as parameters are copied into the final package so can
         be removed after calling this function.
@@ -354,6 +368,10 @@ class GraftMPackageVersion3(GraftMPackageVersion2):
             diamond_database_file_in_gpkg = diamond_database_file
         refpkg_in_gpkg = os.path.basename(refpkg_path)
         shutil.copytree(refpkg_path, os.path.join(output_package_path, refpkg_in_gpkg))
+
+        if kmer_prefilter:
+            kmer_prefilter_in_gpkg = os.path.basename(kmer_prefilter)
+            shutil.copyfile(kmer_prefilter, os.path.join(output_package_path, kmer_prefilter_in_gpkg))
         
         if search_hmm_files:
             search_hmm_files_in_gpkg_names =\
@@ -376,5 +394,7 @@ class GraftMPackageVersion3(GraftMPackageVersion2):
                     GraftMPackage.UNALIGNED_SEQUENCE_DATABASE_KEY: (os.path.basename(unaligned_sequence_database)
                                                                     if unaligned_sequence_database else None),
                     GraftMPackage.DIAMOND_DATABASE_KEY: diamond_database_file_in_gpkg}
+        if kmer_prefilter:
+            contents[GraftMPackage.KMER_PREFILTER_KEY] = kmer_prefilter_in_gpkg
         
         json.dump(contents, open(os.path.join(output_package_path, GraftMPackage._CONTENTS_FILE_NAME), 'w'))
@@ -1,15 +1,101 @@
+import os
+import re
+import errno
+import atexit
+import shutil
 import logging
+import tempfile
+import itertools
+import threading
+from Queue import Queue, Empty
+from functools import partial
 import extern
 
+from graftm import stream_sharder
+from graftm.sequence_search_results import HMMSearchResult
+
 class NoInputSequencesException(Exception):
     def __init__(self, command):
         """Instantiate with the command used that went amiss"""
         self.command = command
 
+class _FifoReader:
+    r"""Runs a function which reads a FIFO in a separate thread, so that a
+    table written to the FIFO by a search is read as it is written, rather
+    than from a file once the search has finished"""
+
+    def __init__(self, fifo, read_function):
+        r"""Make the FIFO and start reading it
+
+        Parameters
+        ----------
+        fifo: String
+            path of the FIFO to make
+        read_function: function
+            function which takes the path of the FIFO, reads it, and returns
+            a result"""
+        os.mkfifo(fifo)
+        self._fifo = fifo
+        self._result = None
+        self._error = None
+        self._thread = threading.Thread(target=self._read,
+                                        args=(read_function,))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _read(self, read_function):
+        try:
+            self._result = read_function(self._fifo)
+        except Exception, e:
+            self._error = e
+
+    def finish(self):
+        r"""Wait until the FIFO has been read. This must only be called once
+        the commands writing to the FIFO have finished, and returns even if
+        none of them opened the FIFO."""
+        while self._thread.is_alive():
+            try:
+                # Opening for writing fails until the FIFO is opened for
+                # reading. Closing it again ends the read if no command
+                # opened the FIFO.
+                fd = os.open(self._fifo, os.O_WRONLY | os.O_NONBLOCK)
+            except OSError, e:
+                if e.errno != errno.ENXIO:
+                    raise
+                self._thread.join(0.01)
+            else:
+                os.close(fd)
+                break
+        self._thread.join()
+
+    def result(self):
+        r"""Wait until the FIFO has been read, then return the result of the
+        read function, or raise the exception it raised"""
+        self.finish()
+        if self._error is not None:
+            raise self._error
+        return self._result
+
 class HmmSearcher:
-    r"""Runs hmmsearch given one or many HMMs in a scalable and fast way"""
+    r"""Runs hmmsearch given one or many HMMs in a scalable and fast way.
 
-    def __init__(self, num_cpus, extra_args=''):
+    This and the other searchers below are interchangeable search backends:
+    each has a hmmsearch method which searches the sequences output by a
+    command with a list of HMMs, writes one output table per HMM, and returns
+    the hits as one HMMSearchResult per HMM, so that callers do not need to
+    read the tables again.
+
+    Searches write their tables to FIFOs rather than files. Each is read by
+    a separate thread as it is written, which copies it to the output file
+    and keeps its rows, so that reading the tables overlaps the search
+    rather than following it."""
+
+    # --domE of searches whose domain E-values are recalculated afterwards,
+    # so that every domain of each reported sequence is reported
+    _ALL_DOMAINS_EVALUE = '1e+300'
+
+    def __init__(self, num_cpus, extra_args='', num_shards=1,
+                 domain_evalue=None, target_weight=None):
         r"""New
 
         Parameters
@@ -18,9 +104,47 @@ class HmmSearcher:
             The total number of CPUs to use when searching
         extra_args: String
             Extra arguments for hmmsearch. --cpus is already defined, so
-            do not specify it in this argument"""
-        self._num_cpus = num_cpus
+            do not specify it in this argument
+        num_shards: Integer
+            Number of parts to split the input sequences into, each of which
+            is searched by separate processes sharing the CPUs. Results are
+            merged afterwards. When sharding, extra_args should include -Z
+            so that E-values do not depend on the size of each shard.
+        domain_evalue: String
+            --domE cutoff of the search, or None if it is given in extra_args
+            or not used. Domain E-values (i-Evalues) are calculated from the
+            number of sequences reported (domZ), which differs between
+            shards, so when sharding the domains are instead filtered once
+            their E-values have been recalculated for the whole input.
+        target_weight: function
+            If not None, a function taking the name of a sequence searched
+            and returning the number of input sequences it stands for, e.g.
+            itself and the reads left out of the search because they
+            duplicate it. Domains are then filtered as per domain_evalue,
+            with domZ the number of input sequences reported. Only called
+            once the search has finished."""
+        self._num_shards = num_shards
+        # CPUs are shared among the shards
+        self._num_cpus = max(1, num_cpus / num_shards)
         self._extra_args = extra_args
+        self._domain_evalue = domain_evalue
+        self._target_weight = target_weight
+
+    def _recalculates_domain_evalues(self):
+        r"""Return True if domains are filtered by E-value after searching
+        rather than by hmmsearch"""
+        return self._domain_evalue is not None and \
+            (self._num_shards > 1 or self._target_weight is not None)
+
+    def _search_args(self):
+        r"""Return the arguments of each search other than --cpu"""
+        if self._domain_evalue is None:
+            return self._extra_args
+        if self._recalculates_domain_evalues():
+            domain_evalue = self._ALL_DOMAINS_EVALUE
+        else:
+            domain_evalue = self._domain_evalue
+        return '--domE %s %s' % (domain_evalue, self._extra_args)
 
     def hmmsearch(self, input_pipe, hmms, output_files):
         r"""Run HMMsearch with all the HMMs, generating output files
@@ -39,7 +163,7 @@ class HmmSearcher:
 
         Returns
         -------
-        N/A
+        list of HMMSearchResult, one for each HMM
 
         May raise an exception if hmmsearching went amiss"""
 
@@ -52,21 +176,155 @@ class HmmSearcher:
         for i, hmm in enumerate(hmms):
             queue.append( [hmm, output_files[i]] )
 
-        # While there are more things left in the queue
-        while len(queue) > 0:
+        # (output file, _FifoReader) of each table written
+        readers = []
+        fifo_directory = tempfile.mkdtemp(prefix='graftm_hmmsearch_tables')
+        try:
             pairs_to_run = self._munch_off_batch(queue)
+            if len(queue) == 0:
+                # All HMMs are searched in one pass over the input
+                self._run_batch(input_pipe, pairs_to_run, fifo_directory,
+                                readers)
+            else:
+                self._run_batches(input_pipe, pairs_to_run, queue,
+                                  fifo_directory, readers)
+        finally:
+            for _, reader in readers:
+                reader.finish()
+            shutil.rmtree(fifo_directory)
 
-            # Run hmmsearches with each of the pairs
-            cmd = self._hmm_command(input_pipe, pairs_to_run)
-            logging.debug("Running command: %s" % cmd)
+        if self._num_shards > 1:
+            rows = self._merge_shard_outputs(output_files)
+        elif self._recalculates_domain_evalues():
+            rows = dict([(f, self._write_table(f, [self._read_table(f)])) \
+                         for f in output_files])
+        else:
+            rows = dict([(output_file, []) for output_file in output_files])
+            for output_file, reader in readers:
+                rows[output_file].extend(reader.result())
+        return [self._import_rows(rows[f]) for f in output_files]
 
-            try:
-                extern.run(cmd)
-            except extern.ExternCalledProcessError, e:
-                if e.stderr == '\nError: Sequence file - is empty or misformatted\n\n':
-                    raise NoInputSequencesException(cmd)
-                else:
-                    raise e
+    def _run_batches(self, input_pipe, pairs_to_run, queue, fifo_directory,
+                     readers):
+        r"""Search with pairs_to_run, then with the rest of the queue"""
+        # Keep a copy of the input sequences as the first batch is searched,
+        # so that the input command (e.g. decompression and ORF calling) is
+        # only run once, however many batches there are
+        handle, input_copy = tempfile.mkstemp(prefix='graftm_hmmsearch_input',
+                                              suffix='.fa')
+        os.close(handle)
+        try:
+            self._run_batch("%s | tee '%s'" % (input_pipe, input_copy),
+                            pairs_to_run, fifo_directory, readers)
+            if self._num_shards > 1:
+                while len(queue) > 0:
+                    self._run_batch("cat '%s'" % input_copy,
+                                    self._munch_off_batch(queue),
+                                    fifo_directory, readers)
+            else:
+                self._search_file(input_copy, queue, fifo_directory, readers)
+        finally:
+            os.remove(input_copy)
+
+    def _import_rows(self, rows):
+        return HMMSearchResult.import_from_hmmsearch_rows(rows)
+
+    def _copy_table(self, table, output_file):
+        r"""Copy the table to output_file as it is written, returning the
+        whitespace separated fields of each row"""
+        rows = []
+        with open(table) as f:
+            with open(output_file, 'w') as out:
+                for line in iter(f.readline, ''):
+                    out.write(line)
+                    if not line.startswith('#'):
+                        rows.append(line.rstrip().split())
+        return rows
+
+    def _read_from_fifo(self, output_file, fifo_directory, readers):
+        r"""Make a FIFO in fifo_directory which is copied to output_file as it
+        is written, adding its reader to readers. Return the path of the FIFO
+        and its reader."""
+        fifo = tempfile.mktemp(prefix='table', dir=fifo_directory)
+        reader = _FifoReader(fifo, partial(self._copy_table,
+                                           output_file=output_file))
+        readers.append((output_file, reader))
+        return fifo, reader
+
+    def _run_batch(self, input_pipe, pairs_to_run, fifo_directory, readers):
+        r"""Run a batch of HMMs as returned by _munch_off_batch, all reading
+        from a single run of input_pipe"""
+        batch_readers = []
+        fifo_pairs = []
+        for (hmm, output_file), num_cpus in pairs_to_run:
+            if self._num_shards > 1:
+                # Each shard writes to the FIFO named as its shard of
+                # fifo_base, which is copied to its shard of output_file
+                fifo_base = tempfile.mktemp(prefix='table', dir=fifo_directory)
+                for shard in range(self._num_shards):
+                    shard_fifo = self._shard_output_file(fifo_base, shard)
+                    shard_output_file = self._shard_output_file(output_file,
+                                                                shard)
+                    batch_readers.append((output_file, _FifoReader(
+                        shard_fifo, partial(self._copy_table,
+                                            output_file=shard_output_file))))
+                fifo_pairs.append([[hmm, fifo_base], num_cpus])
+            else:
+                fifo, _ = self._read_from_fifo(output_file, fifo_directory,
+                                               batch_readers)
+                fifo_pairs.append([[hmm, fifo], num_cpus])
+        readers.extend(batch_readers)
+
+        if self._num_shards > 1:
+            cmd = self._sharded_hmm_command(input_pipe, fifo_pairs)
+        else:
+            cmd = self._hmm_command(input_pipe, fifo_pairs)
+        logging.debug("Running command: %s" % cmd)
+
+        try:
+            extern.run(cmd)
+        except extern.ExternCalledProcessError, e:
+            if e.stderr == '\nError: Sequence file - is empty or misformatted\n\n':
+                raise NoInputSequencesException(cmd)
+            else:
+                raise e
+
+    def _search_file(self, input_path, queue, fifo_directory, readers):
+        r"""Search the sequences in input_path with each of the [hmm,
+        output_file] pairs in queue. As many searches are run at once as there
+        are CPUs, and the next search starts as soon as any one finishes,
+        rather than once the slowest of a batch finishes."""
+        num_workers = min(self._num_cpus, len(queue))
+        num_cpus = max(1, self._num_cpus / len(queue))
+        jobs = Queue()
+        for pair in queue:
+            jobs.put(pair)
+        errors = []
+
+        def work():
+            while not errors:
+                try:
+                    hmm, output_file = jobs.get_nowait()
+                except Empty:
+                    return
+                fifo, reader = self._read_from_fifo(output_file,
+                                                    fifo_directory, readers)
+                cmd = self._individual_hmm_command(hmm, fifo, num_cpus,
+                                                   input_path)
+                logging.debug("Running command: %s" % cmd)
+                try:
+                    extern.run(cmd)
+                except Exception, e:
+                    errors.append(e)
+                reader.finish()
+
+        workers = [threading.Thread(target=work) for _ in range(num_workers)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        if errors:
+            raise errors[0]
 
     def _munch_off_batch(self, queue):
         r"""Take a batch of sequences off the queue, and return pairs_to_run.
@@ -108,6 +366,11 @@ class HmmSearcher:
         -------
         A string command to be run with bash
         """
+        return "%s | %s" % (input_pipe, self._hmm_pipeline(pairs_to_run))
+
+    def _hmm_pipeline(self, pairs_to_run):
+        r"""INTERNAL method for getting the part of the cmdline of
+        _hmm_command which reads sequences from STDIN"""
         element = pairs_to_run.pop()
         hmmsearch_cmd = self._individual_hmm_command(element[0][0],
                                                       element[0][1],
@@ -118,22 +381,291 @@ class HmmSearcher:
                                                                               element[0][1],
                                                                               element[1]),
                                                 hmmsearch_cmd)
-
-        # Run the actual command
-        hmmsearch_cmd = "%s | %s" % (input_pipe, hmmsearch_cmd)
         return hmmsearch_cmd
 
-    def _individual_hmm_command(self, hmm, output_file, num_cpus):
-        return "hmmsearch %s --cpu %s -o /dev/null --noali --domtblout %s %s -" % (self._extra_args,
+    def _shard_output_file(self, output_file, shard):
+        return "%s.shard%i" % (output_file, shard)
+
+    def _sharded_hmm_command(self, input_pipe, pairs_to_run):
+        r"""INTERNAL method for getting cmdline for running a batch of HMMs
+        on each shard of the input. Arguments are as per _hmm_command, and
+        each shard writes to its own output files, which are merged by
+        _merge_shard_outputs."""
+        shard_commands = []
+        for shard in range(self._num_shards):
+            shard_pairs = [[[hmm, self._shard_output_file(output_file, shard)],
+                            num_cpus] for (hmm, output_file), num_cpus \
+                           in pairs_to_run]
+            shard_commands.append(self._hmm_pipeline(shard_pairs))
+        return "%s | %s" % (input_pipe,
+                            stream_sharder.command_line(shard_commands))
+
+    def _read_table(self, table):
+        r"""Return the comment lines before the rows of a table, its rows,
+        and the comment lines after them"""
+        header = []
+        lines = []
+        footer = []
+        with open(table) as f:
+            for line in f:
+                if not line.startswith('#'):
+                    lines.append(line)
+                elif lines:
+                    footer.append(line)
+                else:
+                    header.append(line)
+        return header, lines, footer
+
+    def _merge_shard_outputs(self, output_files):
+        r"""Merge the outputs of each shard into the output files, removing
+        the shard outputs. Shards which received no input have no output.
+        Return a dict of output file to the list of fields of each row
+        written to it."""
+        rows = {}
+        for output_file in output_files:
+            tables = []
+            for shard in range(self._num_shards):
+                shard_file = self._shard_output_file(output_file, shard)
+                if os.path.exists(shard_file):
+                    tables.append(self._read_table(shard_file))
+                    os.remove(shard_file)
+            rows[output_file] = self._write_table(output_file, tables)
+        return rows
+
+    def _write_table(self, output_file, tables):
+        r"""Write the rows of tables, as returned by _read_table, to
+        output_file, filtering their domains if their E-values are
+        recalculated. The header and footer are written once, from the first
+        table with rows, since the tables of shards differ only in their
+        output paths. Return the list of fields of each row written."""
+        header = []
+        footer = []
+        for table_header, table_lines, table_footer in tables:
+            if table_lines or not header:
+                header, footer = table_header, table_footer
+            if table_lines:
+                break
+        table_lines = [lines for _, lines, _ in tables]
+        if self._recalculates_domain_evalues():
+            lines = self._filter_domains(table_lines)
+        else:
+            lines = list(itertools.chain(*table_lines))
+        with open(output_file, 'w') as out:
+            out.writelines(header+lines+footer)
+        return [line.rstrip().split() for line in lines]
+
+    def _filter_domains(self, table_lines):
+        r"""Return the domtblout rows of each table (lists of lines) whose
+        domain E-values pass the --domE cutoff once recalculated for the
+        whole input.
+
+        hmmsearch calculates the conditional and independent domain E-values
+        (c-Evalue and i-Evalue) of a table by multiplying each domain's
+        P-value by the number of sequences it reports (domZ). With -Z fixed,
+        the sequences reported are the same whether or not the input is
+        sharded or dereplicated, so the domZ of the whole input is the
+        number of input sequences reported in all the tables. Every domain
+        is reported, so each table's domZ is the number of sequences in
+        it."""
+        target_weight = self._target_weight or (lambda name: 1)
+        table_targets = [set([line.split(None, 1)[0] for line in lines]) \
+                         for lines in table_lines]
+        domZ = sum([target_weight(target) for targets in table_targets \
+                    for target in targets])
+        cutoff = float(self._domain_evalue)
+        kept = []
+        for lines, targets in zip(table_lines, table_targets):
+            scale = float(domZ)/len(targets) if targets else 1
+            for line in lines:
+                spans = [m.span() for m in re.finditer(r'\S+', line)]
+                c_evalue, i_evalue = [float(line[start:end])*scale \
+                                      for start, end in spans[11:13]]
+                if i_evalue <= cutoff:
+                    # Replace the E-values, right aligned as hmmsearch
+                    # writes them
+                    for (start, end), previous_end, evalue in \
+                        [(spans[12], spans[11][1], i_evalue),
+                         (spans[11], spans[10][1], c_evalue)]:
+                        line = line[:previous_end+1] + \
+                            ('%.2g' % evalue).rjust(end-previous_end-1) + \
+                            line[end:]
+                    kept.append(line)
+        return kept
+
+    def _individual_hmm_command(self, hmm, output_file, num_cpus,
+                                input_path='-'):
+        return "hmmsearch %s --cpu %s -o /dev/null --noali --domtblout %s %s %s" % (self._search_args(),
                                                                          num_cpus,
                                                                          output_file,
-                                                                         hmm)
+                                                                         hmm,
+                                                                         input_path)
 
 class NhmmerSearcher(HmmSearcher):
     r"""Runs nhmmer given one or many HMMs in a scalable and fast way"""
 
-    def _individual_hmm_command(self, hmm, output_file, num_cpus):
-        return "nhmmer %s --cpu %s -o /dev/null --noali --tblout %s %s -" % (self._extra_args,
+    def _import_rows(self, rows):
+        return HMMSearchResult.import_from_nhmmer_rows(rows)
+
+    def _individual_hmm_command(self, hmm, output_file, num_cpus,
+                                input_path='-'):
+        return "nhmmer %s --cpu %s -o /dev/null --noali --tblout %s %s %s" % (self._extra_args,
                                                                    num_cpus,
                                                                    output_file,
-                                                                   hmm)
+                                                                   hmm,
+                                                                   input_path)
+
+class HmmDatabaseSearcher(HmmSearcher):
+    r"""Searches with many HMMs at once by concatenating them into a single
+    profile database, so that one hmmsearch (or hmmscan) process is run
+    rather than one per HMM. The combined output table is split back into
+    one table per HMM by the HMM name column, so each HMM must have a
+    distinct name (see names_are_unique).
+
+    The database of each set of HMMs is only built (and pressed for hmmscan)
+    once per process, and is reused by every search with the same HMMs, e.g.
+    of each sample in a run."""
+
+    # Directories containing database.hmm, keyed on the path, size and
+    # modification time of each HMM it was made from
+    _databases = {}
+
+    def __init__(self, num_cpus, extra_args='', scan=False,
+                 domain_evalue=None, target_weight=None):
+        r"""New
+
+        Parameters
+        ----------
+        num_cpus: Integer
+            The total number of CPUs to use when searching
+        extra_args: String
+            Extra arguments for hmmsearch or hmmscan. --cpus is already
+            defined, so do not specify it in this argument
+        scan: Boolean
+            If True, search each sequence against the pressed database with
+            hmmscan, which is faster than hmmsearch when there are fewer
+            sequences than HMMs. Otherwise search the sequences with each
+            HMM using hmmsearch.
+        domain_evalue: String
+            As per HmmSearcher
+        target_weight: function
+            As per HmmSearcher"""
+        HmmSearcher.__init__(self, num_cpus, extra_args,
+                             domain_evalue=domain_evalue,
+                             target_weight=target_weight)
+        self._scan = scan
+
+    @staticmethod
+    def hmm_names(hmm):
+        r"""Return a list of the names of the profiles in an HMM file"""
+        names = []
+        with open(hmm) as f:
+            for line in f:
+                if line.startswith('NAME '):
+                    names.append(line.split()[1])
+        return names
+
+    @staticmethod
+    def names_are_unique(hmms):
+        r"""Return True if no two profiles in the HMM files share a name, so
+        that results can be split by name"""
+        names = list(itertools.chain(*[HmmDatabaseSearcher.hmm_names(hmm) \
+                                       for hmm in hmms]))
+        return len(names) == len(set(names))
+
+    def _database(self, hmms):
+        r"""Return the path to a database of the HMMs, pressed if scanning"""
+        key = tuple([(os.path.realpath(hmm), os.path.getsize(hmm),
+                      os.path.getmtime(hmm)) for hmm in hmms])
+        directory = self._databases.get(key)
+        if directory is None:
+            directory = tempfile.mkdtemp(prefix='graftm_hmm_database')
+            atexit.register(shutil.rmtree, directory, True)
+            with open(os.path.join(directory, 'database.hmm'), 'w') as out:
+                for hmm in hmms:
+                    with open(hmm) as f:
+                        shutil.copyfileobj(f, out)
+            self._databases[key] = directory
+        database = os.path.join(directory, 'database.hmm')
+        if self._scan and not os.path.exists(database+'.h3m'):
+            extern.run("hmmpress '%s'" % database)
+        return database
+
+    def hmmsearch(self, input_pipe, hmms, output_files):
+        r"""As per HmmSearcher.hmmsearch"""
+        if len(hmms) != len(output_files):
+            raise Exception("Programming error: number of supplied HMMs differs from the number of supplied output files")
+        name_to_output_file = {}
+        for hmm, output_file in zip(hmms, output_files):
+            for name in self.hmm_names(hmm):
+                name_to_output_file[name] = output_file
+
+        database = self._database(hmms)
+        directory = tempfile.mkdtemp(prefix='graftm_hmm_database_search')
+        try:
+            # The combined table is split as it is written
+            table = os.path.join(directory, 'table')
+            reader = _FifoReader(table, partial(
+                self._split_table, name_to_output_file=name_to_output_file,
+                output_files=output_files))
+            if self._scan:
+                cmd = "%s | hmmscan %s --cpu %s -o /dev/null --noali --domtblout '%s' '%s' -" % \
+                    (input_pipe, self._search_args(), self._num_cpus, table,
+                     database)
+            else:
+                # With more than one query HMM, hmmsearch needs to read the
+                # sequences once per HMM, so they cannot be read from a pipe
+                sequences = os.path.join(directory, 'sequences.fa')
+                cmd = "%s > '%s' && hmmsearch %s --cpu %s -o /dev/null --noali --domtblout '%s' '%s' '%s'" % \
+                    (input_pipe, sequences, self._search_args(), self._num_cpus,
+                     table, database, sequences)
+            logging.debug("Running command: %s" % cmd)
+            try:
+                extern.run(cmd)
+            except extern.ExternCalledProcessError, e:
+                if 'is empty or misformatted' in e.stderr:
+                    raise NoInputSequencesException(cmd)
+                else:
+                    raise e
+            finally:
+                reader.finish()
+            rows = reader.result()
+        finally:
+            shutil.rmtree(directory)
+        if self._recalculates_domain_evalues():
+            for output_file in output_files:
+                rows[output_file] = self._write_table(
+                    output_file, [self._read_table(output_file)])
+        return [HMMSearchResult.import_from_hmmsearch_rows(rows[f]) \
+                for f in output_files]
+
+    def _split_table(self, table, name_to_output_file, output_files):
+        r"""Write the rows of the combined domtblout table to the output file
+        of the HMM they hit, in hmmsearch column order, and its header and
+        footer comments to every output file. Return a dict of output file
+        to the list of fields of each row written to it."""
+        outputs = {}
+        rows = dict([(output_file, []) for output_file in output_files])
+        try:
+            for output_file in output_files:
+                outputs[output_file] = open(output_file, 'w')
+            with open(table) as f:
+                for line in iter(f.readline, ''):
+                    if line.startswith('#'):
+                        for output in outputs.values():
+                            output.write(line)
+                        continue
+                    fields = line.split(None, 22)
+                    if self._scan:
+                        # hmmscan swaps the target (HMM) and query (sequence)
+                        # columns relative to hmmsearch
+                        fields = fields[3:6]+fields[0:3]+fields[6:]
+                    fields[-1] = fields[-1].rstrip('\n')
+                    if self._scan:
+                        line = ' '.join(fields)+'\n'
+                    output_file = name_to_output_file[fields[3]]
+                    outputs[output_file].write(line)
+                    rows[output_file].append(fields)
+        finally:
+            for output in outputs.values():
+                output.close()
+        return rows
@@ -0,0 +1,193 @@
+import os
+import logging
+from StringIO import StringIO
+
+from graftm.sequence_io import SequenceIO
+
+class InputProfile:
+    '''Properties of a read file, estimated from a sample taken from the
+    start of the file. Attributes:
+
+    sequence_type: str
+        UnpackRawReads.PROTEIN_SEQUENCE_TYPE or NUCLEOTIDE_SEQUENCE_TYPE, or
+        None if the sample contained no reads
+    num_sampled_reads: int
+        number of reads in the sample
+    mean_read_length: float
+        mean length of the sampled reads, or None if there were none
+    read_length_histogram: dict of int to int
+        number of sampled reads in each length bin, keyed by the shortest
+        length in the bin. Bins are LENGTH_BIN_SIZE wide.
+    compression_ratio: float
+        uncompressed size divided by compressed size, or None if unknown
+    estimated_read_count: int
+        approximate number of reads in the file, or None if unknown. This is
+        exact if the whole file was sampled.
+    complete: bool
+        True if the whole file was sampled
+    '''
+    LENGTH_BIN_SIZE = 50
+
+    def __init__(self, sequence_type, num_sampled_reads, mean_read_length,
+                 read_length_histogram, compression_ratio,
+                 estimated_read_count, complete):
+        self.sequence_type = sequence_type
+        self.num_sampled_reads = num_sampled_reads
+        self.mean_read_length = mean_read_length
+        self.read_length_histogram = read_length_histogram
+        self.compression_ratio = compression_ratio
+        self.estimated_read_count = estimated_read_count
+        self.complete = complete
+
+    def estimated_base_count(self):
+        '''Return the approximate number of bases or amino acids in the file,
+        or None if unknown'''
+        if self.estimated_read_count is None or self.mean_read_length is None:
+            return None
+        return int(self.estimated_read_count * self.mean_read_length)
+
+class InputProfiler:
+    '''Profile read files from a sample of each, remembering the profile of
+    each file so that it is only sampled once per process.'''
+    # Number of uncompressed bytes sampled from the start of each file
+    SAMPLE_SIZE = 1024*1024
+    # Maximum number of reads used to guess the sequence type
+    _NUM_TYPE_GUESS_READS = 100
+
+    # Profiles keyed on (path, size, modification time)
+    _profiles = {}
+    # Number of ORFs per read keyed on (path, size, modification time,
+    # minimum ORF length, restricted read length)
+    _orfs_per_read = {}
+
+    def _key(self, read_decoder):
+        path = read_decoder.read_file
+        stat = os.stat(path)
+        return (os.path.realpath(path), stat.st_size, stat.st_mtime), stat
+
+    def _sample(self, read_decoder, stat):
+        '''Return the sample of the read file as a tuple (text,
+        compressed_bytes, complete), see ReadDecoder.sample'''
+        text, compressed_bytes = read_decoder.sample(self.SAMPLE_SIZE)
+        if read_decoder.compression is None:
+            complete = len(text) < self.SAMPLE_SIZE
+        else:
+            complete = compressed_bytes == stat.st_size
+        return text, compressed_bytes, complete
+
+    def profile(self, read_decoder, guess_sequence_type):
+        '''Return the InputProfile of a read file.
+
+        Parameters
+        ----------
+        read_decoder: ReadDecoder
+            decoder of the read file
+        guess_sequence_type: function
+            function which takes a sequence str and returns its type, e.g.
+            UnpackRawReads._guess_sequence_type_from_string
+
+        Returns
+        -------
+        InputProfile
+        '''
+        path = read_decoder.read_file
+        key, stat = self._key(read_decoder)
+        try:
+            return self._profiles[key]
+        except KeyError:
+            pass
+
+        text, compressed_bytes, complete = self._sample(read_decoder, stat)
+
+        lengths = []
+        types = []
+        # Reads whose type could not be guessed, e.g. because they contain
+        # unexpected characters, do not vote
+        num_unguessed = 0
+        first_exception = None
+        for _, seq, _ in SequenceIO().each(StringIO(text)):
+            if len(types)+num_unguessed < self._NUM_TYPE_GUESS_READS and seq:
+                try:
+                    types.append(guess_sequence_type(seq))
+                except Exception, e:
+                    num_unguessed += 1
+                    if first_exception is None:
+                        first_exception = e
+            lengths.append(len(seq))
+        if num_unguessed:
+            if not types:
+                raise first_exception
+            logging.warn("Could not guess the sequence type of %i of the "
+                         "first %i reads of %s, ignoring them" % \
+                         (num_unguessed, num_unguessed+len(types), path))
+        if not complete and lengths:
+            # The last read is probably truncated
+            lengths.pop()
+        num_reads = len(lengths)
+
+        histogram = {}
+        for length in lengths:
+            length_bin = length - length % InputProfile.LENGTH_BIN_SIZE
+            histogram[length_bin] = histogram.get(length_bin, 0)+1
+        mean_read_length = float(sum(lengths)) / num_reads if lengths else None
+
+        if compressed_bytes:
+            compression_ratio = float(len(text)) / compressed_bytes
+        else:
+            compression_ratio = None
+        if complete:
+            estimated_read_count = num_reads
+        elif compression_ratio is None or num_reads == 0:
+            estimated_read_count = None
+        else:
+            estimated_read_count = int(
+                stat.st_size * compression_ratio / len(text) * num_reads)
+
+        # The most common type among the first reads, with ties going to the
+        # type of the first read whose type was guessed
+        sequence_type = max(types, key=types.count) if types else None
+
+        profile = InputProfile(sequence_type, num_reads, mean_read_length,
+                               histogram, compression_ratio,
+                               estimated_read_count, complete)
+        logging.debug("Profiled %s: type %s, about %s reads, compression "
+                      "ratio %s" % (path, sequence_type,
+                                    estimated_read_count, compression_ratio))
+        self._profiles[key] = profile
+        return profile
+
+    def orfs_per_read(self, read_decoder, orf_caller):
+        '''Return the mean number of ORFs called on each read of a sample
+        of a nucleotide read file, or None if the sample contained no reads.
+
+        Parameters
+        ----------
+        read_decoder: ReadDecoder
+            decoder of the read file
+        orf_caller: OrfCaller
+            caller of the ORFs, with the same options as the ORF caller of
+            the search, e.g. OrfM
+        '''
+        key, stat = self._key(read_decoder)
+        key += (orf_caller.min_orf_length, orf_caller.restrict_read_length)
+        try:
+            return self._orfs_per_read[key]
+        except KeyError:
+            pass
+
+        text, _, complete = self._sample(read_decoder, stat)
+        records = ['%s\n%s' % (name, seq) for name, seq, _ in \
+                   SequenceIO().each(StringIO(text))]
+        if not complete and records:
+            # The last read is probably truncated
+            records.pop()
+        if records:
+            # Each ORF is written as two lines
+            orfs_per_read = float(orf_caller.orfs(records).count('\n') / 2) / \
+                len(records)
+        else:
+            orfs_per_read = None
+        logging.debug("Estimated %s ORFs per read of %s" % \
+                      (orfs_per_read, read_decoder.read_file))
+        self._orfs_per_read[key] = orfs_per_read
+        return orfs_per_read
@@ -0,0 +1,423 @@
+#!/usr/bin/env python
+'''K-mer prefilters for sequences which are to be searched with HMMs.
+
+Most ORFs called from a metagenome cannot hit the HMMs of a single gene
+package, and most reads cannot hit a 16S HMM, yet each is scored by hmmsearch
+or nhmmer. A prefilter is an index of the k-mers of a package's sequences,
+and sequences which share none of these k-mers are dropped before they are
+searched.
+
+KmerPrefilter indexes protein sequences. K-mers are taken over a reduced
+alphabet, in which similar amino acids are the same letter, and over a spaced
+seed, in which only some positions of each window must match, so that
+diverged homologs still share k-mers.
+
+MinimizerPrefilter indexes nucleotide sequences. Only the minimizers of the
+sequences are indexed, i.e. the k-mer with the smallest hash in each window
+of consecutive k-mers, which keeps the index small. Sequences are kept if any
+of their k-mers is one of these minimizers, so a sequence sharing a whole
+window with an indexed sequence is always kept. K-mers are canonical, so
+reads from either strand are kept.
+
+The E-values of prefiltered searches are those of searching the whole input,
+since hmmsearch and nhmmer are given its estimated size with -Z: the number
+of ORFs when searching ORFs, else of reads for hmmsearch or bases for nhmmer.
+Sequences which would have been significant may still be dropped by the
+prefilter, and then also change the number of significant sequences that
+hmmsearch calculates domain E-values from (domZ).
+
+Each index is a sorted array of the distinct k-mers or minimizers, stored in
+a file with a header line giving its parameters. When run as a script, FASTA
+records read from STDIN are written to STDOUT if they share a k-mer with the
+index.
+'''
+
+import os
+import sys
+import argparse
+from signal import signal, SIGPIPE, SIG_DFL
+
+import numpy as np
+
+# The 10 letter alphabet of Murphy et al. 2000, Protein Engineering 13:149
+DEFAULT_ALPHABET = ['LVIM', 'C', 'A', 'G', 'ST', 'P', 'FYW', 'EDNQ', 'KR', 'H']
+# Positions of each window which must match, with weight 9 over a span of 12.
+# See test/benchmark_kmer_prefilter.py for the recall of other seeds.
+DEFAULT_SEED = '110110110111'
+# Length of nucleotide k-mers, and number of consecutive k-mers in each
+# window from which a minimizer is chosen. See
+# test/benchmark_minimizer_prefilter.py for the recall of other values.
+DEFAULT_K = 16
+DEFAULT_WINDOW = 8
+
+_FILE_FORMAT_VERSION = 1
+# Code of residues not in the alphabet, e.g. X, *, or the separator between
+# sequences. Windows containing these are ignored.
+_INVALID = 255
+# Number of bytes read from the input at a time when filtering
+_BLOCK_SIZE = 4*1024*1024
+# Number of buckets k-mers are hashed into when filtering, a prime. Most
+# k-mers which are not in the index fall into an empty bucket, so only k-mers
+# in full buckets need to be searched for.
+_NUM_BUCKETS = 16777213
+
+def command_line(index_path, statistics_path=None):
+    '''Return a string which, when run by bash, writes the FASTA records of
+    STDIN which pass the prefilter at index_path to STDOUT, optionally
+    writing the number of records read and passed to statistics_path'''
+    script = os.path.splitext(os.path.abspath(__file__))[0]+'.py'
+    cmd = "'%s' '%s' '%s'" % (sys.executable, script, index_path)
+    if statistics_path:
+        cmd += " --statistics '%s'" % statistics_path
+    return cmd
+
+def read_statistics(statistics_path):
+    '''Return (number of records read, number passed) from a statistics file
+    written by the script'''
+    with open(statistics_path) as f:
+        num_read, num_passed = f.read().split()
+    return int(num_read), int(num_passed)
+
+def read(path):
+    '''Return the KmerPrefilter or MinimizerPrefilter in the file at path'''
+    with open(path, 'rb') as f:
+        fields = f.readline().rstrip('\n').split('\t')
+        data = f.read()
+    for cls in (KmerPrefilter, MinimizerPrefilter):
+        if fields[0] == cls._FILE_FORMAT:
+            if fields[1] != str(_FILE_FORMAT_VERSION):
+                break
+            prefilter = cls._from_header_fields(fields[2:])
+            prefilter._set_index(np.frombuffer(data, dtype=prefilter._dtype))
+            return prefilter
+    raise Exception("Unexpected k-mer prefilter format in %s" % path)
+
+class _Prefilter:
+    '''Index of k-mers, each identified by an integer of type self._dtype,
+    of which there are self._num_kmers. Subclasses define _kmers and add.'''
+
+    def _set_index(self, kmers):
+        if kmers is None:
+            kmers = np.zeros(0, dtype=self._dtype)
+        self._index = kmers
+        self._buckets = None
+
+    def _add_kmers(self, kmers):
+        self._set_index(np.union1d(self._index, kmers.astype(self._dtype)))
+
+    def _bucket(self, kmers):
+        # The divisor has the same type as the k-mers, since numpy converts
+        # uint64 to float when combined with a signed integer
+        return kmers % self._dtype(_NUM_BUCKETS)
+
+    def fraction_filled(self):
+        '''Return the fraction of possible k-mers which are in the index, which
+        is about the chance that a k-mer of an unrelated sequence matches'''
+        return float(len(self._index)) / self._num_kmers
+
+    def matches(self, sequences):
+        '''Return a bool array which is True for each of the given list of str
+        sequences which shares a k-mer with the index'''
+        kmers, ends = self._kmers(sequences)
+        if len(self._index) == 0:
+            return np.zeros(len(sequences), dtype=bool)
+        kmers = kmers.astype(self._dtype)
+        if self._buckets is None:
+            self._buckets = np.zeros(_NUM_BUCKETS, dtype=bool)
+            self._buckets[self._bucket(self._index)] = True
+        hits = self._buckets[self._bucket(kmers)]
+        candidates = np.flatnonzero(hits)
+        candidate_kmers = kmers[candidates]
+        positions = np.minimum(np.searchsorted(self._index, candidate_kmers),
+                               len(self._index)-1)
+        hits[candidates] = self._index[positions] == candidate_kmers
+        cumulative_hits = np.concatenate(([0], np.cumsum(hits)))
+        counts = cumulative_hits[ends] - \
+            cumulative_hits[np.concatenate(([0], ends[:-1]))]
+        return counts > 0
+
+    def _matching_records(self, records):
+        '''Return the records which share a k-mer with the index, given records
+        as str without their leading '>' or trailing newline'''
+        sequences = [r.partition('\n')[2].replace('\n', '') for r in records]
+        return [r for r, match in zip(records, self.matches(sequences)) \
+                if match]
+
+    def filter(self, input_io, output_io):
+        '''Write the FASTA records of input_io which share a k-mer with the
+        index to output_io, returning the number of records read and the
+        number written'''
+        num_read = 0
+        num_passed = 0
+        leftover = ''
+        while True:
+            data = input_io.read(_BLOCK_SIZE)
+            if not data: break
+            records = (leftover+data).split('\n>')
+            leftover = records.pop()
+            if records:
+                if records[0][:1] == '>':
+                    records[0] = records[0][1:]
+                matching = self._matching_records(records)
+                num_read += len(records)
+                num_passed += len(matching)
+                if matching:
+                    output_io.write('>'+'\n>'.join(matching)+'\n')
+        leftover = leftover.rstrip('\n')
+        if leftover:
+            if leftover[:1] == '>':
+                leftover = leftover[1:]
+            num_read += 1
+            for record in self._matching_records([leftover]):
+                num_passed += 1
+                output_io.write('>%s\n' % record)
+        return num_read, num_passed
+
+    def write(self, path):
+        with open(path, 'wb') as f:
+            f.write('\t'.join([self._FILE_FORMAT, str(_FILE_FORMAT_VERSION)]+
+                              self._header_fields())+'\n')
+            f.write(self._index.tostring())
+
+class KmerPrefilter(_Prefilter):
+    _FILE_FORMAT = 'graftm_kmer_prefilter'
+
+    def __init__(self, seed=DEFAULT_SEED, alphabet=DEFAULT_ALPHABET,
+                 kmers=None):
+        '''
+        Parameters
+        ----------
+        seed: str
+            string of 1s and 0s, with 1 at the positions of each window
+            which are part of its k-mer
+        alphabet: list of str
+            groups of amino acids which are treated as the same letter
+        kmers: numpy array
+            sorted distinct k-mer codes of the index, or None for an empty
+            index
+        '''
+        if not seed or set(seed) - set('01') or seed[0] != '1' or \
+            seed[-1] != '1':
+            raise Exception("Invalid k-mer seed '%s'" % seed)
+        self.seed = seed
+        self.alphabet = alphabet
+        self._offsets = np.array([i for i, c in enumerate(seed) if c == '1'],
+                                 dtype=np.int64)
+        self._num_kmers = len(alphabet) ** len(self._offsets)
+
+        self._encode = np.empty(256, dtype=np.uint8)
+        self._encode.fill(_INVALID)
+        for i, letters in enumerate(alphabet):
+            for letter in letters:
+                self._encode[ord(letter.upper())] = i
+                self._encode[ord(letter.lower())] = i
+
+        if self._num_kmers <= 2**32:
+            self._dtype = np.uint32
+        else:
+            self._dtype = np.uint64
+        self._set_index(kmers)
+
+    def _header_fields(self):
+        return [self.seed, ','.join(self.alphabet)]
+
+    @staticmethod
+    def _from_header_fields(fields):
+        return KmerPrefilter(fields[0], fields[1].split(','))
+
+    def _kmers(self, sequences):
+        '''Return (kmers, ends), where kmers is an array of the k-mer codes of
+        each valid window of the given str sequences, and ends[i] is the
+        index into kmers after the last k-mer of sequence i'''
+        # Sequences are separated by an invalid residue so that no window
+        # spans two sequences
+        residues = self._encode[np.frombuffer('*'.join(sequences)+'*',
+                                              dtype=np.uint8)]
+        num_windows = max(0, len(residues) - len(self.seed) + 1)
+        kmers = np.zeros(num_windows, dtype=np.int64)
+        valid = np.ones(num_windows, dtype=bool)
+        base = 1
+        for offset in self._offsets:
+            letters = residues[offset:offset+num_windows]
+            valid &= letters != _INVALID
+            kmers += letters.astype(np.int64) * base
+            base *= len(self.alphabet)
+
+        # Count the valid windows starting within each sequence
+        starts = np.cumsum([0]+[len(s)+1 for s in sequences])
+        cumulative_valid = np.concatenate(([0], np.cumsum(valid)))
+        ends = cumulative_valid[np.minimum(starts[1:], num_windows)]
+        return kmers[valid], ends
+
+    def add(self, sequences):
+        '''Add the k-mers of the given list of str sequences to the index'''
+        kmers, _ = self._kmers(sequences)
+        self._add_kmers(kmers)
+
+    @staticmethod
+    def build(sequences, seed=DEFAULT_SEED, alphabet=DEFAULT_ALPHABET,
+              batch_size=10000):
+        '''Return a new KmerPrefilter of the given iterable of str protein
+        sequences'''
+        prefilter = KmerPrefilter(seed, alphabet)
+        _add_in_batches(prefilter, sequences, batch_size)
+        return prefilter
+
+class MinimizerPrefilter(_Prefilter):
+    _FILE_FORMAT = 'graftm_minimizer_prefilter'
+    # Odd multiplier by which k-mers are hashed. Multiplication by an odd
+    # number modulo 2^64 gives each k-mer a distinct hash.
+    _HASH_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+    _MISSING = np.uint64(np.iinfo(np.uint64).max)
+
+    def __init__(self, k=DEFAULT_K, window=DEFAULT_WINDOW, kmers=None):
+        '''
+        Parameters
+        ----------
+        k: int
+            length of k-mers, at most 31
+        window: int
+            number of consecutive k-mers from which each minimizer is
+            chosen, at most k
+        kmers: numpy array
+            sorted distinct hashes of the minimizers of the index, or None
+            for an empty index
+        '''
+        if not 0 < k <= 31 or not 0 < window <= k:
+            raise Exception("Invalid minimizer parameters k=%s window=%s" % \
+                            (k, window))
+        self.k = k
+        self.window = window
+        self._num_kmers = 4 ** k
+        self._dtype = np.uint64
+
+        self._encode = np.empty(256, dtype=np.uint8)
+        self._encode.fill(_INVALID)
+        for i, letters in enumerate(['A', 'C', 'G', 'TU']):
+            for letter in letters:
+                self._encode[ord(letter)] = i
+                self._encode[ord(letter.lower())] = i
+        self._set_index(kmers)
+
+    def _header_fields(self):
+        return [str(self.k), str(self.window)]
+
+    @staticmethod
+    def _from_header_fields(fields):
+        return MinimizerPrefilter(int(fields[0]), int(fields[1]))
+
+    def _hashes(self, sequences):
+        '''Return (hashes, starts), where hashes is an array of the hash of the
+        canonical k-mer starting at each position of the concatenated
+        sequences, or _MISSING for invalid k-mers, and starts[i] is the
+        position of the start of sequence i'''
+        # Sequences are separated by an invalid base so that no k-mer spans
+        # two sequences
+        bases = self._encode[np.frombuffer('N'.join(sequences)+'N',
+                                           dtype=np.uint8)]
+        num_kmers = max(0, len(bases) - self.k + 1)
+        invalid = bases == _INVALID
+        codes = np.where(invalid, 0, bases).astype(np.uint64)
+        forward = self._kmer_codes(codes, self.k, {}, False)[:num_kmers]
+        reverse = self._kmer_codes(np.uint64(3) - codes, self.k, {},
+                                   True)[:num_kmers]
+        hashes = np.minimum(forward, reverse) * self._HASH_MULTIPLIER
+        cumulative_invalid = np.concatenate(([0], np.cumsum(invalid)))
+        hashes[cumulative_invalid[self.k:] != cumulative_invalid[:num_kmers]] = \
+            self._MISSING
+        starts = np.cumsum([0]+[len(s)+1 for s in sequences])
+        return hashes, starts
+
+    def _kmer_codes(self, codes, length, cache, reverse):
+        '''Return an array of the 2-bit codes of the k-mers of the given length
+        starting at each position of codes, with the first base in the most
+        significant bits, or the least if reverse is True. K-mers are made by
+        joining two shorter k-mers, so that only about log2(length) passes
+        over the codes are made.'''
+        if length == 1:
+            return codes
+        if length not in cache:
+            half = length / 2
+            left = self._kmer_codes(codes, half, cache, reverse)
+            right = self._kmer_codes(codes, length-half, cache, reverse)
+            num_kmers = max(0, len(codes) - length + 1)
+            if reverse:
+                cache[length] = (right[half:half+num_kmers] << \
+                                 np.uint64(2*half)) | left[:num_kmers]
+            else:
+                cache[length] = (left[:num_kmers] << \
+                                 np.uint64(2*(length-half))) | \
+                                 right[half:half+num_kmers]
+        return cache[length]
+
+    def _kmers(self, sequences):
+        '''Return (kmers, ends), where kmers is an array of the hashes of each
+        valid k-mer of the given str sequences, and ends[i] is the index into
+        kmers after the last k-mer of sequence i'''
+        hashes, starts = self._hashes(sequences)
+        valid = hashes != self._MISSING
+        cumulative_valid = np.concatenate(([0], np.cumsum(valid)))
+        ends = cumulative_valid[np.minimum(starts[1:], len(hashes))]
+        return hashes[valid], ends
+
+    def add(self, sequences):
+        '''Add the minimizers of the given list of str sequences to the
+        index'''
+        hashes, _ = self._hashes(sequences)
+        num_windows = len(hashes) - self.window + 1
+        if num_windows <= 0:
+            return
+        minimizers = hashes[:num_windows].copy()
+        for i in xrange(1, self.window):
+            np.minimum(minimizers, hashes[i:i+num_windows], minimizers)
+        # Windows which span two sequences may give an extra minimizer, which
+        # is harmless
+        self._add_kmers(np.unique(minimizers[minimizers != self._MISSING]))
+
+    @staticmethod
+    def build(sequences, k=DEFAULT_K, window=DEFAULT_WINDOW,
+              batch_size=1000):
+        '''Return a new MinimizerPrefilter of the given iterable of str
+        nucleotide sequences'''
+        prefilter = MinimizerPrefilter(k, window)
+        _add_in_batches(prefilter, sequences, batch_size)
+        return prefilter
+
+def build(sequences, protein):
+    '''Return a KmerPrefilter of the given iterable of str sequences if they
+    are protein, otherwise a MinimizerPrefilter, with default parameters.
+    The sequences may contain alignment gaps.'''
+    sequences = (s.replace('-', '').replace('.', '') for s in sequences)
+    if protein:
+        return KmerPrefilter.build(sequences)
+    else:
+        return MinimizerPrefilter.build(sequences)
+
+def _add_in_batches(prefilter, sequences, batch_size):
+    batch = []
+    for sequence in sequences:
+        batch.append(sequence)
+        if len(batch) == batch_size:
+            prefilter.add(batch)
+            batch = []
+    if batch:
+        prefilter.add(batch)
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Write sequences from STDIN to STDOUT if they share a '
+        'k-mer with the prefilter index')
+    parser.add_argument('index', help='k-mer prefilter index')
+    parser.add_argument('--statistics',
+                        help='write the number of sequences read and the '
+                        'number written here')
+    args = parser.parse_args()
+
+    signal(SIGPIPE, SIG_DFL)
+    num_read, num_passed = read(args.index).filter(sys.stdin, sys.stdout)
+    if args.statistics:
+        with open(args.statistics, 'w') as f:
+            f.write('%i\t%i\n' % (num_read, num_passed))
+
+if __name__ == '__main__':
+    main()
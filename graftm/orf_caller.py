@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+'''Six-frame open reading frame caller, an alternative to OrfM.
+
+ORFs are the stretches of codons between stop codons, or between a stop codon
+and the end of the read, in each of the 3 forward and 3 reverse complement
+frames of a read, which are at least the minimum ORF length in nucleotides.
+They are called, named and ordered as OrfM does. Each ORF is named
+<read name>_<start position>_<frame number>_<ORF number>, followed by the
+rest of the read's header, where:
+
+start position
+    the 1-based position in the read of the first base of the ORF, or for
+    reverse frames of the base at the end of the ORF
+frame number
+    1 to 3 for forward frames, and 4 to 6 for the reverse frames whose codons
+    are those of frames 1 to 3 respectively
+ORF number
+    the ORFs of each read are numbered from 1 in order of where they end in
+    the read, forward frames first, except that ORFs which run to the end of
+    the read are numbered last, in order of frame number
+
+Codons with a base other than A, C, G or T are translated as X.
+
+Reads are translated a block at a time with NumPy. Each base is coded as a
+number from 0 to 4, every overlapping codon of the block is numbered from the
+codes at once, and the codon numbers are translated in both directions
+through lookup tables. When run as a script FASTA reads are read from a file
+or STDIN and their ORFs written to STDOUT, as OrfM does.
+'''
+
+import os
+import re
+import sys
+import argparse
+from signal import signal, SIGPIPE, SIG_DFL
+
+import numpy as np
+
+# Number of bytes read from the input at a time
+_BLOCK_SIZE = 4*1024*1024
+DEFAULT_MIN_ORF_LENGTH = 96
+
+_BASES = 'ACGT'
+# Code of each byte, 4 for anything which is not a base
+_CODES = np.empty(256, dtype=np.int16)
+_CODES.fill(4)
+for _i, _base in enumerate(_BASES):
+    _CODES[ord(_base)] = _i
+    _CODES[ord(_base.lower())] = _i
+
+def _translation_tables():
+    '''Return arrays of the amino acid of each codon number 25*a+5*b+c, where
+    a, b and c are the codes of its bases, read forwards and as its reverse
+    complement'''
+    genetic_code = 'FFLLSSSSYY**CC*WLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG'
+    order = 'TCAG'
+    forward = np.empty(125, dtype=np.uint8)
+    forward.fill(ord('X'))
+    reverse = forward.copy()
+    for a in range(4):
+        for b in range(4):
+            for c in range(4):
+                number = 25*a+5*b+c
+                codon = [order.index(_BASES[i]) for i in (a, b, c)]
+                forward[number] = ord(genetic_code[16*codon[0]+4*codon[1]+codon[2]])
+                complement = [order.index(_BASES[3-i]) for i in (c, b, a)]
+                reverse[number] = ord(genetic_code[16*complement[0]+4*complement[1]+complement[2]])
+    return forward, reverse
+_FORWARD, _REVERSE = _translation_tables()
+_STOP = ord('*')
+
+_FIRST_WHITESPACE_REGEX = re.compile(r'\s')
+
+def _runs(ok, read_numbers):
+    '''Return arrays of the first and last codon of each run of consecutive
+    codons of a frame which are all ok, given whether each codon is ok and
+    the read number of each codon'''
+    same_read = read_numbers[:-3] == read_numbers[3:]
+    continued = np.zeros(len(ok), dtype=bool)
+    continued[3:] = ok[:-3] & same_read
+    continues = np.zeros(len(ok), dtype=bool)
+    continues[:-3] = ok[3:] & same_read
+    firsts = np.flatnonzero(ok & ~continued)
+    lasts = np.flatnonzero(ok & ~continues)
+    # Runs do not overlap within codons of the same frame, whose positions
+    # are the same modulo 3, so the nth first of each frame pairs with the
+    # nth last
+    firsts = firsts[np.argsort(firsts % 3, kind='mergesort')]
+    lasts = lasts[np.argsort(lasts % 3, kind='mergesort')]
+    return firsts, lasts
+
+class OrfCaller:
+    def __init__(self, min_orf_length=DEFAULT_MIN_ORF_LENGTH,
+                 restrict_read_length=None):
+        '''
+        Parameters
+        ----------
+        min_orf_length: int
+            minimum number of nucleotides in an ORF
+        restrict_read_length: int or None
+            only call ORFs on this many bases at the start of each read
+        '''
+        self.min_orf_length = min_orf_length
+        self.restrict_read_length = restrict_read_length
+
+    def arguments(self):
+        '''Return the command line arguments of the script which call ORFs
+        as this OrfCaller does'''
+        args = ' --min_orf_length %i' % self.min_orf_length
+        if self.restrict_read_length:
+            args += ' --restrict_read_length %i' % self.restrict_read_length
+        return args
+
+    def command_line(self, input_path=None):
+        '''Return a string which, when run by bash, writes the ORFs of the
+        reads to STDOUT, as OrfM.command_line does
+
+        Parameters
+        ----------
+        input_path: str
+            path to the reads, or None for reads on STDIN
+        '''
+        script = os.path.splitext(os.path.abspath(__file__))[0]+'.py'
+        cmd = "'%s' '%s'%s" % (sys.executable, script, self.arguments())
+        if input_path:
+            cmd += ' %s' % input_path
+        return cmd
+
+    def orfs(self, records):
+        '''Return the ORFs of the given reads as a FASTA formatted str
+
+        Parameters
+        ----------
+        records: list of str
+            FASTA records without their leading '>' or trailing newline
+        '''
+        if not records:
+            return ''
+        headers = []
+        sequences = []
+        for record in records:
+            header, _, sequence = record.partition('\n')
+            headers.append(header)
+            sequence = sequence.replace('\n', '')
+            if self.restrict_read_length:
+                sequence = sequence[:self.restrict_read_length]
+            sequences.append(sequence)
+        lengths = np.array([len(s) for s in sequences], dtype=np.int64)
+        starts = np.cumsum(lengths)-lengths
+        codes = _CODES[np.frombuffer(''.join(sequences), dtype=np.uint8)]
+        read_numbers = np.repeat(np.arange(len(sequences)), lengths)
+
+        # The codon starting at each base, which is valid if it is within
+        # its read
+        codons = np.zeros(len(codes), dtype=np.int16)
+        codons[:-2] = 25*codes[:-2]+5*codes[1:-1]+codes[2:]
+        valid = np.arange(len(codes))+3 <= (starts+lengths)[read_numbers]
+        forward = _FORWARD[codons]
+        reverse = _REVERSE[codons]
+
+        orfs = []
+        for strand, amino_acids in ((0, forward), (1, reverse)):
+            firsts, lasts = _runs(valid & (amino_acids != _STOP), read_numbers)
+            long_enough = 3*((lasts-firsts)/3+1) >= self.min_orf_length
+            orfs.append((np.repeat(strand, np.count_nonzero(long_enough)),
+                         firsts[long_enough], lasts[long_enough]))
+        strands, firsts, lasts = [np.concatenate(x) for x in zip(*orfs)]
+        reads = read_numbers[firsts]
+        ends = lasts-starts[reads]+3
+        frames = (firsts-starts[reads]) % 3 + 1 + 3*strands
+        at_read_end = ends+3 > lengths[reads]
+        order = np.lexsort((strands, np.where(at_read_end, frames, ends),
+                            at_read_end, reads))
+        strands = strands[order]
+        firsts = firsts[order]
+        lasts = lasts[order]
+        reads = reads[order]
+        numbers = np.arange(len(reads)) - \
+            np.searchsorted(reads, reads, 'left') + 1
+        frames = frames[order]
+        positions = firsts-starts[reads]
+
+        forward = forward.tostring()
+        reverse = reverse.tostring()
+        output = []
+        for strand, first, last, read, number, position, frame in zip(
+                strands.tolist(), firsts.tolist(), lasts.tolist(),
+                reads.tolist(), numbers.tolist(), positions.tolist(),
+                frames.tolist()):
+            header = headers[read]
+            match = _FIRST_WHITESPACE_REGEX.search(header)
+            split = match.start() if match else len(header)
+            if strand == 0:
+                protein = forward[first:last+1:3]
+            else:
+                protein = reverse[first:last+1:3][::-1]
+            output.append('>%s_%i_%i_%i%s\n%s\n' % (
+                header[:split], position+1, frame, number, header[split:],
+                protein))
+        return ''.join(output)
+
+    def each_block(self, blocks):
+        '''Iterate over the ORFs of the reads in an iterable of FASTA
+        formatted str blocks, as FASTA formatted str blocks'''
+        leftover = ''
+        for data in blocks:
+            records = (leftover+data).split('\n>')
+            leftover = records.pop()
+            if records:
+                if records[0][:1] == '>':
+                    records[0] = records[0][1:]
+                yield self.orfs(records)
+        leftover = leftover.rstrip('\n')
+        if leftover:
+            if leftover[:1] == '>':
+                leftover = leftover[1:]
+            yield self.orfs([leftover])
+
+    def call(self, input_io, output_io):
+        '''Write the ORFs of the FASTA reads of input_io to output_io'''
+        for block in self.each_block(
+                iter(lambda: input_io.read(_BLOCK_SIZE), '')):
+            output_io.write(block)
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Write the open reading frames of FASTA nucleotide reads '
+        'to STDOUT, as OrfM does')
+    parser.add_argument('--min_orf_length', type=int,
+                        default=DEFAULT_MIN_ORF_LENGTH,
+                        help='minimum number of nucleotides in an ORF')
+    parser.add_argument('--restrict_read_length', type=int,
+                        help='only use this many bases at the start of each '
+                        'read')
+    parser.add_argument('read_file', nargs='?',
+                        help='FASTA reads (default: STDIN)')
+    args = parser.parse_args()
+
+    signal(SIGPIPE, SIG_DFL)
+    orf_caller = OrfCaller(args.min_orf_length, args.restrict_read_length)
+    input_io = open(args.read_file) if args.read_file else sys.stdin
+    orf_caller.call(input_io, sys.stdout)
+
+if __name__ == '__main__':
+    main()
@@ -24,7 +24,7 @@ class OrfM:
             orfm_arg_l = ''
         
         if self.restrict_read_length:
-            orfm_arg_l = " -l %d" % self.restrict_read_length
+            orfm_arg_l += " -l %d" % self.restrict_read_length
             
         cmd = 'orfm %s ' % orfm_arg_l
         if input_path:
@@ -0,0 +1,339 @@
+#!/usr/bin/env python
+'''Packed binary cache of decoded nucleotide reads.
+
+Converting a read file with ReadDecoder means decompressing and parsing it,
+which is repeated for every run over the same sample. A ReadCache keeps a
+packed copy of the decoded reads instead, so that later runs stream the
+reads from the cache. When run as a script the cached reads are written to
+STDOUT in FASTA format, as ReadDecoder does.
+
+Each cached read file is a directory of PackedReads, named by a hash of the
+content of the read file, containing:
+
+headers.txt
+    the header line of each read, without the '>'
+lengths.u32
+    the length of each read, as native uint32
+bases.2bit
+    the bases of all reads concatenated, 4 per byte, with A, C, G and T as
+    0 to 3 in the most significant bits first
+exceptions.pos, exceptions.chr
+    the position (native uint64) and character of every base which is not
+    one of ACGT, e.g. N. These are stored as A in bases.2bit.
+'''
+
+import os
+import sys
+import shutil
+import hashlib
+import logging
+import argparse
+import tempfile
+import itertools
+from signal import signal, SIGPIPE, SIG_DFL
+
+import numpy as np
+
+_BASES = 'ACGT'
+_ENCODE = np.zeros(256, dtype=np.uint8)
+_IS_BASE = np.zeros(256, dtype=bool)
+for _i, _base in enumerate(_BASES):
+    _ENCODE[ord(_base)] = _i
+    _IS_BASE[ord(_base)] = True
+_DECODE = np.frombuffer(_BASES, dtype=np.uint8)
+
+class PackedReads:
+    '''Reads stored in a ReadCache. These have the same interface as a
+    ReadCapture, so can be used in its place.'''
+    # Number of reads decoded at a time when streaming
+    _READS_PER_BLOCK = 65536
+
+    def __init__(self, path):
+        '''
+        Parameters
+        ----------
+        path: str
+            directory of the packed reads
+        '''
+        self.path = path
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def is_complete(self):
+        return os.path.isdir(self.path)
+
+    def command_line(self):
+        '''Return a string which, when run by bash, writes the reads in
+        FASTA format to STDOUT'''
+        script = os.path.splitext(os.path.abspath(__file__))[0]+'.py'
+        return "'%s' '%s' '%s'" % (sys.executable, script, self.path)
+
+    def _memmap(self, name, dtype):
+        path = self._file(name)
+        if os.path.getsize(path) == 0:
+            # Empty files cannot be memory-mapped
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode='r')
+
+    def _sequences(self, start, end, bases, exception_positions,
+                   exception_chars):
+        '''Return the str of bases from position start to end of the
+        concatenated reads'''
+        packed = np.asarray(bases[start/4:(end+3)/4])
+        codes = np.empty(len(packed)*4, dtype=np.uint8)
+        codes[0::4] = packed >> 6
+        codes[1::4] = (packed >> 4) & 3
+        codes[2::4] = (packed >> 2) & 3
+        codes[3::4] = packed & 3
+        sequence = _DECODE[codes][start%4:start%4+end-start]
+        first = np.searchsorted(exception_positions, start)
+        last = np.searchsorted(exception_positions, end)
+        if last > first:
+            sequence[exception_positions[first:last].astype(np.int64)-start] = \
+                np.frombuffer(exception_chars[first:last], dtype=np.uint8)
+        return sequence.tostring()
+
+    def each_block(self):
+        '''Iterate over the reads as FASTA formatted str blocks'''
+        lengths = self._memmap('lengths.u32', np.uint32)
+        bases = self._memmap('bases.2bit', np.uint8)
+        exception_positions = self._memmap('exceptions.pos', np.uint64)
+        with open(self._file('exceptions.chr'), 'rb') as f:
+            exception_chars = f.read()
+        offset = 0
+        with open(self._file('headers.txt')) as headers:
+            for first in xrange(0, len(lengths), self._READS_PER_BLOCK):
+                block_lengths = lengths[first:first+self._READS_PER_BLOCK]
+                ends = np.cumsum(block_lengths, dtype=np.uint64)
+                end = offset+int(ends[-1])
+                sequences = self._sequences(offset, end, bases,
+                                            exception_positions,
+                                            exception_chars)
+                ends = ends.tolist()
+                starts = [0]+ends[:-1]
+                # headers is last so that no more headers are read than
+                # there are reads in this block
+                yield ''.join(['>%s%s\n' % (header, sequences[s:e]) for \
+                               s, e, header in itertools.izip(
+                                   starts, ends, headers)])
+                offset = end
+
+    def write_to(self, output_io):
+        for block in self.each_block():
+            output_io.write(block)
+
+    def extract(self, read_names, output_path):
+        '''Write the reads with the given names to output_path in FASTA
+        format, in the order they were cached. Names which occur more than
+        once are written each time.
+
+        Parameters
+        ----------
+        read_names: iterable of str
+            names of the reads to extract
+        output_path: str
+            path to write the FASTA to
+
+        Returns
+        -------
+        The number of records written
+        '''
+        wanted = set(read_names)
+        indices = []
+        headers = []
+        with open(self._file('headers.txt')) as f:
+            for i, header in enumerate(f):
+                words = header.split(None, 1)
+                if (words[0] if words else '') in wanted:
+                    indices.append(i)
+                    headers.append(header)
+
+        lengths = self._memmap('lengths.u32', np.uint32)
+        bases = self._memmap('bases.2bit', np.uint8)
+        exception_positions = self._memmap('exceptions.pos', np.uint64)
+        with open(self._file('exceptions.chr'), 'rb') as f:
+            exception_chars = f.read()
+        # Offsets are found a block of reads at a time so that the offsets
+        # of all reads are never held at once
+        indices = np.array(indices, dtype=np.int64)
+        starts = np.zeros(len(indices), dtype=np.uint64)
+        offset = 0
+        for first in xrange(0, len(lengths), self._READS_PER_BLOCK):
+            block_lengths = lengths[first:first+self._READS_PER_BLOCK]
+            ends = np.cumsum(block_lengths, dtype=np.uint64)
+            # indices are in order, so those in this block are contiguous
+            low = np.searchsorted(indices, first)
+            high = np.searchsorted(indices, first+len(block_lengths))
+            if high > low:
+                block_indices = indices[low:high]-first
+                starts[low:high] = offset + ends[block_indices] - \
+                    block_lengths[block_indices]
+            offset += int(ends[-1])
+
+        with open(output_path, 'w') as out:
+            for header, i, start in itertools.izip(headers, indices, starts):
+                start = int(start)
+                out.write('>%s%s\n' % (header, self._sequences(
+                    start, start+int(lengths[i]), bases,
+                    exception_positions, exception_chars)))
+        return len(headers)
+
+class _PackedReadsWriter:
+    '''Writes PackedReads from FASTA blocks containing whole lines'''
+
+    def __init__(self, path):
+        self._path = path
+        self._headers = open(os.path.join(path, 'headers.txt'), 'w')
+        self._lengths = open(os.path.join(path, 'lengths.u32'), 'wb')
+        self._bases = open(os.path.join(path, 'bases.2bit'), 'wb')
+        self._exception_positions = open(os.path.join(path, 'exceptions.pos'), 'wb')
+        self._exception_chars = open(os.path.join(path, 'exceptions.chr'), 'wb')
+        self._offset = 0
+        # Codes left over from the previous block which do not fill a byte
+        self._leftover_codes = np.zeros(0, dtype=np.uint8)
+        # Text of the last record of the previous block, which may continue
+        self._leftover = ''
+
+    def write(self, block):
+        text = self._leftover+block
+        records = text.split('\n>')
+        self._leftover = records.pop()
+        self._write_records(records)
+
+    def _write_records(self, records):
+        if not records:
+            return
+        if records[0][:1] == '>':
+            records[0] = records[0][1:]
+        headers = []
+        sequences = []
+        for record in records:
+            header, _, sequence = record.partition('\n')
+            headers.append(header)
+            sequences.append(sequence.replace('\n', ''))
+        self._headers.write('\n'.join(headers)+'\n')
+        self._lengths.write(np.array([len(s) for s in sequences],
+                                     dtype=np.uint32).tostring())
+
+        residues = np.frombuffer(''.join(sequences), dtype=np.uint8)
+        exceptions = np.flatnonzero(~_IS_BASE[residues])
+        if len(exceptions) > 0:
+            self._exception_positions.write(
+                (exceptions+self._offset).astype(np.uint64).tostring())
+            self._exception_chars.write(residues[exceptions].tostring())
+        self._offset += len(residues)
+
+        codes = np.concatenate((self._leftover_codes, _ENCODE[residues]))
+        num_whole = len(codes) - len(codes) % 4
+        self._leftover_codes = codes[num_whole:]
+        self._bases.write(self._pack(codes[:num_whole]).tostring())
+
+    def _pack(self, codes):
+        return (codes[0::4] << 6) | (codes[1::4] << 4) | \
+            (codes[2::4] << 2) | codes[3::4]
+
+    def close(self):
+        if self._leftover:
+            self._write_records([self._leftover.rstrip('\n')+'\n'])
+        if len(self._leftover_codes) > 0:
+            codes = np.zeros(4, dtype=np.uint8)
+            codes[:len(self._leftover_codes)] = self._leftover_codes
+            self._bases.write(self._pack(codes).tostring())
+        for f in (self._headers, self._lengths, self._bases,
+                  self._exception_positions, self._exception_chars):
+            f.close()
+
+class ReadCache:
+    '''A directory of PackedReads, one for each read file which has been
+    cached. Cached reads are found by a hash of the content of the read file.
+    So that read files do not need to be hashed on every run, the hash of
+    each read file is remembered along with its size and modification time,
+    and the file is hashed again if either changes.'''
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _source_path(self, read_file):
+        return os.path.join(self.directory, 'sources',
+                            hashlib.sha1(os.path.realpath(read_file)).hexdigest())
+
+    def content_hash(self, read_file):
+        '''Return a hex digest of the content of read_file'''
+        stat = os.stat(read_file)
+        source = self._source_path(read_file)
+        if os.path.exists(source):
+            with open(source) as f:
+                size, mtime, digest = f.read().split()
+            if int(size) == stat.st_size and float(mtime) == stat.st_mtime:
+                return digest
+
+        logging.debug("Hashing the content of %s" % read_file)
+        sha1 = hashlib.sha1()
+        with open(read_file, 'rb') as f:
+            for data in iter(lambda: f.read(4*1024*1024), ''):
+                sha1.update(data)
+        digest = sha1.hexdigest()
+
+        self._atomic_write(source, '%i %r %s\n' % (stat.st_size, stat.st_mtime,
+                                                   digest))
+        return digest
+
+    def _make_directory(self, directory):
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # Made by a concurrent run
+                if not os.path.isdir(directory):
+                    raise
+
+    def _atomic_write(self, path, contents):
+        directory = os.path.dirname(path)
+        self._make_directory(directory)
+        f = tempfile.NamedTemporaryFile(dir=directory, delete=False)
+        f.write(contents)
+        f.close()
+        os.rename(f.name, path)
+
+    def packed_reads(self, read_file, interleaved=False):
+        '''Return the PackedReads of read_file, which may not be complete'''
+        name = self.content_hash(read_file)
+        if interleaved:
+            # Interleaved reads are decoded with suffixes added
+            name += '_interleaved'
+        return PackedReads(os.path.join(self.directory, name))
+
+    def build(self, packed_reads, read_decoder):
+        '''Cache the reads decoded by read_decoder as packed_reads. The reads
+        are written to a temporary directory which is renamed into place
+        once complete, so that incomplete caches are never used.'''
+        logging.info("Caching reads of %s in %s" % (read_decoder.read_file,
+                                                    packed_reads.path))
+        self._make_directory(self.directory)
+        partial = tempfile.mkdtemp(prefix='partial', dir=self.directory)
+        try:
+            writer = _PackedReadsWriter(partial)
+            for block in read_decoder.each_block():
+                writer.write(block)
+            writer.close()
+            os.rename(partial, packed_reads.path)
+        except OSError:
+            if not packed_reads.is_complete():
+                raise
+            # Cached by a concurrent run
+        finally:
+            if os.path.exists(partial):
+                shutil.rmtree(partial)
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Write cached reads to STDOUT in FASTA format')
+    parser.add_argument('packed_reads', help='directory of cached reads')
+    args = parser.parse_args()
+
+    signal(SIGPIPE, SIG_DFL)
+    PackedReads(args.packed_reads).write_to(sys.stdout)
+
+if __name__ == '__main__':
+    main()
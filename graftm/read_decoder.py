@@ -0,0 +1,622 @@
+#!/usr/bin/env python
+'''Native streaming decoder for sequence read files.
+
+ReadDecoder turns FASTA or FASTQ files, optionally gzip, bzip2, xz or zstd
+compressed, into a
+stream of FASTA formatted text. When run as a script the FASTA is written to
+STDOUT, which is how UnpackRawReads feeds hmmsearch, orfm and diamond through a
+single pipe instead of a zcat | awk | perl chain. Only the standard library is
+used so that the script can be run without graftm being importable.
+
+A ReadCapture can be attached so that the reads streamed to the search are
+also kept on disk, together with an index, so hit reads can be extracted later
+without decoding the input a second time.
+
+An OrfCaller can also be attached, so that the open reading frames of the
+reads are streamed instead of the reads, as the reads are decoded. The ORFs
+can be kept in a second ReadCapture, so that the ORFs of hit reads can be
+extracted rather than called again. The OrfCaller needs NumPy, so it is only
+imported by the script when ORFs are asked for.
+'''
+
+import os
+import re
+import sys
+import bz2
+import zlib
+import argparse
+import threading
+import subprocess
+import multiprocessing
+from collections import deque
+from Queue import Queue, Full
+from distutils.spawn import find_executable
+from signal import signal, SIGPIPE, SIG_DFL
+
+# Optional in-process decompressors, only used when no external decompressor
+# is available
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+class DecodingException(Exception): pass
+
+_FIRST_WHITESPACE_REGEX = re.compile(r'\s')
+_FASTA_HEADER_REGEX = re.compile(r'^>(\S*)', re.M)
+
+def _add_pair_suffix(header, header_number):
+    '''Add /1 or /2 to the end of the first word of the header (which does
+    not include the '>' or '@') unless it is already there. header_number is
+    the 1-based index of the read in the file.'''
+    suffix = '/1' if header_number % 2 == 1 else '/2'
+    match = _FIRST_WHITESPACE_REGEX.search(header)
+    if match:
+        name = header[:match.start()]
+        rest = header[match.start():]
+    else:
+        name = header
+        rest = ''
+    if name == '' or name.endswith(suffix):
+        return header
+    return name+suffix+rest
+
+def _convert_chunk(chunk, fastq, interleaved, num_previous_headers):
+    '''Convert a str of whole FASTA lines or whole FASTQ records to FASTA.
+    This is a module level function so that it can be run in a worker
+    process.
+
+    Parameters
+    ----------
+    chunk: str
+        text to convert, ending in a newline
+    fastq: bool
+        True if the chunk is FASTQ
+    interleaved: bool
+        add /1 and /2 suffixes to read names
+    num_previous_headers: int
+        number of reads in the file before this chunk
+
+    Returns
+    -------
+    FASTA formatted str
+    '''
+    if not fastq:
+        if not interleaved:
+            return chunk
+        lines = chunk.split('\n')
+        header_number = num_previous_headers
+        for i, line in enumerate(lines):
+            if line[:1] == '>':
+                header_number += 1
+                lines[i] = '>'+_add_pair_suffix(line[1:], header_number)
+        return '\n'.join(lines)
+
+    lines = chunk.split('\n')
+    lines.pop() # chunk ends in a newline
+    if len(lines) % 4 != 0:
+        raise DecodingException("Unexpected end of FASTQ input, the number "
+                                "of lines is not a multiple of 4")
+    headers = lines[0::4]
+    if headers[0][:1] != '@':
+        raise DecodingException("Unexpected FASTQ header line: %s" % headers[0])
+    if interleaved:
+        headers = ['@'+_add_pair_suffix(h[1:], i) for i, h in \
+                   enumerate(headers, num_previous_headers+1)]
+    # Interleave headers with sequences and convert all the '@' header
+    # markers in one go. Sequence lines cannot start with '@', so the
+    # replacement only touches headers. The entire header line is kept, as
+    # awk-based conversion did.
+    fasta_lines = [None]*(len(headers)*2)
+    fasta_lines[0::2] = headers
+    fasta_lines[1::2] = lines[1::4]
+    fasta_lines.append('')
+    return '>'+'\n'.join(fasta_lines)[1:].replace('\n@', '\n>')
+
+def _convert_chunk_star(args):
+    return _convert_chunk(*args)
+
+
+class ReadCapture:
+    '''Decoded reads kept while they are streamed to a search, and an index of
+    the byte offset where each record starts. The index is a tab separated
+    file of read name and offset, in file order, and is only moved into place
+    once all reads have been written, so its presence means the capture is
+    complete.'''
+
+    def __init__(self, index_path, fasta_path, copy_reads=True):
+        '''
+        Parameters
+        ----------
+        index_path: str
+            path to the index of read offsets
+        fasta_path: str
+            path to the FASTA file the offsets refer to
+        copy_reads: bool
+            True if the decoded reads should be written to fasta_path. False
+            when fasta_path is the input itself, i.e. uncompressed FASTA which
+            is passed through unchanged, so only the index is written.
+        '''
+        self.index_path = index_path
+        self.fasta_path = fasta_path
+        self.copy_reads = copy_reads
+
+    def is_complete(self):
+        return os.path.exists(self.index_path)
+
+    def extract(self, read_names, output_path):
+        '''Write the FASTA records with the given names to output_path, in the
+        order they were captured. Names which occur more than once in the
+        capture are written each time.
+
+        Parameters
+        ----------
+        read_names: iterable of str
+            names of the reads to extract
+        output_path: str
+            path to write the FASTA to
+
+        Returns
+        -------
+        The number of records written
+        '''
+        wanted = set(read_names)
+        spans = []
+        previous_name = None
+        previous_offset = None
+        with open(self.index_path) as index:
+            for line in index:
+                name, offset = line.rstrip('\n').split('\t')
+                offset = int(offset)
+                if previous_name in wanted:
+                    spans.append((previous_offset, offset))
+                previous_name = name
+                previous_offset = offset
+        if previous_name in wanted:
+            spans.append((previous_offset, os.path.getsize(self.fasta_path)))
+
+        with open(self.fasta_path, 'rb') as fasta:
+            with open(output_path, 'w') as out:
+                for start, end in spans:
+                    fasta.seek(start)
+                    out.write(fasta.read(end-start))
+        return len(spans)
+
+def _captured(blocks, capture):
+    '''Yield each of the FASTA blocks, also writing them to the capture,
+    which is complete once the last block has been yielded'''
+    writer = _CaptureWriter(capture)
+    for block in blocks:
+        writer.write(block)
+        yield block
+    writer.close()
+
+class _CaptureWriter:
+    '''Writes a ReadCapture from FASTA blocks. Files are written under
+    temporary names and renamed on close, the index last.'''
+
+    def __init__(self, capture):
+        self._capture = capture
+        self._offset = 0
+        self._index = open(capture.index_path+'.partial', 'w')
+        if capture.copy_reads:
+            self._fasta = open(capture.fasta_path+'.partial', 'wb')
+        else:
+            self._fasta = None
+
+    def write(self, block):
+        if self._fasta:
+            self._fasta.write(block)
+        offset = self._offset
+        self._index.write(''.join(
+            ["%s\t%i\n" % (m.group(1), offset+m.start()) \
+             for m in _FASTA_HEADER_REGEX.finditer(block)]))
+        self._offset += len(block)
+
+    def close(self):
+        if self._fasta:
+            self._fasta.close()
+            os.rename(self._capture.fasta_path+'.partial',
+                      self._capture.fasta_path)
+        self._index.close()
+        os.rename(self._capture.index_path+'.partial',
+                  self._capture.index_path)
+
+
+class ReadDecoder:
+    GZIP_COMPRESSION = 'gzip'
+    BZIP2_COMPRESSION = 'bzip2'
+    XZ_COMPRESSION = 'xz'
+    ZSTD_COMPRESSION = 'zstd'
+    COMPRESSIONS = [GZIP_COMPRESSION, BZIP2_COMPRESSION, XZ_COMPRESSION,
+                    ZSTD_COMPRESSION]
+
+    # Size of each chunk read from the file, and the number of decompressed
+    # chunks which can be waiting to be converted at any one time.
+    _BLOCK_SIZE = 4*1024*1024
+    _QUEUE_DEPTH = 4
+
+    def __init__(self, read_file, fastq=False, compression=None,
+                 interleaved=False, threads=1, capture=None, orf_caller=None,
+                 orf_capture=None):
+        '''New decoder of a read file.
+
+        Parameters
+        ----------
+        read_file: str
+            path to the reads
+        fastq: bool
+            True if the reads are FASTQ formatted, False for FASTA
+        compression: str or None
+            one of COMPRESSIONS, or None if the file is not compressed
+        interleaved: bool
+            If True, make sure read names end in /1 and /2 alternately
+        threads: int
+            Number of processes used to convert FASTQ chunks in parallel
+        capture: ReadCapture or None
+            Keep the decoded reads here when they are written out with
+            write_to(). An already complete capture is not written again.
+        orf_caller: OrfCaller or None
+            If not None, write_to() writes the ORFs of the reads found by
+            this, rather than the reads
+        orf_capture: ReadCapture or None
+            Keep the ORFs here when they are written out with write_to()
+        '''
+        self.read_file = read_file
+        self.fastq = fastq
+        self.compression = compression
+        self.interleaved = interleaved
+        self.threads = threads
+        self.capture = capture
+        self.orf_caller = orf_caller
+        self.orf_capture = orf_capture
+
+    def command_line(self):
+        '''Return a string which, when run by bash, writes the decoded reads
+        in FASTA format to STDOUT'''
+        script = os.path.splitext(os.path.abspath(__file__))[0]+'.py'
+        cmd = "'%s' '%s'" % (sys.executable, script)
+        if self.fastq:
+            cmd += ' --fastq'
+        if self.compression:
+            cmd += ' --compression %s' % self.compression
+        if self.interleaved:
+            cmd += ' --interleaved'
+        if self.threads > 1:
+            cmd += ' --threads %i' % self.threads
+        if self.capture:
+            cmd += " --capture_index '%s'" % self.capture.index_path
+            if self.capture.copy_reads:
+                cmd += " --capture_fasta '%s'" % self.capture.fasta_path
+        if self.orf_caller:
+            cmd += ' --orfs'+self.orf_caller.arguments()
+            if self.orf_capture:
+                cmd += " --orf_capture_index '%s' --orf_capture_fasta '%s'" % \
+                    (self.orf_capture.index_path, self.orf_capture.fasta_path)
+        cmd += " '%s'" % self.read_file
+        return cmd
+
+    def each_block(self):
+        '''Iterate over the reads as FASTA formatted str blocks. Each block
+        contains only whole lines, and ends in a newline.'''
+        if self.threads > 1 and (self.fastq or self.interleaved):
+            return self._each_block_in_parallel()
+        else:
+            return (_convert_chunk(*args) for args in self._each_chunk())
+
+    def write_to(self, output_io):
+        '''Write all reads in FASTA format to the given file handle, and to
+        the capture if there is one, or their ORFs if there is an
+        orf_caller'''
+        # Captures are finished before the output is closed, so that they
+        # are complete by the time the reader sees the end of input.
+        blocks = self.each_block()
+        if self.capture is not None and not self.capture.is_complete():
+            blocks = _captured(blocks, self.capture)
+        if self.orf_caller is not None:
+            blocks = self.orf_caller.each_block(blocks)
+            if self.orf_capture is not None:
+                blocks = _captured(blocks, self.orf_capture)
+        for block in blocks:
+            output_io.write(block)
+
+    def sample(self, size):
+        '''Return the start of the uncompressed file, at least size bytes
+        unless the file is smaller, without conversion to FASTA, as a tuple
+        (text, compressed_bytes). compressed_bytes is the number of bytes of
+        the file which were decompressed to give the text, or None if that
+        is not known because no in-process decompressor is available.'''
+        if self.compression is None:
+            with open(self.read_file, 'rb') as f:
+                text = f.read(size)
+            return text, len(text)
+
+        f = None
+        if self._new_decompressor() is None:
+            blocks = self._each_data_block()
+        else:
+            f = open(self.read_file, 'rb')
+            # Small blocks so that the number of compressed bytes read is
+            # close to the number needed
+            blocks = self._each_decompressed_block(f, 64*1024)
+        pieces = []
+        length = 0
+        try:
+            for block in blocks:
+                pieces.append(block)
+                length += len(block)
+                if length >= size: break
+        finally:
+            blocks.close()
+            compressed_bytes = None
+            if f is not None:
+                compressed_bytes = f.tell()
+                f.close()
+        return ''.join(pieces), compressed_bytes
+
+    def _each_block_in_parallel(self):
+        '''Convert chunks in a pool of worker processes, keeping a bounded
+        number of chunks in flight so memory use does not depend on the size
+        of the input.'''
+        pool = multiprocessing.Pool(self.threads)
+        try:
+            in_flight = deque()
+            for args in self._each_chunk():
+                in_flight.append(pool.apply_async(_convert_chunk_star, (args,)))
+                if len(in_flight) >= self.threads*2:
+                    yield in_flight.popleft().get()
+            while in_flight:
+                yield in_flight.popleft().get()
+        finally:
+            pool.terminate()
+
+    def _each_chunk(self):
+        '''Iterate over arguments to _convert_chunk, where each chunk is made
+        up of whole lines, or whole records for FASTQ. Boundaries are found
+        without splitting the data into lines.'''
+        leftover = ''
+        num_headers = 0
+        for data in self._each_data_block():
+            if leftover:
+                data = leftover+data
+            end = data.rfind('\n')+1
+            if self.fastq and end > 0:
+                for _ in range(data.count('\n', 0, end) % 4):
+                    end = data.rfind('\n', 0, end-1)+1
+            if end == 0:
+                leftover = data
+                continue
+            leftover = data[end:]
+            chunk = data[:end]
+            yield chunk, self.fastq, self.interleaved, num_headers
+            num_headers += self._count_headers(chunk)
+        if leftover:
+            if not leftover.endswith('\n'):
+                leftover += '\n'
+            yield leftover, self.fastq, self.interleaved, num_headers
+
+    def _count_headers(self, chunk):
+        if self.fastq:
+            return chunk.count('\n') / 4
+        else:
+            return chunk.count('\n>') + (1 if chunk[:1] == '>' else 0)
+
+    def _each_data_block(self):
+        '''Iterate over str blocks of uncompressed data, with arbitrary
+        boundaries'''
+        if self.compression is None:
+            return self._each_file_block()
+        elif self.compression not in self.COMPRESSIONS:
+            raise DecodingException("Unknown compression %s" % self.compression)
+
+        # Prefer external, multi-threaded decompressors
+        for command in self._decompression_commands():
+            if find_executable(command[0]):
+                return self._each_process_block(command)
+        if self._new_decompressor() is None:
+            raise DecodingException(
+                "Unable to decompress %s, %s is not installed" % \
+                (self.read_file,
+                 ' or '.join([c[0] for c in self._decompression_commands()])))
+        return self._each_threaded_block()
+
+    def _decompression_commands(self):
+        '''Return candidate commands which write the decompressed file to
+        STDOUT, most preferred first'''
+        threads = str(max(self.threads, 1))
+        read_file = self.read_file
+        if self.compression == self.GZIP_COMPRESSION:
+            return [['pigz', '-dc', '-p', threads, read_file]]
+        elif self.compression == self.BZIP2_COMPRESSION:
+            return [['lbzip2', '-dc', '-n', threads, read_file],
+                    ['pbzip2', '-dc', '-p'+threads, read_file],
+                    ['bzip2', '-dc', read_file]]
+        elif self.compression == self.XZ_COMPRESSION:
+            # xz decompresses in parallel from v5.4, earlier versions ignore -T
+            return [['xz', '-dc', '-T', threads, read_file]]
+        elif self.compression == self.ZSTD_COMPRESSION:
+            # pzstd decompresses files it compressed in parallel, and other
+            # zstd files like zstd does
+            return [['pzstd', '-dcq', '-p', threads, read_file],
+                    ['zstd', '-dcq', read_file]]
+
+    def _new_decompressor(self):
+        '''Return a new in-process decompressor for one compressed stream
+        (e.g. one gzip member), or None if it is not available. Decompressors
+        have decompress() and unused_data, as zlib's do.'''
+        if self.compression == self.GZIP_COMPRESSION:
+            return zlib.decompressobj(16+zlib.MAX_WBITS)
+        elif self.compression == self.BZIP2_COMPRESSION:
+            return bz2.BZ2Decompressor()
+        elif self.compression == self.XZ_COMPRESSION:
+            return lzma.LZMADecompressor() if lzma else None
+        elif self.compression == self.ZSTD_COMPRESSION:
+            return zstandard.ZstdDecompressor().decompressobj() \
+                if zstandard else None
+
+    def _each_file_block(self):
+        with open(self.read_file, 'rb') as f:
+            while True:
+                data = f.read(self._BLOCK_SIZE)
+                if not data: break
+                yield data
+
+    def _each_process_block(self, command):
+        '''Decompress using an external (multi-threaded) decompressor'''
+        process = subprocess.Popen(command, stdout=subprocess.PIPE)
+        finished = False
+        try:
+            while True:
+                data = process.stdout.read(self._BLOCK_SIZE)
+                if not data: break
+                yield data
+            finished = True
+        finally:
+            if not finished:
+                process.kill()
+            process.stdout.close()
+            returncode = process.wait()
+        if returncode != 0:
+            raise DecodingException("Command failed with exit status %i: %s" %\
+                                    (returncode, ' '.join(command)))
+
+    def _each_decompressed_block(self, f, block_size=None):
+        '''Decompress the open file f in-process, yielding non-empty str
+        blocks. Concatenated streams, e.g. multi-member gzip files, are
+        handled.'''
+        decompressor = self._new_decompressor()
+        while True:
+            data = f.read(block_size or self._BLOCK_SIZE)
+            if not data: break
+            while data:
+                try:
+                    out = decompressor.decompress(data)
+                except EOFError:
+                    # The previous stream ended exactly at the end of the
+                    # previous block
+                    decompressor = self._new_decompressor()
+                    out = decompressor.decompress(data)
+                if out: yield out
+                data = getattr(decompressor, 'unused_data', '')
+                if data:
+                    # Start of the next compressed stream
+                    decompressor = self._new_decompressor()
+        if hasattr(decompressor, 'flush'):
+            out = decompressor.flush()
+            if out: yield out
+
+    def _each_threaded_block(self):
+        '''Decompress in a separate thread so that decompression (which
+        releases the GIL) overlaps with conversion of the previous block.'''
+        queue = Queue(self._QUEUE_DEPTH)
+        stopped = threading.Event()
+
+        def put(item):
+            while not stopped.is_set():
+                try:
+                    queue.put(item, timeout=0.1)
+                    return
+                except Full:
+                    pass
+
+        def decompress():
+            try:
+                with open(self.read_file, 'rb') as f:
+                    for out in self._each_decompressed_block(f):
+                        if stopped.is_set(): break
+                        put(out)
+                put(None)
+            except Exception, e:
+                put(e)
+
+        thread = threading.Thread(target=decompress)
+        thread.daemon = True
+        thread.start()
+        try:
+            while True:
+                item = queue.get()
+                if item is None: break
+                if isinstance(item, Exception):
+                    raise DecodingException("Problem decompressing %s: %s" % \
+                                            (self.read_file, item))
+                yield item
+        finally:
+            stopped.set()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Write sequence reads to STDOUT in FASTA format')
+    parser.add_argument('--fastq', action='store_true',
+                        help='input is FASTQ formatted')
+    parser.add_argument('--compression',
+                        choices=ReadDecoder.COMPRESSIONS,
+                        help='compression of the input')
+    parser.add_argument('--interleaved', action='store_true',
+                        help='add /1 and /2 suffixes to alternate reads')
+    parser.add_argument('--threads', type=int, default=1,
+                        help='number of processes to convert reads with')
+    parser.add_argument('--capture_index',
+                        help='keep an index of read offsets here')
+    parser.add_argument('--capture_fasta',
+                        help='keep a copy of the decoded reads here. If not '
+                        'specified, index offsets refer to the input, which '
+                        'must then be uncompressed FASTA that is not modified')
+    parser.add_argument('--orfs', action='store_true',
+                        help='write the open reading frames of the reads '
+                        'rather than the reads, as OrfM does')
+    parser.add_argument('--min_orf_length', type=int,
+                        help='minimum number of nucleotides in an ORF')
+    parser.add_argument('--restrict_read_length', type=int,
+                        help='only call ORFs on this many bases at the start '
+                        'of each read')
+    parser.add_argument('--orf_capture_index',
+                        help='keep an index of ORF offsets here')
+    parser.add_argument('--orf_capture_fasta',
+                        help='keep a copy of the ORFs here')
+    parser.add_argument('read_file')
+    args = parser.parse_args()
+
+    if args.orfs:
+        # Imported from this script's directory, as graftm may not be
+        # importable
+        from orf_caller import OrfCaller, DEFAULT_MIN_ORF_LENGTH
+        orf_caller = OrfCaller(args.min_orf_length or DEFAULT_MIN_ORF_LENGTH,
+                               args.restrict_read_length)
+    else:
+        orf_caller = None
+    if args.orf_capture_index:
+        orf_capture = ReadCapture(args.orf_capture_index,
+                                  args.orf_capture_fasta)
+    else:
+        orf_capture = None
+
+    if args.capture_index:
+        if args.capture_fasta:
+            capture = ReadCapture(args.capture_index, args.capture_fasta)
+        else:
+            capture = ReadCapture(args.capture_index, args.read_file,
+                                  copy_reads=False)
+    else:
+        capture = None
+
+    # Exit quietly when e.g. piped into head, as zcat does
+    signal(SIGPIPE, SIG_DFL)
+    ReadDecoder(args.read_file,
+                fastq=args.fastq,
+                compression=args.compression,
+                interleaved=args.interleaved,
+                threads=args.threads,
+                capture=capture,
+                orf_caller=orf_caller,
+                orf_capture=orf_capture).write_to(sys.stdout)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+'''Remove reads with identical sequences from a stream of FASTA.
+
+Reads read from STDIN are written to STDOUT unless their sequence is
+identical to that of an earlier read, so that searches and alignment are
+only run on one copy of each sequence. The name of each read which is left
+out is written to a tab separated duplicates file together with the name of
+the earlier read it duplicates, so that the left out reads can be counted
+again later. The duplicates file is only moved into place once all reads
+have been read, so its presence means it is complete.
+
+Sequences are compared by SHA-1 digest, so one digest is held in memory for
+each distinct sequence. Only the standard library is used so that the script
+can be run without graftm being importable.
+'''
+
+import os
+import sys
+import hashlib
+import argparse
+from signal import signal, SIGPIPE, SIG_DFL
+
+# Number of bytes read from the input at a time
+_BLOCK_SIZE = 4*1024*1024
+
+def command_line(duplicates_path):
+    '''Return a string which, when run by bash, dereplicates STDIN to
+    STDOUT, writing duplicates to duplicates_path'''
+    script = os.path.splitext(os.path.abspath(__file__))[0]+'.py'
+    return "'%s' '%s' '%s'" % (sys.executable, script, duplicates_path)
+
+def read_duplicates(duplicates_path):
+    '''Return a dict of representative read name to list of the names of
+    reads which duplicate it, from a duplicates file'''
+    duplicates = {}
+    with open(duplicates_path) as f:
+        for line in f:
+            duplicate, representative = line.rstrip('\n').split('\t')
+            try:
+                duplicates[representative].append(duplicate)
+            except KeyError:
+                duplicates[representative] = [duplicate]
+    return duplicates
+
+class ReadDereplicator:
+    def __init__(self, duplicates_io):
+        '''
+        Parameters
+        ----------
+        duplicates_io: file
+            where to write the names of duplicate reads and their
+            representatives
+        '''
+        self._duplicates_io = duplicates_io
+        self._representatives = {}
+
+    def _unique_records(self, records):
+        '''Return the records which have not been seen before, given records
+        as str without their leading '>' or trailing newline'''
+        unique = []
+        duplicates = []
+        representatives = self._representatives
+        for record in records:
+            header, _, sequence = record.partition('\n')
+            words = header.split(None, 1)
+            name = words[0] if words else ''
+            digest = hashlib.sha1(sequence.replace('\n', '')).digest()
+            representative = representatives.get(digest)
+            if representative is None:
+                representatives[digest] = name
+                unique.append(record)
+            else:
+                duplicates.append('%s\t%s\n' % (name, representative))
+        self._duplicates_io.write(''.join(duplicates))
+        return unique
+
+    def dereplicate(self, input_io, output_io):
+        '''Write the reads of input_io to output_io, leaving out those which
+        duplicate an earlier read'''
+        leftover = ''
+        while True:
+            data = input_io.read(_BLOCK_SIZE)
+            if not data: break
+            records = (leftover+data).split('\n>')
+            leftover = records.pop()
+            if records:
+                if records[0][:1] == '>':
+                    records[0] = records[0][1:]
+                unique = self._unique_records(records)
+                if unique:
+                    output_io.write('>'+'\n>'.join(unique)+'\n')
+        leftover = leftover.rstrip('\n')
+        if leftover:
+            if leftover[:1] == '>':
+                leftover = leftover[1:]
+            for record in self._unique_records([leftover]):
+                output_io.write('>%s\n' % record)
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Write reads from STDIN to STDOUT, leaving out those '
+        'whose sequence duplicates an earlier read')
+    parser.add_argument('duplicates',
+                        help='write names of duplicate reads and the read '
+                        'they duplicate here')
+    args = parser.parse_args()
+
+    signal(SIGPIPE, SIG_DFL)
+    with open(args.duplicates+'.partial', 'w') as duplicates_io:
+        ReadDereplicator(duplicates_io).dereplicate(sys.stdin, sys.stdout)
+    os.rename(args.duplicates+'.partial', args.duplicates)
+
+if __name__ == '__main__':
+    main()
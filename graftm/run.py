@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 
 import os
+import re
 import logging
 import tempfile
 import shutil
@@ -26,7 +27,9 @@ from graftm.clusterer import Clusterer
 from graftm.decorator import Decorator
 from graftm.external_program_suite import ExternalProgramSuite
 from graftm.archive import Archive
-from graftm.decoy_filter import DecoyFilter
+from graftm.decoy_filter import DecoyFilter, MergedDecoyFilter, MergedDecoyDatabase
+from graftm.orfm import OrfM
+from graftm import kmer_prefilter
 from biom.util import biom_open
 
 T=Timer()
@@ -60,15 +63,21 @@ class Run:
         self.hk = HouseKeeping()
         self.s = Stats_And_Summary()
         if args.subparser_name == 'graft':
-            commands = ExternalProgramSuite(['orfm', 'nhmmer', 'hmmsearch',
-                                             'fxtract', 'pplacer',
-                                             'ktImportText', 'diamond'])
+            commands = ExternalProgramSuite(
+                ([] if args.builtin_orf_caller else ['orfm']) +
+                ['nhmmer', 'hmmsearch', 'pplacer', 'ktImportText', 'diamond'])
             self.hk.set_attributes(self.args)
             self.hk.set_euk_hmm(self.args)
-            if args.euk_check:self.args.search_hmm_files.append(self.args.euk_hmm_file)
+            if args.staged_euk_check: self.args.euk_check = True
+            if args.euk_check and not args.staged_euk_check:
+                self.args.search_hmm_files.append(self.args.euk_hmm_file)
 
             self.ss = SequenceSearcher(self.args.search_hmm_files,
-                           (None if self.args.search_only else self.args.aln_hmm_file))
+                           (None if self.args.search_only else self.args.aln_hmm_file),
+                           self.args.search_shards,
+                           staged_euk_hmm=(self.args.euk_hmm_file if args.staged_euk_check else None),
+                           keep_diamond_daa=self.args.keep_diamond_daa,
+                           builtin_orf_caller=self.args.builtin_orf_caller)
             self.sequence_pair_list = self.hk.parameter_checks(args)
             if hasattr(args, 'reference_package'):
                 self.p = Pplacer(self.args.reference_package)
@@ -203,6 +212,7 @@ class Run:
         search_results      = []
         hit_read_count_list = []
         db_search_results   = []
+        duplicate_reads     = {}
 
 
         if gpkg:
@@ -247,6 +257,11 @@ class Run:
                 logging.warn("--reverse reads specified with --assignment_method diamond. Reverse reads will be ignored.")
                 self.args.reverse = None
 
+        dereplicate = self.args.dereplicate_reads
+        if dereplicate and (self.args.reverse or self.args.interleaved):
+            logging.warn("--dereplicate_reads specified with paired reads. Reads will not be dereplicated, since this could split pairs.")
+            dereplicate = False
+
 
         # If merge reads is specified, check that there are reverse reads to merge with
         if self.args.merge_reads and not hasattr(self.args, 'reverse'):
@@ -257,6 +272,14 @@ class Run:
         self.hk.make_working_directory(self.args.output_directory,
                                        self.args.force)
 
+        if self.args.kmer_prefilter:
+            if not gpkg or gpkg.version < 3:
+                logging.warn("--kmer_prefilter requires a version 3 GraftM package, so sequences will not be prefiltered.")
+            elif self.args.expand_search_contigs:
+                logging.warn("--kmer_prefilter specified with --expand_search_contigs. Sequences will not be prefiltered, since they are searched with HMMs other than those of the GraftM package.")
+            else:
+                self.ss.kmer_prefilter = self._kmer_prefilter_path(gpkg)
+
         # Set pipeline and evalue by checking HMM format
         if self.args.search_only:
             if self.args.search_method == self.hk.HMMSEARCH_SEARCH_METHOD:
@@ -311,7 +334,13 @@ class Run:
                     diamond_db = new_database
 
         first_search_method = self.args.search_method
-        if self.args.decoy_database:
+        if self.args.decoy_database and self.args.decoy_cache_directory:
+            merged_db = MergedDecoyDatabase(self.args.decoy_cache_directory).acquire(
+                diamond_db, self.args.decoy_database)
+            decoy_filter = MergedDecoyFilter(merged_db, diamond_db,
+                                             threads=self.args.threads)
+            doing_decoy_search = True
+        elif self.args.decoy_database:
             decoy_filter = DecoyFilter(Diamond(diamond_db, threads=self.args.threads),
                                        Diamond(self.args.decoy_database,
                                                threads=self.args.threads))
@@ -345,7 +374,11 @@ class Run:
             for read_file in pair:
                 unpack = UnpackRawReads(read_file,
                                         self.args.input_sequence_type,
-                                        INTERLEAVED)
+                                        INTERLEAVED,
+                                        self.args.threads,
+                                        self.args.read_capture_directory,
+                                        self.args.read_cache_directory,
+                                        dereplicate)
                 if read_file is None:
                     # placeholder for interleaved (second file is None)
                     continue
@@ -354,6 +387,12 @@ class Run:
                     logging.info('%s does not exist! Skipping this file..' % read_file)
                     continue
 
+                profile = unpack.profile()
+                if profile.estimated_read_count and profile.mean_read_length:
+                    logging.info("Estimated %i reads with a mean length of %i" % \
+                                 (profile.estimated_read_count,
+                                  profile.mean_read_length))
+
                 # Set the output file_name
                 if len(pair) == 2:
                     direction = 'interleaved' if pair[1] is None \
@@ -372,42 +411,50 @@ class Run:
                                            self.args.output_directory,
                                            direction)
 
-                if self.args.type == self.PIPELINE_AA:
-                    logging.debug("Running protein pipeline")
-                    try:
-                        search_time, (result, complement_information) = self.ss.aa_db_search(
+                try:
+                    if self.args.type == self.PIPELINE_AA:
+                        logging.debug("Running protein pipeline")
+                        try:
+                            search_time, (result, complement_information) = self.ss.aa_db_search(
+                                self.gmf,
+                                base,
+                                unpack,
+                                first_search_method,
+                                maximum_range,
+                                self.args.threads,
+                                self.args.evalue,
+                                self.args.min_orf_length,
+                                self.args.restrict_read_length,
+                                diamond_db
+                            )
+                        except NoInputSequencesException, e:
+                            logging.error("No sufficiently long open reading frames were found, indicating"
+                                          " either the input sequences are too short or the min orf length"
+                                          " cutoff is too high. Cannot continue sorry. Alternatively, there"
+                                          " is something amiss with the installation of OrfM. The specific"
+                                          " command that failed was: %s" % e.command)
+                            exit(Run.NO_ORFS_EXITSTATUS)
+
+                    # Or the DNA pipeline
+                    elif self.args.type == self.PIPELINE_NT:
+                        logging.debug("Running nucleotide pipeline")
+                        search_time, (result, complement_information)  = self.ss.nt_db_search(
                             self.gmf,
                             base,
                             unpack,
-                            first_search_method,
+                            self.args.euk_check,
+                            self.args.search_method,
                             maximum_range,
                             self.args.threads,
-                            self.args.evalue,
-                            self.args.min_orf_length,
-                            self.args.restrict_read_length,
-                            diamond_db
+                            self.args.evalue
                         )
-                    except NoInputSequencesException, e:
-                        logging.error("No sufficiently long open reading frames were found, indicating"
-                                      " either the input sequences are too short or the min orf length"
-                                      " cutoff is too high. Cannot continue sorry. Alternatively, there"
-                                      " is something amiss with the installation of OrfM. The specific"
-                                      " command that failed was: %s" % e.command)
-                        exit(Run.NO_ORFS_EXITSTATUS)
-
-                # Or the DNA pipeline
-                elif self.args.type == self.PIPELINE_NT:
-                    logging.debug("Running nucleotide pipeline")
-                    search_time, (result, complement_information)  = self.ss.nt_db_search(
-                        self.gmf,
-                        base,
-                        unpack,
-                        self.args.euk_check,
-                        self.args.search_method,
-                        maximum_range,
-                        self.args.threads,
-                        self.args.evalue
-                    )
+                finally:
+                    # Hits have been extracted, or the search failed, so the
+                    # captured reads and ORFs are no longer needed
+                    unpack.remove_read_capture()
+                    unpack.remove_orf_capture()
+                duplicate_reads[base] = unpack.duplicates()
+                unpack.remove_duplicates()
 
                 reads_detected = True
                 if not result.hit_fasta() or os.path.getsize(result.hit_fasta()) == 0:
@@ -429,6 +476,9 @@ class Run:
                                                         tmpname)
                     if any_remaining:
                         shutil.move(tmpname, result.hit_fasta())
+                        # The remaining sequences have been searched against
+                        # the non-decoy database
+                        result.diamond_result = decoy_filter.proper_hits
                     else:
                         # No hits remain after decoy filtering.
                         os.remove(result.hit_fasta())
@@ -523,11 +573,71 @@ class Run:
                         self.gmf)
             aln_time = 'n/a'
         else: raise Exception("Unexpected assignment method encountered: %s" % self.args.placement_method)
+
+        self._restore_duplicate_reads(assignments, duplicate_reads)
         
         self.summarise(base_list, assignments, REVERSE_PIPE,
                        [search_time, aln_time, taxonomic_assignment_time],
                        hit_read_count_list, self.args.max_samples_for_krona)
 
+    def _kmer_prefilter_path(self, gpkg):
+        '''Return the path to the k-mer prefilter of the GraftM package,
+        creating one in the output directory from the package's sequences if
+        the package does not have one'''
+        path = gpkg.kmer_prefilter_path()
+        if path:
+            return path
+        sequences = gpkg.unaligned_sequence_database_path() or \
+            gpkg.alignment_fasta_path()
+        logging.info("Creating k-mer prefilter from %s" % sequences)
+        with open(sequences) as f:
+            prefilter = kmer_prefilter.build(
+                (seq for _, seq, _ in SequenceIO().each(f)),
+                gpkg.is_protein_package())
+        path = os.path.join(self.args.output_directory, 'kmer_prefilter')
+        prefilter.write(path)
+        return path
+
+    def _restore_duplicate_reads(self, assignments, duplicate_reads):
+        '''Add the reads which were left out of the search by
+        --dereplicate_reads to the assignments, each with the taxonomy of the
+        read it duplicates.
+
+        Parameters
+        ----------
+        assignments: dict
+            dict of base_list entry to dict of read names to taxonomies, which
+            is modified. Read names may be names of OrfM ORFs, or of the
+            regions of reads split out by _split_<i> suffixes, in which case
+            the same ORF or region is assigned in each duplicate read.
+        duplicate_reads: dict
+            dict of base_list entry to the duplicates() of its reads
+        '''
+        orfm_regex = OrfM.regular_expression()
+        split_regex = re.compile(r'_split_\d+$')
+        for base, duplicates in duplicate_reads.iteritems():
+            if not duplicates or base not in assignments:
+                continue
+            placements = assignments[base]
+            num_restored = 0
+            for name, taxonomy in placements.items():
+                read_name = name
+                if read_name not in duplicates:
+                    split = split_regex.search(read_name)
+                    if split:
+                        read_name = read_name[:split.start()]
+                if read_name not in duplicates:
+                    match = orfm_regex.match(read_name)
+                    if not match or match.group(1) not in duplicates:
+                        continue
+                    read_name = match.group(1)
+                suffix = name[len(read_name):]
+                for duplicate in duplicates[read_name]:
+                    placements[duplicate+suffix] = taxonomy
+                    num_restored += 1
+            logging.debug("Restored %i duplicate reads in %s" % (num_restored,
+                                                                  base))
+
     @T.timeit
     def _assign_taxonomy_with_diamond(self, base_list, db_search_results,
                                       graftm_package, graftm_files):
@@ -553,22 +663,59 @@ class Run:
         '''
         runner = Diamond(graftm_package.diamond_database_path(),
                          self.args.threads,
-                         self.args.evalue)
+                         self.args.evalue,
+                         self.args.diamond_memory_limit)
         taxonomy_definition = Getaxnseq().read_taxtastic_taxonomy_and_seqinfo\
                 (open(graftm_package.taxtastic_taxonomy_path()),
                  open(graftm_package.taxtastic_seqinfo_path()))
         results = {}
 
+        daa_file_basenames = [graftm_files.diamond_assignment_output_basename(base) \
+                              for base in base_list[:len(db_search_results)]]
+        # Hits of the sequences against the assignment database found when
+        # searching for them or filtering decoys are used rather than
+        # searching again, unless the .daa of the assignment is to be kept
+        diamond_results = [None]*len(db_search_results)
+        reused = [False]*len(db_search_results)
+        if not self.args.keep_diamond_daa:
+            for i, search_result in enumerate(db_search_results):
+                if search_result.diamond_result is not None and \
+                    runner.covers(search_result.diamond_result):
+                    logging.debug("Reusing diamond hits of %s" % search_result.hit_fasta())
+                    diamond_results[i] = search_result.diamond_result
+                    reused[i] = True
+        to_search = [i for i in range(len(db_search_results)) if not reused[i]]
+        if len(to_search) > 1 and not self.args.keep_diamond_daa:
+            # Search all samples with one diamond process, so that the
+            # database is only loaded once
+            for i, diamond_result in zip(to_search, runner.run_batch(
+                [db_search_results[i].hit_fasta() for i in to_search],
+                UnpackRawReads.PROTEIN_SEQUENCE_TYPE,
+                [daa_file_basenames[i] for i in to_search])):
+                diamond_results[i] = diamond_result
+
         # For each of the search results,
         for i, search_result in enumerate(db_search_results):
             sequence_id_to_hit = {}
-            # Run diamond
-            logging.debug("Running diamond on %s" % search_result.hit_fasta())
-            diamond_result = runner.run(search_result.hit_fasta(),
-                                        UnpackRawReads.PROTEIN_SEQUENCE_TYPE,
-                                        daa_file_basename=graftm_files.diamond_assignment_output_basename(base_list[i]))
+            diamond_result = diamond_results[i]
+            if diamond_result is None:
+                # Run diamond
+                logging.debug("Running diamond on %s" % search_result.hit_fasta())
+                diamond_result = runner.run(search_result.hit_fasta(),
+                                            UnpackRawReads.PROTEIN_SEQUENCE_TYPE,
+                                            daa_file_basename=daa_file_basenames[i],
+                                            keep_daa=self.args.keep_diamond_daa)
+            if reused[i]:
+                # Hits may have been found with a more permissive cutoff
+                max_evalue = float(self.args.evalue) if self.args.evalue \
+                    else Diamond.DEFAULT_EVALUE
+            else:
+                max_evalue = None
             for res in diamond_result.each([SequenceSearchResult.QUERY_ID_FIELD,
-                                            SequenceSearchResult.HIT_ID_FIELD]):
+                                            SequenceSearchResult.HIT_ID_FIELD,
+                                            SequenceSearchResult.EVALUE_FIELD]):
+                if max_evalue is not None and res[2] > max_evalue:
+                    continue
                 if res[0] in sequence_id_to_hit:
                     # do not accept duplicates
                     if sequence_id_to_hit[res[0]] != res[1]:
@@ -676,7 +823,8 @@ class Run:
                               hmm = self.args.hmm,
                               search_hmm_files = self.args.search_hmm_files,
                               force = self.args.force,
-                              threads = self.args.threads
+                              threads = self.args.threads,
+                              kmer_prefilter = self.args.kmer_prefilter
                               )
 
         elif self.args.subparser_name == 'update':
@@ -57,17 +57,17 @@ class SearchTableWriter:
         for base, results in zip(base_list, results_list): # For each sample
             search_results = {}
             for search in results():
-                search_list = list(
-                                   search.each([SequenceSearchResult.QUERY_ID_FIELD,
-                                                SequenceSearchResult.ALIGNMENT_BIT_SCORE,
-                                                SequenceSearchResult.HMM_NAME_FIELD])
-                                   )
-                for hit in search_list:
-                    if hit[0] in search_results:
-                        if float(hit[1]) > search_results[hit[0]][1]:
-                            search_results[hit[0]] = [float(hit[1]), hit[2]]
+                # Best hit of each read in this search, then across searches
+                rows = search.best_rows()
+                best_hits = zip(search.queries(),
+                                search.column(SequenceSearchResult.ALIGNMENT_BIT_SCORE)[rows].tolist(),
+                                search.column(SequenceSearchResult.HMM_NAME_FIELD)[rows].tolist())
+                for read, bit_score, hmm in best_hits:
+                    if read in search_results:
+                        if bit_score > search_results[read][1]:
+                            search_results[read] = [bit_score, hmm]
                     else:
-                        search_results[hit[0]] = [float(hit[1]), hit[2]]
+                        search_results[read] = [bit_score, hmm]
             run_results[base] = search_results
         
         ########################################################################
@@ -1,7 +1,8 @@
-import extern
 from Bio import SeqIO
 from StringIO import StringIO
 
+from graftm.fasta_index import FastaIndex
+
 class SequenceExtractor:
     def extract(self, reads_to_extract, database_fasta_file, output_file):
         '''Extract the reads_to_extract from the database_fasta_file and put them in
@@ -19,21 +20,32 @@ class SequenceExtractor:
         Returns
         -------
         Nothing'''
-        cmd = "fxtract -XH -f /dev/stdin '%s' > %s" % (
-            database_fasta_file, output_file)
-
-        extern.run(cmd, stdin='\n'.join(reads_to_extract))
+        with FastaIndex(database_fasta_file) as index:
+            with open(output_file, 'w') as f:
+                index.write_records(reads_to_extract, f)
 
     def extract_forward_and_reverse_complement(
             self, forward_reads_to_extract, reverse_reads_to_extract, database_fasta_file,
             output_file):
         '''As per extract except also reverse complement the sequences.'''
-        self.extract(forward_reads_to_extract, database_fasta_file, output_file)
-        cmd_rev = "fxtract -XH -f /dev/stdin '%s'" % database_fasta_file
-
-        output = extern.run(cmd_rev, stdin='\n'.join(reverse_reads_to_extract))
+        with FastaIndex(database_fasta_file) as index:
+            with open(output_file, 'w') as f:
+                index.write_records(forward_reads_to_extract, f)
+                reverse = ''.join(index.records(reverse_reads_to_extract))
+                for record in SeqIO.parse(StringIO(reverse), 'fasta'):
+                    record.seq = record.reverse_complement().seq
+                    SeqIO.write(record, f, 'fasta')
 
-        with open(output_file, 'a') as f:
-            for record in SeqIO.parse(StringIO(output), 'fasta'):
-                record.seq = record.reverse_complement().seq
-                SeqIO.write(record, f, 'fasta')
+    def extract_from_stream(self, reads_to_extract, input_io, output_io):
+        '''As per extract except the sequences are read from an open file
+        such as a pipe, which cannot be indexed, and written to an open file.
+        Sequences are only read once, and are not parsed beyond their header
+        lines.'''
+        wanted = set(reads_to_extract)
+        keep = False
+        for line in input_io:
+            if line[:1] == '>':
+                words = line[1:].split(None, 1)
+                keep = (words[0] if words else '') in wanted
+            if keep:
+                output_io.write(line)
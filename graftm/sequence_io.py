@@ -1,14 +1,146 @@
+import gzip
+import itertools
+import cStringIO
+from StringIO import StringIO
 
+class Sequence(object):
+    # Millions of these can be held at once, so avoid a per-instance __dict__
+    __slots__ = ('name', 'seq')
 
-
-class Sequence:
     def __init__(self, name, seq):
         self.name = name
         self.seq = seq
 
 class SequenceIO:
+    # Number of bytes read at a time, and number of records per write
+    _BUFFER_SIZE = 1024*1024
+    _WRITE_BATCH_SIZE = 4096
+
+    def each(self, fp):
+        '''Iterate over (name, seq, qual) tuples of the FASTA or FASTQ records
+        in fp, where qual is None for FASTA records and name is the header up
+        to the first space.
+
+        Open files (anything with a read method, including gzip files) are
+        parsed in large blocks, finding record boundaries with str methods
+        rather than handling one line at a time. Other iterables of lines are
+        parsed line by line.'''
+        if hasattr(fp, 'read'):
+            # Records are yielded by C-level iterators over each chunk, so no
+            # Python code runs per record beyond extracting the name
+            return itertools.chain.from_iterable(self._each_chunk_iterator(fp))
+        else:
+            return self._each_line_by_line(iter(fp))
+
+    def _each_chunk_iterator(self, fp):
+        # Skip any text before the first header
+        buf = ''
+        while True:
+            data = fp.read(self._BUFFER_SIZE)
+            buf += data
+            if buf[:1] in ('>', '@'):
+                start = 0
+            else:
+                starts = [i for i in (buf.find('\n>'), buf.find('\n@')) if i != -1]
+                start = min(starts)+1 if starts else -1
+            if start != -1:
+                buf = buf[start:]
+                break
+            if not data:
+                return
+            buf = buf[buf.rfind('\n')+1:]
+
+        if buf[0] == '>':
+            iterators = self._each_fasta_chunk_iterator(buf, data, fp)
+        else:
+            iterators = self._each_fastq_chunk_iterator(buf, data, fp)
+        for iterator in iterators:
+            yield iterator
+
+    def _each_fasta_chunk_iterator(self, buf, data, fp):
+        pending = [buf]
+        while True:
+            if data:
+                data = fp.read(self._BUFFER_SIZE)
+                if data and '\n>' not in data and \
+                    not (data[0] == '>' and pending[-1].endswith('\n')):
+                    # Still within the same record, which could be long, so
+                    # avoid repeatedly concatenating it
+                    pending.append(data)
+                    continue
+                pending.append(data)
+            buf = ''.join(pending)
+            end = buf.rfind('\n>') if data else len(buf)
+            if end == -1:
+                pending = [buf]
+                continue
+            yield self._fasta_chunk_iterator(buf[:end+1])
+            if not data:
+                break
+            pending = [buf[end+1:]]
+
+    def _fasta_chunk_iterator(self, chunk):
+        '''Return an iterator over the records in a str of whole FASTA
+        records'''
+        if not chunk.endswith('\n'):
+            chunk += '\n'
+        first_record_end = chunk.find('\n>')
+        if first_record_end == -1:
+            first_record_end = len(chunk)-1
+        if chunk.find('\n', chunk.find('\n')+1) == first_record_end:
+            # The first record is on two lines, so check they all are
+            unwrapped = chunk.count('\n') == 2*(chunk.count('\n>')+1)
+        else:
+            unwrapped = False
+        if unwrapped:
+            lines = chunk.split('\n')
+            lines.pop()
+            headers = lines[0::2]
+            if not any(h[:1] != '>' for h in headers):
+                # Each sequence is on a single line
+                return itertools.izip([h[1:].partition(' ')[0] for h in headers],
+                                      lines[1::2],
+                                      itertools.repeat(None))
+        # Wrapped sequences are joined fastest line by line
+        return self._each_line_by_line(iter(cStringIO.StringIO(chunk)))
+
+    def _each_fastq_chunk_iterator(self, buf, data, fp):
+        while True:
+            if data:
+                data = fp.read(self._BUFFER_SIZE)
+                buf += data
+            if data:
+                # Only parse whole records of 4 lines
+                end = buf.rfind('\n')+1
+                for _ in range(buf.count('\n', 0, end) % 4):
+                    end = buf.rfind('\n', 0, end-1)+1
+                if end == 0:
+                    continue
+            else:
+                end = len(buf)
+                if end == 0:
+                    break
+            lines = buf[:end].split('\n')
+            if buf[:end].endswith('\n'):
+                lines.pop()
+            headers = lines[0::4]
+            if len(lines) % 4 != 0 or \
+                any(h[:1] != '@' for h in headers) or \
+                any(p[:1] != '+' for p in lines[2::4]):
+                # Not 4 line FASTQ, e.g. sequences are wrapped
+                if data and not buf.endswith('\n'):
+                    buf += fp.readline()
+                yield self._each_line_by_line(itertools.chain(StringIO(buf), fp))
+                return
+            yield itertools.izip([h[1:].partition(' ')[0] for h in headers],
+                                 lines[1::4],
+                                 lines[3::4])
+            if not data:
+                break
+            buf = buf[end:]
+
     # Stolen from https://github.com/lh3/readfq/blob/master/readfq.py
-    def each(self, fp): # this is a generator function
+    def _each_line_by_line(self, fp): # this is a generator function
         last = None # this is a buffer keeping the last unprocessed line
         while True: # mimic closure; is it a bad idea?
             if not last: # the first record or a record following a fastq
@@ -45,19 +177,28 @@ class SequenceIO:
             yield Sequence(name, seq)
 
     def read_fasta_file(self, path_to_fasta_file):
+        '''Return a list of Sequence objects from a FASTA or FASTQ file, which
+        may be gzip compressed'''
         seqs = []
-        for name, seq, _ in self.each(open(path_to_fasta_file)):
-            seqs.append(Sequence(name, seq))
+        with self._open(path_to_fasta_file) as f:
+            for name, seq, _ in self.each(f):
+                seqs.append(Sequence(name, seq))
         return seqs
-    
+
+    def _open(self, path):
+        if path.endswith('.gz'):
+            return gzip.open(path)
+        else:
+            return open(path)
+
     def write_fasta_file(self, sequence_objects, path_to_fasta_file):
         with open(path_to_fasta_file,'w') as f:
             self.write_fasta(sequence_objects, f)
 
     def write_fasta(self, sequence_objects, io):
-        for s in sequence_objects:
-            io.write(">")
-            io.write(s.name)
-            io.write("\n")
-            io.write(s.seq)
-            io.write("\n")
+        # Write in batches rather than making several writes per record
+        sequence_objects = iter(sequence_objects)
+        for batch in iter(lambda: list(itertools.islice(
+                sequence_objects, self._WRITE_BATCH_SIZE)), []):
+            io.write(''.join(
+                ['>%s\n%s\n' % (s.name, s.seq) for s in batch]))
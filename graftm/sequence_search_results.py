@@ -1,8 +1,11 @@
 import subprocess
+import itertools
+import tempfile
 import logging
-import csv
 import os
 
+import numpy as np
+
 class SequenceSearchResult:
     QUERY_FROM_FIELD = 'query_from'
     QUERY_TO_FIELD = 'query_to'
@@ -20,12 +23,187 @@ class SequenceSearchResult:
     MISMATCH_FIELD = "mismatch"
     EVALUE_FIELD = "evalue"
     
-    
+    # NumPy types of the numeric fields. Other fields are kept as given.
+    _FIELD_TYPES = {
+        QUERY_FROM_FIELD: np.int64,
+        QUERY_TO_FIELD: np.int64,
+        QUERY_LENGTH_FIELD: np.int64,
+        HIT_FROM_FIELD: np.int64,
+        HIT_TO_FIELD: np.int64,
+        ALIGNMENT_LENGTH_FIELD: np.int64,
+        ALIGNMENT_BIT_SCORE: np.float64,
+        ALIGNMENT_DIRECTION: np.bool_,
+        PERCENT_ID_FIELD: np.float64,
+        MISMATCH_FIELD: np.int64,
+        EVALUE_FIELD: np.float64,
+        }
+    # Fields of names, which are stored as the number of each name in a list
+    # of the distinct names, numbered in order of first appearance
+    _NAME_FIELDS = set([QUERY_ID_FIELD, HIT_ID_FIELD, HMM_NAME_FIELD])
     
     def __init__(self):
         self.fields = []
-        self.results = []
-        
+        # Array of the values of each field, or of the name numbers of name
+        # fields
+        self._columns = {}
+        # List of the distinct names of each name field
+        self._names = {}
+        self._num_rows = 0
+        # Rows in query order and where the rows of each query start in it
+        self._query_index = None
+
+    def set_columns(self, columns):
+        """Set the results from a dict of each field in self.fields to a list
+        or array of its value in each result"""
+        self._columns = {}
+        self._names = {}
+        self._query_index = None
+        self._num_rows = 0
+        for field in self.fields:
+            values = columns[field]
+            self._num_rows = len(values)
+            if field in self._NAME_FIELDS:
+                numbers = {}
+                self._columns[field] = np.fromiter(
+                    (numbers.setdefault(v, len(numbers)) for v in values),
+                    dtype=np.int64, count=len(values))
+                self._names[field] = self._names_in_order(numbers)
+            else:
+                self._columns[field] = np.array(
+                    values, dtype=self._FIELD_TYPES.get(field, object))
+
+    @staticmethod
+    def _names_in_order(numbers):
+        names = [None]*len(numbers)
+        for name, number in numbers.iteritems():
+            names[number] = name
+        return names
+
+    def __len__(self):
+        return self._num_rows
+
+    def column(self, field):
+        """Return a NumPy array of the value of field in each result. Names
+        are returned as an array of objects."""
+        self.fields.index(field)
+        if field in self._NAME_FIELDS:
+            names = np.empty(len(self._names[field]), dtype=object)
+            names[:] = self._names[field]
+            return names[self._columns[field]]
+        return self._columns[field]
+
+    def name_numbers(self, field):
+        """Return an array of the number of the name in each result of a name
+        field such as QUERY_ID_FIELD, and the list of names they number"""
+        return self._columns[field], self._names[field]
+
+    def _values(self, field):
+        if field in self._NAME_FIELDS:
+            names = self._names[field]
+            return [names[i] for i in self._columns[field].tolist()]
+        return self._columns[field].tolist()
+
+    @property
+    def results(self):
+        """List of the values of each field for each result"""
+        return list(self.each(self.fields))
+
+    def queries(self):
+        """Return the list of distinct query IDs, in order of first
+        appearance. Queries are numbered by their position in this list."""
+        return self._names[SequenceSearchResult.QUERY_ID_FIELD]
+
+    def query_index(self):
+        """Return an array of the rows ordered by query, and an array of where
+        the rows of each query start in it, followed by the number of rows.
+        The rows of each query are in their original order."""
+        if self._query_index is None:
+            numbers = self._columns[SequenceSearchResult.QUERY_ID_FIELD]
+            order = np.argsort(numbers, kind='mergesort')
+            starts = np.searchsorted(numbers[order],
+                                     np.arange(len(self.queries())+1))
+            self._query_index = (order, starts)
+        return self._query_index
+
+    def hits_per_query(self):
+        """Return an array of the number of results of each query"""
+        return np.diff(self.query_index()[1])
+
+    def best_rows(self, field=ALIGNMENT_BIT_SCORE, lowest=False):
+        """Return an array of the row with the highest value of field for each
+        query, or the lowest if lowest is True. Ties go to the first row."""
+        if self._num_rows == 0:
+            return np.zeros(0, dtype=np.int64)
+        values = self._columns[field]
+        if not lowest:
+            values = -values
+        order = np.lexsort((np.arange(self._num_rows), values,
+                            self._columns[SequenceSearchResult.QUERY_ID_FIELD]))
+        return order[self.query_index()[1][:-1]]
+
+    def last_rows(self):
+        """Return an array of the last row of each query"""
+        order, starts = self.query_index()
+        return order[starts[1:]-1]
+
+    def hits_per_name(self, field=HMM_NAME_FIELD, rows=None):
+        """Return a dict of each name of a name field to the number of results
+        with that name, counting only the given rows if rows is not None"""
+        numbers = self._columns[field]
+        if rows is not None:
+            numbers = numbers[rows]
+        counts = np.bincount(numbers, minlength=len(self._names[field]))
+        return dict([(name, count) for name, count in \
+                     itertools.izip(self._names[field], counts.tolist()) \
+                     if count > 0])
+
+    @staticmethod
+    def concatenate(results):
+        """Return a new result with the rows of each of the results in turn,
+        all of which must have the same fields"""
+        if not results:
+            return SequenceSearchResult()
+        combined = results[0].__class__()
+        combined.fields = list(results[0].fields)
+        for field in combined.fields:
+            if field in SequenceSearchResult._NAME_FIELDS:
+                numbers = {}
+                columns = []
+                for result in results:
+                    renumbering = np.array(
+                        [numbers.setdefault(name, len(numbers)) \
+                         for name in result._names[field]], dtype=np.int64)
+                    columns.append(renumbering[result._columns[field]])
+                combined._columns[field] = np.concatenate(columns)
+                combined._names[field] = SequenceSearchResult._names_in_order(numbers)
+            else:
+                combined._columns[field] = np.concatenate(
+                    [result._columns[field] for result in results])
+        combined._num_rows = sum([len(result) for result in results])
+        return combined
+
+    def subset(self, rows):
+        """Return a new result with only the given rows, in the order given"""
+        rows = np.asarray(rows, dtype=np.int64)
+        res = self.__class__()
+        res.fields = list(self.fields)
+        for field in res.fields:
+            if field in SequenceSearchResult._NAME_FIELDS:
+                # Renumber the names which remain by their first appearance
+                numbers, first, inverse = np.unique(
+                    self._columns[field][rows], return_index=True,
+                    return_inverse=True)
+                order = np.argsort(first)
+                renumbering = np.empty(len(order), dtype=np.int64)
+                renumbering[order] = np.arange(len(order))
+                res._columns[field] = renumbering[inverse]
+                names = self._names[field]
+                res._names[field] = [names[i] for i in numbers[order].tolist()]
+            else:
+                res._columns[field] = self._columns[field][rows]
+        res._num_rows = len(rows)
+        return res
+
     def each(self, field_names):
         """Iterate over the results, yielding a list for each result, where
         each element corresponds to the field given in the field_name parameters
@@ -43,71 +221,85 @@ class SequenceSearchResult:
         ----------
         raises something when a field name is not in self.fields
         """
-        field_ids = []
         for f in field_names:
             # below raises error if the field name is not found, so
             # don't need to account for that.
-            field_ids.append(self.fields.index(f))
+            self.fields.index(f)
+        columns = [self._values(f) for f in field_names]
         
-        for r in self.results:
-            yield([r[i] for i in field_ids])
+        for r in itertools.izip(*columns):
+            yield(list(r))
         
 class DiamondSearchResult(SequenceSearchResult):
+    # blast m8 format is
+    # 'qseqid sseqid pident length mismatch gapopen qstart qend sstart send evalue bitscore
+    #    0       1     2      3        4        5      6     7    8      9    10     11
+    _COLUMNS = [
+                (SequenceSearchResult.QUERY_ID_FIELD, 0),
+                (SequenceSearchResult.HIT_ID_FIELD, 1),
+                (SequenceSearchResult.PERCENT_ID_FIELD, 2),
+                (SequenceSearchResult.ALIGNMENT_LENGTH_FIELD, 3),
+                (SequenceSearchResult.MISMATCH_FIELD, 4),
+                #skip
+                (SequenceSearchResult.QUERY_FROM_FIELD, 6),
+                (SequenceSearchResult.QUERY_TO_FIELD, 7),
+                (SequenceSearchResult.HIT_FROM_FIELD, 8),
+                (SequenceSearchResult.HIT_TO_FIELD, 9),
+                (SequenceSearchResult.EVALUE_FIELD, 10),
+                (SequenceSearchResult.ALIGNMENT_BIT_SCORE, 11)
+                ]
+
     @staticmethod
     def import_from_daa_file(daa_filename):
         '''Generate new results object from the output of diamond blastx/p'''
-        
-        # blast m8 format is
-        # 'qseqid sseqid pident length mismatch gapopen qstart qend sstart send evalue bitscore
+        cmd = "diamond view -a '%s'" % daa_filename
+        logging.debug("Running cmd: %s" % cmd)
+        with tempfile.TemporaryFile() as stderr:
+            process = subprocess.Popen(cmd, stdout=subprocess.PIPE,
+                                       stderr=stderr, shell=True)
+            res = DiamondSearchResult.import_from_tabular(
+                process.stdout, os.path.basename(daa_filename))
+            process.stdout.close()
+            if process.wait() != 0:
+                stderr.seek(0)
+                raise Exception("Problem running diamond view with cmd: '%s',"
+                                "stderr was %s" % (cmd, stderr.read()))
+        return res
+
+    @staticmethod
+    def import_from_tabular(tabular_io, name):
+        '''Generate new results object from diamond blast m8 format output,
+        reading it a line at a time so that it need not all be held in memory.
+
+        Parameters
+        ----------
+        tabular_io: file or iterable of str
+            the diamond output lines, e.g. the stdout of diamond
+        name: str
+            value of HMM_NAME_FIELD of each result, e.g. the name of the .daa
+            file the results were viewed from
+        '''
         res = DiamondSearchResult()
-        res.fields = [
-                       SequenceSearchResult.QUERY_ID_FIELD,
-                       SequenceSearchResult.HIT_ID_FIELD,
-                       SequenceSearchResult.PERCENT_ID_FIELD,
-                       SequenceSearchResult.ALIGNMENT_LENGTH_FIELD,
-                       SequenceSearchResult.MISMATCH_FIELD,
-                       #skip
-                       SequenceSearchResult.QUERY_FROM_FIELD,
-                       SequenceSearchResult.QUERY_TO_FIELD,
-                       SequenceSearchResult.HIT_FROM_FIELD,
-                       SequenceSearchResult.HIT_TO_FIELD,
-                       SequenceSearchResult.EVALUE_FIELD,
-                       SequenceSearchResult.ALIGNMENT_BIT_SCORE,
+        res.fields = [field for field, _ in DiamondSearchResult._COLUMNS] + \
+                     [
                        # extras
                        SequenceSearchResult.ALIGNMENT_DIRECTION,
                        SequenceSearchResult.HMM_NAME_FIELD
                        ]
-        
-        cmd = "diamond view -a '%s'" % daa_filename
-        logging.debug("Running cmd: %s" % cmd)
-        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, shell=True)
-        stdout, stderr = process.communicate()
-        
-        reader = csv.reader(stdout.decode('ascii').splitlines(),
-                                delimiter='\t')
-        if process.returncode != 0:
-            raise Exception("Problem running diamond view with cmd: '%s'," 
-                            "stderr was %s" % (cmd, stderr))
-
-        for row in reader:
-            # 'qseqid sseqid pident length mismatch gapopen qstart qend sstart send evalue bitscore
-            #    0       1     2      3        4        5      6     7    8      9    10     11
-            query_start = int(row[6])
-            query_end = int(row[7])
-            res.results.append([row[0],
-                                 row[1],
-                                 row[2],
-                                 row[3],
-                                 row[4],
-                                 query_start,
-                                 query_end,
-                                 int(row[8]),
-                                 int(row[9]),
-                                 row[10],
-                                 row[11],
-                                 query_start < query_end,
-                                 os.path.basename(daa_filename)
-                                 ])
+
+        columns = dict([(field, []) for field, _ in DiamondSearchResult._COLUMNS])
+        appends = [(columns[field].append, i) \
+                   for field, i in DiamondSearchResult._COLUMNS]
+        for line in tabular_io:
+            row = line.rstrip('\n').split('\t')
+            for append, i in appends:
+                append(row[i])
+        columns[SequenceSearchResult.ALIGNMENT_DIRECTION] = \
+            np.array(columns[SequenceSearchResult.QUERY_FROM_FIELD], dtype=np.int64) < \
+            np.array(columns[SequenceSearchResult.QUERY_TO_FIELD], dtype=np.int64)
+        columns[SequenceSearchResult.HMM_NAME_FIELD] = \
+            [name]*len(columns[SequenceSearchResult.QUERY_ID_FIELD])
+        res.set_columns(columns)
         return res
 
 class HMMSearchResult(SequenceSearchResult):
@@ -117,6 +309,14 @@ class HMMSearchResult(SequenceSearchResult):
         # nhmmer format is
         # qseqid queryname hmmfrom hmmto alifrom alito envfrom envto sqlen strand evalue bitscore bias description
         #   0        2        4      5      6      7      8      9    10     11     12      13     14     15     
+        with open(hmmout_path) as f:
+            return HMMSearchResult.import_from_nhmmer_rows(
+                [x.rstrip().split() for x in f if not x.startswith('#')])
+
+    @staticmethod
+    def import_from_nhmmer_rows(rows):
+        '''Generate new results object from the rows of an nhmmer table, each
+        a list of its whitespace separated fields'''
         res=HMMSearchResult()
         res.fields = [
                        SequenceSearchResult.QUERY_ID_FIELD,
@@ -130,20 +330,19 @@ class HMMSearchResult(SequenceSearchResult):
                        SequenceSearchResult.ALIGNMENT_DIRECTION,
                        ]
         
-        for row in [x.rstrip().split() for x in open(hmmout_path) if not x.startswith('#')]:
-            alifrom    = int(row[6])
-            alito      = int(row[7])
-            aln_length = (alito-alifrom if alito-alifrom>0 else alifrom-alito)
-            res.results.append([row[0],
-                                row[2],
-                                aln_length,
-                                int(row[4]),
-                                int(row[5]),
-                                alifrom,
-                                alito,
-                                row[13],
-                                alito > alifrom
-                                ])
+        alifrom = np.array([row[6] for row in rows], dtype=np.int64)
+        alito = np.array([row[7] for row in rows], dtype=np.int64)
+        res.set_columns({
+            SequenceSearchResult.QUERY_ID_FIELD: [row[0] for row in rows],
+            SequenceSearchResult.HMM_NAME_FIELD: [row[2] for row in rows],
+            SequenceSearchResult.ALIGNMENT_LENGTH_FIELD: np.abs(alito-alifrom),
+            SequenceSearchResult.QUERY_FROM_FIELD: [row[4] for row in rows],
+            SequenceSearchResult.QUERY_TO_FIELD: [row[5] for row in rows],
+            SequenceSearchResult.HIT_FROM_FIELD: alifrom,
+            SequenceSearchResult.HIT_TO_FIELD: alito,
+            SequenceSearchResult.ALIGNMENT_BIT_SCORE: [row[13] for row in rows],
+            SequenceSearchResult.ALIGNMENT_DIRECTION: alito > alifrom
+            })
         return res
     @staticmethod
     def import_from_hmmsearch_table(hmmout_path):
@@ -151,6 +350,14 @@ class HMMSearchResult(SequenceSearchResult):
         # hmmsearch format is
         # qseqid tlen queryname qlen evalue bitscore bias hmmfrom hmmto alifrom alito envfrom envto acc
         #    0    2       3      5     6        7     8      15    16     17     18      19    20   21
+        with open(hmmout_path) as f:
+            return HMMSearchResult.import_from_hmmsearch_rows(
+                [x.rstrip().split() for x in f if not x.startswith('#')])
+
+    @staticmethod
+    def import_from_hmmsearch_rows(rows):
+        '''Generate new results object from the rows of a hmmsearch domtblout
+        table, each a list of its whitespace separated fields'''
         res=HMMSearchResult()
         res.fields = [
                        SequenceSearchResult.QUERY_ID_FIELD,
@@ -166,23 +373,27 @@ class HMMSearchResult(SequenceSearchResult):
                        SequenceSearchResult.ALIGNMENT_DIRECTION,
                        ]
         
-        for row in [x.rstrip().split() for x in open(hmmout_path) if not x.startswith('#')]:
-            alifrom    = int(row[17])
-            alito      = int(row[18])
-            aln_length = (alito-alifrom if alito-alifrom>0 else alifrom-alito)
-            if alito != alifrom: #this actually happens..
-                res.results.append([row[0],
-                                    row[3],
-                                    row[4],
-                                    row[5],
-                                    aln_length,
-                                    int(row[15]),
-                                    int(row[16]),
-                                    alifrom,
-                                    alito,
-                                    row[7],
-                                    True
-                                    ])
+        alifrom = np.array([row[17] for row in rows], dtype=np.int64)
+        alito = np.array([row[18] for row in rows], dtype=np.int64)
+        keep = alito != alifrom #this actually happens..
+        if not keep.all():
+            rows = [row for row, k in itertools.izip(rows, keep) if k]
+            alifrom = alifrom[keep]
+            alito = alito[keep]
+        res.set_columns({
+            SequenceSearchResult.QUERY_ID_FIELD: [row[0] for row in rows],
+            SequenceSearchResult.HMM_NAME_FIELD: [row[3] for row in rows],
+            SequenceSearchResult.ACCESSION_ID_FIELD: [row[4] for row in rows],
+            SequenceSearchResult.QUERY_LENGTH_FIELD: [row[5] for row in rows],
+            SequenceSearchResult.ALIGNMENT_LENGTH_FIELD: np.abs(alito-alifrom),
+            SequenceSearchResult.QUERY_FROM_FIELD: [row[15] for row in rows],
+            SequenceSearchResult.QUERY_TO_FIELD: [row[16] for row in rows],
+            SequenceSearchResult.HIT_FROM_FIELD: alifrom,
+            SequenceSearchResult.HIT_TO_FIELD: alito,
+            SequenceSearchResult.ALIGNMENT_BIT_SCORE: [row[7] for row in rows],
+            SequenceSearchResult.ALIGNMENT_DIRECTION: np.ones(len(rows),
+                                                              dtype=np.bool_)
+            })
         return res
         
         
@@ -6,17 +6,22 @@ import itertools
 import logging
 import tempfile
 import subprocess
+import numpy as np
 
 from Bio import SeqIO
 from collections import OrderedDict
 from StringIO import StringIO
 
 from graftm.timeit import Timer
-from graftm.hmmsearcher import HmmSearcher, NhmmerSearcher
+from graftm.hmmsearcher import HmmSearcher, NhmmerSearcher, HmmDatabaseSearcher
+from graftm import kmer_prefilter
 from graftm.orfm import OrfM
+from graftm.orf_caller import OrfCaller
+from graftm.sequence_extractor import SequenceExtractor
+from graftm.read_decoder import ReadCapture
+from graftm.capture_index import CaptureIndexLoader
 from graftm.diamond import Diamond
 from graftm.sequence_search_results import SequenceSearchResult, HMMSearchResult
-from graftm.readHmmTable import HMMreader
 from graftm.db_search_results import DBSearchResult
 
 FORMAT_FASTA = "FORMAT_FASTA"
@@ -32,17 +37,175 @@ class InterleavedFileError(Exception):
     pass
 
 class SequenceSearcher:
+    # Searches with at least this many HMMs are run against a single database
+    # of all the HMMs rather than with each HMM in turn
+    DATABASE_SEARCH_MIN_HMMS = 24
 
-    def __init__(self, search_hmm, aln_hmm=None):
+    def __init__(self, search_hmm, aln_hmm=None, search_shards=1,
+                 kmer_prefilter=None, staged_euk_hmm=None,
+                 keep_diamond_daa=False, builtin_orf_caller=False):
         self.search_hmm = search_hmm
         self.aln_hmm = aln_hmm
+        self.search_shards = search_shards
+        # Path to a k-mer prefilter index which sequences must match to be
+        # searched with hmmsearch or nhmmer, or None to search all sequences
+        self.kmer_prefilter = kmer_prefilter
+        # (number of sequences read, number passed) for each prefiltered
+        # search
+        self.prefilter_statistics = []
+        # 18S HMM searched against only the reads which hit search_hmm, when
+        # checking for eukaryotic reads in stages, or None
+        self.staged_euk_hmm = staged_euk_hmm
+        # Keep the .daa file of diamond searches, rather than only reading
+        # diamond's tabular output
+        self.keep_diamond_daa = keep_diamond_daa
+        # Call ORFs with an OrfCaller as reads are decoded, rather than with
+        # OrfM, keeping them so that the ORFs of hit reads are not called
+        # again
+        self.builtin_orf_caller = builtin_orf_caller
+
+    def _sharding_arguments(self, unpack, nucleotide, orf_caller=None):
+        '''Return the number of shards to split the input of hmmsearch or
+        nhmmer into, and arguments fixing the database size. This is fixed
+        when the input is split into shards, so that E-values are the same
+        in each shard, and when it is prefiltered or dereplicated, so that
+        E-values are those of the whole input rather than of the sequences
+        which pass the prefilter or are not duplicates. The database size is estimated from the input profile, in
+        sequences for hmmsearch or in megabases for nhmmer, as their -Z
+        options expect. When hmmsearch searches the ORFs called by
+        orf_caller, the sequences are the ORFs rather than the reads.'''
+        if self.search_shards <= 1 and not self.kmer_prefilter and \
+            not unpack.dereplicate:
+            return 1, ''
+        if nucleotide:
+            database_size = unpack.profile().estimated_base_count()
+            if database_size is not None:
+                database_size = '%f' % (database_size / 1e6)
+        else:
+            database_size = self._estimated_sequence_count(unpack, orf_caller)
+        if not database_size:
+            if self.search_shards > 1:
+                logging.warn("Unable to estimate the size of %s, so not "
+                             "splitting it into shards" % unpack.read_file)
+            if self.kmer_prefilter:
+                logging.warn("Unable to estimate the size of %s, so E-values "
+                             "will be calculated for only the sequences which "
+                             "pass the k-mer prefilter" % unpack.read_file)
+            if unpack.dereplicate:
+                logging.warn("Unable to estimate the size of %s, so E-values "
+                             "will be calculated for only the reads which are "
+                             "not duplicates" % unpack.read_file)
+            return 1, ''
+        num_shards = max(1, self.search_shards)
+        logging.debug("Searching %i shards with a database size of %s" % \
+                      (num_shards, database_size))
+        return num_shards, ' -Z %s' % database_size
+
+    def _estimated_sequence_count(self, unpack, orf_caller):
+        '''Return the approximate number of sequences hmmsearch searches,
+        which are the ORFs called by orf_caller if it is not None, or else the
+        reads, or None if unknown'''
+        if orf_caller is None:
+            return unpack.profile().estimated_read_count
+        return unpack.estimated_orf_count(orf_caller)
+
+    def _target_weight(self, unpack, orf_caller):
+        '''Return a function of the name of a sequence searched returning the
+        number of input sequences it stands for, i.e. itself and the copies
+        of it in the reads which dereplication left out, or None if unpack
+        is not dereplicated. The sequences are the ORFs called by orf_caller
+        if it is not None, else the reads. Duplicates are read when the
+        function is first called, once the search has finished.'''
+        if not unpack.dereplicate:
+            return None
+        orfm_regex = OrfM.regular_expression() if orf_caller else None
+        loaded = {}
+        def weight(name):
+            if 'duplicates' not in loaded:
+                loaded['duplicates'] = unpack.duplicates()
+            duplicates = loaded['duplicates']
+            if orfm_regex is not None and name not in duplicates:
+                match = orfm_regex.match(name)
+                if match:
+                    name = match.group(1)
+            return 1 + len(duplicates.get(name, []))
+        return weight
+
+    def _prefiltered_command(self, input_cmd):
+        '''Return input_cmd piped through the k-mer prefilter, if there is
+        one, and the path the prefilter writes its statistics to, or None'''
+        if not self.kmer_prefilter:
+            return input_cmd, None
+        fd, statistics_path = tempfile.mkstemp(prefix='graftm_prefilter')
+        os.close(fd)
+        return "%s | %s" % (input_cmd, kmer_prefilter.command_line(
+            self.kmer_prefilter, statistics_path)), statistics_path
+
+    def _record_prefilter_statistics(self, statistics_path):
+        '''Log and remember the number of sequences removed by the k-mer
+        prefilter, then remove its statistics file'''
+        if statistics_path is None:
+            return
+        try:
+            if os.path.getsize(statistics_path) == 0:
+                # The prefilter did not finish, e.g. the search failed
+                return
+            num_read, num_passed = kmer_prefilter.read_statistics(statistics_path)
+        finally:
+            os.remove(statistics_path)
+        self.prefilter_statistics.append((num_read, num_passed))
+        logging.info("K-mer prefilter removed %i of %i sequences (%.1f%%)" % \
+                     (num_read-num_passed, num_read,
+                      100.0*(num_read-num_passed)/num_read if num_read else 0))
+
+    def _hmm_searcher(self, unpack, threads, cutoff_args, sharding_args,
+                      num_shards, orf_caller=None, domain_evalue=None,
+                      target_weight=None):
+        '''Return a searcher for the search HMMs. When there are many HMMs
+        they are searched as a single database, using hmmscan if there are
+        fewer sequences than HMMs, which are the ORFs called by orf_caller if
+        it is not None, and the HMMs' TC cutoffs are used. Searching is done
+        with each HMM in turn if the input is sharded or if the results
+        cannot be split by HMM name.
+        domain_evalue is the --domE cutoff, if any, which the searcher
+        applies itself since a sharded or dereplicated search cannot pass it
+        to hmmsearch, and target_weight is as per _target_weight.'''
+        if len(self.search_hmm) >= self.DATABASE_SEARCH_MIN_HMMS and \
+            num_shards == 1:
+            if HmmDatabaseSearcher.names_are_unique(self.search_hmm):
+                num_sequences = self._estimated_sequence_count(unpack,
+                                                               orf_caller)
+                # hmmscan calculates domain E-values from the number of HMMs
+                # each sequence hits (domZ) rather than the number of
+                # sequences each HMM hits, so it is only used when domains
+                # are not filtered by E-value
+                if domain_evalue is None and num_sequences is not None and \
+                    num_sequences < len(self.search_hmm):
+                    # -Z since hmmscan would otherwise calculate E-values
+                    # from the number of HMMs rather than the number of
+                    # sequences
+                    logging.debug("Searching %i HMMs as a database with hmmscan" % \
+                                  len(self.search_hmm))
+                    return HmmDatabaseSearcher(
+                        threads, '%s -Z %i' % (cutoff_args, max(1, num_sequences)),
+                        scan=True)
+                logging.debug("Searching %i HMMs as a database" % \
+                              len(self.search_hmm))
+                return HmmDatabaseSearcher(threads, cutoff_args+sharding_args,
+                                           domain_evalue=domain_evalue,
+                                           target_weight=target_weight)
+            logging.debug("Not searching HMMs as a database since HMM names "
+                          "are not unique")
+        return HmmSearcher(threads, cutoff_args+sharding_args, num_shards,
+                           domain_evalue, target_weight)
 
     def _get_sequence_directions(self, search_result):
-        sequence_directions = {}
-        for result in search_result:
-            for hit in result.each([SequenceSearchResult.QUERY_ID_FIELD, SequenceSearchResult.ALIGNMENT_DIRECTION]):
-                sequence_directions[hit[0]]  ={"strand":[hit[1]], "entry": []}
-        return sequence_directions
+        # The direction of the last hit of each read is used
+        combined = SequenceSearchResult.concatenate(search_result)
+        rows = combined.last_rows()
+        directions = combined.column(SequenceSearchResult.ALIGNMENT_DIRECTION)[rows].tolist()
+        return {query: {"strand": [direction], "entry": []} for query, direction \
+                in zip(combined.queries(), directions)}
 
 
     def _hmmalign(self, input_path, directions, pipeline,
@@ -177,10 +340,12 @@ class SequenceSearcher:
             cutoff for HMMsearch to use, either an evalue or --cut_tc, meaning
             use the TC score cutoff specified within the HMM. Passed to 
             HMMsearch command.
-        orfm : OrfM
+        orfm : OrfM or OrfCaller
             Object that builds the command chunk for calling ORFs on sequences
             coming through as stdin. Outputs to stdout. Calls command_line
-            to construct final command line string.
+            to construct final command line string. An OrfCaller calls ORFs
+            as the reads are decoded instead, see
+            UnpackRawReads.orf_command_line.
 
         Returns
         -------
@@ -207,20 +372,34 @@ class SequenceSearcher:
 
         # Choose an input to this base command based off the file format found.
         if seq_type == 'nucleotide':  # If the input is nucleotide sequence
-            input_cmd = orfm.command_line(input_path)
+            if isinstance(orfm, OrfCaller):
+                input_cmd = unpack.orf_command_line(orfm)
+            else:
+                input_cmd = orfm.command_line(input_path)
         elif seq_type == 'aminoacid':  # If the input is amino acid sequence
             input_cmd = unpack.command_line()
         else:
             raise Exception('Programming Error: error guessing input sequence type')
+        input_cmd, prefilter_statistics = self._prefiltered_command(input_cmd)
         
         # Run the HMMsearches
+        orf_caller = orfm if seq_type == 'nucleotide' else None
+        num_shards, sharding_args = self._sharding_arguments(unpack, False,
+                                                             orf_caller)
         if cutoff == "--cut_tc":
-            searcher = HmmSearcher(threads, cutoff) 
+            searcher = self._hmm_searcher(unpack, threads, cutoff,
+                                          sharding_args, num_shards,
+                                          orf_caller)
         else:
-            searcher = HmmSearcher(threads, '--domE %s' % cutoff)
-        searcher.hmmsearch(input_cmd, self.search_hmm, output_table_list)
-
-        hmmtables = [HMMSearchResult.import_from_hmmsearch_table(x) for x in output_table_list]
+            searcher = self._hmm_searcher(
+                unpack, threads, '', sharding_args, num_shards, orf_caller,
+                domain_evalue=cutoff,
+                target_weight=self._target_weight(unpack, orf_caller))
+        try:
+            hmmtables = searcher.hmmsearch(input_cmd, self.search_hmm,
+                                           output_table_list)
+        finally:
+            self._record_prefilter_statistics(prefilter_statistics)
         return hmmtables
 
     def merge_forev_aln(self, forward_aln_list, reverse_aln_list, outputs):
@@ -370,65 +549,124 @@ class SequenceSearcher:
             output_table_list.append(output_path)
         else:
             raise Exception("Programming error: Expected 1 or more HMMs")
-        input_pipe = unpack.command_line()
-
-        searcher = NhmmerSearcher(threads, extra_args='--incE %s -E %s' % (evalue, evalue))
-        searcher.hmmsearch(input_pipe, self.search_hmm, output_table_list)
+        input_pipe, prefilter_statistics = self._prefiltered_command(
+            unpack.command_line())
 
-        hmmtables = [HMMSearchResult.import_from_nhmmer_table(x) for x in output_table_list]
+        num_shards, sharding_args = self._sharding_arguments(unpack, True)
+        searcher = NhmmerSearcher(threads,
+                                  extra_args='--incE %s -E %s' % (evalue, evalue) + sharding_args,
+                                  num_shards=num_shards)
+        try:
+            hmmtables = searcher.hmmsearch(input_pipe, self.search_hmm,
+                                           output_table_list)
+        finally:
+            self._record_prefilter_statistics(prefilter_statistics)
 
         return hmmtables, output_table_list
 
-    def _check_euk_contamination(self, hmm_hit_tables):
+    def _staged_euk_search(self, output_path, reads_path, unpack, threads,
+                           evalue):
+        '''Search reads which hit the search HMMs with the 18S HMM, so that
+        they can be checked for eukaryotic reads without searching all the
+        input reads with the 18S HMM. The database size is that of the whole
+        input, so that E-values are those of searching all the reads.
+
+        Parameters
+        ----------
+        output_path : str
+            path of the nhmmer table of the search HMMs. The 18S table is
+            named after it as when searching with each HMM in turn.
+        reads_path : str
+            path to the reads which hit the search HMMs, in FASTA format
+        unpack : UnpackRawReads
+            the input reads
+        threads : str
+            Number of threads to run
+        evalue : str
+            evalue to use
+
+        Returns
+        -------
+        HMMSearchResult of the 18S HMM
+        '''
+        euk_output_path = os.path.join(os.path.split(output_path)[0],
+                                       os.path.basename(self.staged_euk_hmm).split('.')[0] + \
+                                       '_' + os.path.split(output_path)[1])
+        database_size = unpack.profile().estimated_base_count()
+        if database_size is None:
+            logging.warn("Unable to estimate the size of %s, so E-values of "
+                         "the eukaryote check will be calculated for only the "
+                         "reads which hit" % unpack.read_file)
+            sharding_args = ''
+        else:
+            sharding_args = ' -Z %f' % (database_size / 1e6)
+        logging.debug("Searching reads which hit with the 18S HMM")
+        searcher = NhmmerSearcher(threads,
+                                  extra_args='--incE %s -E %s' % (evalue, evalue) + sharding_args)
+        return searcher.hmmsearch("cat '%s'" % reads_path,
+                                  [self.staged_euk_hmm], [euk_output_path])[0]
+
+    def _read_bit_scores(self, search_result):
+        '''Return an array of the name of each read in search_result, and an
+        array of the lowest bit score of its hits'''
+        names = np.empty(len(search_result.queries()), dtype=object)
+        names[:] = search_result.queries()
+        rows = search_result.best_rows(lowest=True)
+        bit_scores = search_result.column(SequenceSearchResult.ALIGNMENT_BIT_SCORE)
+        return names, bit_scores[rows]
+
+    def _check_euk_contamination(self, search_results):
         '''
-        check_euk_contamination - Check output HMM tables hits reads that hit
+        check_euk_contamination - Check search results for reads that hit
                                   the 18S HMM with a higher bit score.
 
         Parameters
         ----------
-        hmm_hit_tables : array
-            Array of paths to the output files produced by hmmsearch or
-            nhmmer.
-        run_stats : dict
-            A dictionary to updatewith the number of unique 18S reads and reads
-            detected by both 18S and non-18S HMMs
+        search_results : array
+            Array of HMMSearchResult, one for each HMM searched with, the
+            last of which is the 18S HMM.
 
         Returns
         -------
         euk_reads : set
             Non-redundant set of all read names deemed to be eukaryotic
         '''
-        
-        euk_hit_table = HMMreader(hmm_hit_tables.pop(-1))
-        other_hit_tables = [HMMreader(x) for x in hmm_hit_tables]
-        reads_unique_to_eukaryotes = []
-        reads_with_better_euk_hit = []
-
-        for hit in euk_hit_table.names():
-            bits = []
-            for hit_table in other_hit_tables:
-                if hit in hit_table.names():
-                    bits.append(hit_table.bit(hit))
-                else:
-                    reads_unique_to_eukaryotes.append(hit)
-            if bits:
-                if any([x for x in bits if x > euk_hit_table.bit(hit)]):
-                    continue
-                else:
-                    reads_with_better_euk_hit.append(hit)
-            else:
-                continue
-
-        if len(reads_with_better_euk_hit) == 0:
+        euk_names, euk_bit_scores = self._read_bit_scores(search_results[-1])
+        # Reads which are missing from the hits of any other HMM are unique to
+        # eukaryotes. Otherwise, a read is eukaryotic if none of the other
+        # HMMs it hit gave a higher bit score.
+        unique_to_eukaryotes = np.zeros(len(euk_names), dtype=bool)
+        hit_other = np.zeros(len(euk_names), dtype=bool)
+        best_other_bit_scores = np.full(len(euk_names), -np.inf)
+        for search_result in search_results[:-1]:
+            names, bit_scores = self._read_bit_scores(search_result)
+            _, euk_indices, indices = np.intersect1d(
+                euk_names, names, assume_unique=True, return_indices=True)
+            found = np.zeros(len(euk_names), dtype=bool)
+            found[euk_indices] = True
+            unique_to_eukaryotes |= ~found
+            hit_other |= found
+            best_other_bit_scores[euk_indices] = np.maximum(
+                best_other_bit_scores[euk_indices], bit_scores[indices])
+        better_euk_hit = hit_other & (best_other_bit_scores <= euk_bit_scores)
+
+        euk_reads = set(euk_names[unique_to_eukaryotes | better_euk_hit].tolist())
+        if len(euk_reads) == 0:
             logging.info("No contaminating eukaryotic reads detected")
         else:
-            logging.info("Found %s read(s) that may be eukaryotic" % len(reads_with_better_euk_hit + reads_unique_to_eukaryotes))
-
-        euk_reads = set(reads_with_better_euk_hit + reads_unique_to_eukaryotes)
+            logging.info("Found %s read(s) that may be eukaryotic" % len(euk_reads))
 
         return euk_reads
 
 
+    def _remove_euk_reads(self, search_result, hits):
+        '''Return hits without the reads found to be eukaryotic by
+        _check_euk_contamination, and a list of the number of eukaryotic reads
+        and the number of reads remaining'''
+        euk_reads = self._check_euk_contamination(search_result)
+        hits = {key:item for key, item in hits.iteritems() if key not in euk_reads}
+        return hits, [len(euk_reads), len(hits)]
+
     def _extract_multiple_hits(self, hits, reads_path, output_path):
         '''
         splits out regions of a read that hit the HMM. For example when two of
@@ -487,11 +725,20 @@ deal with these, so please remove/rename sequences with duplicate keys.")
         
         return complement_information
 
-    def _extract_from_raw_reads(self, output_path, input_reads, raw_sequences_path, input_file_format, hits):
+    def _capture_index_loader(self, unpack):
+        '''Return a CaptureIndexLoader which loads the index of the reads
+        captured while unpack is searched, as they are captured, or None if
+        the reads are not captured'''
+        capture = unpack.read_capture()
+        if isinstance(capture, ReadCapture):
+            return CaptureIndexLoader(capture)
+        return None
+
+    def _extract_from_raw_reads(self, output_path, input_reads, raw_sequences_path, input_file_format, hits, read_capture=None, capture_index=None):
         '''
-        _extract_from_raw_reads - call fxtract to extract the hit sequences
-        of the hmm/diamond search from the raw sequences file. Output into
-        specified file
+        _extract_from_raw_reads - extract the hit sequences of the
+        hmm/diamond search from the reads captured during the search, or
+        failing that from the raw sequences file. Output into specified file
 
         Parameters
         ----------
@@ -506,6 +753,12 @@ deal with these, so please remove/rename sequences with duplicate keys.")
             FORMAT_FASTA, denoting the format of the input sequence
         hits : dict
             A hash with the readnames as the keys and the spans as the values
+        read_capture : ReadCapture
+            Reads kept while they were searched (see
+            UnpackRawReads.read_capture()), or None
+        capture_index : CaptureIndexLoader
+            Loader of the index of read_capture started before the search, or
+            None
 
         Returns
         -------
@@ -523,19 +776,44 @@ deal with these, so please remove/rename sequences with duplicate keys.")
         '''
 
         with tempfile.NamedTemporaryFile(prefix='_raw_extracted_reads.fa') as tmp:
-            # Run fxtract to obtain reads form original sequence file
-            fxtract_cmd = "fxtract -H -X -f /dev/stdin " 
-            cmd = "%s %s > %s" % (fxtract_cmd, raw_sequences_path, tmp.name)
-    
-            logging.debug("Running fxtract: %s", cmd)
-            
-            process = subprocess.Popen(["bash", "-c", cmd], 
-                                       stdin=subprocess.PIPE,
-                                       stdout=subprocess.PIPE)
-            process.communicate('\n'.join(input_reads))
+            self._extract_reads(tmp.name, input_reads, raw_sequences_path,
+                                read_capture, capture_index)
             complement_info = self._extract_multiple_hits(hits, tmp.name, output_path)  # split them into multiple reads
         
         return output_path, complement_info
+
+    def _extract_reads(self, output_path, input_reads, raw_sequences_path,
+                       read_capture=None, capture_index=None):
+        '''Write the reads named in input_reads to output_path in FASTA
+        format, from the reads captured during the search, or failing that
+        from the raw sequences file. Parameters are as per
+        _extract_from_raw_reads.'''
+        if read_capture is not None and read_capture.is_complete():
+            logging.debug("Extracting reads from capture %s",
+                          read_capture.index_path)
+            if capture_index is not None:
+                capture_index.extract(input_reads, output_path)
+            else:
+                read_capture.extract(input_reads, output_path)
+        else:
+            if capture_index is not None:
+                capture_index.stop()
+            if read_capture is not None:
+                logging.warn("Reads were not completely captured during "
+                             "the search, reading the input again")
+            # Read the original sequence file again to obtain the reads
+            cmd = "cat %s" % raw_sequences_path
+            logging.debug("Extracting reads from: %s", cmd)
+
+            process = subprocess.Popen(["bash", "-c", cmd],
+                                       stdout=subprocess.PIPE)
+            with open(output_path, 'w') as out:
+                SequenceExtractor().extract_from_stream(input_reads,
+                                                        process.stdout,
+                                                        out)
+            process.stdout.close()
+            if process.wait() != 0:
+                raise Exception("Command failed: %s" % cmd)
         
 
     def alignment_correcter(self, alignment_file_list, output_file_name,
@@ -623,13 +901,11 @@ deal with these, so please remove/rename sequences with duplicate keys.")
         '''
         
         if search_method == "hmmsearch":
-            # Build and run command to extract ORF sequences:
-            orfm_cmd = orfm.command_line()
-            cmd = 'fxtract -H -X -f /dev/stdin <(%s %s) > %s' % (orfm_cmd, input_path, output_path)
-            process = subprocess.Popen(["bash", "-c", cmd],
-                                       stdin=subprocess.PIPE,
-                                       stdout=subprocess.PIPE)
-            process.communicate('\n'.join(hit_readnames))
+            # Call ORFs on the hit reads, then extract the ORFs that hit
+            with tempfile.NamedTemporaryFile(prefix='graftm_orfs', suffix='.fa') as orfs:
+                cmd = '%s %s > %s' % (orfm.command_line(), input_path, orfs.name)
+                extern.run(cmd)
+                SequenceExtractor().extract(hit_readnames, orfs.name, output_path)
 
         elif search_method == "diamond":
             sequence_frame_info_dict = {x[0]:[x[1], x[2], x[3]] for x in sequence_frame_info_list}
@@ -676,87 +952,110 @@ deal with these, so please remove/rename sequences with duplicate keys.")
         '''
 
         splits = {}  # Define an output dictionary to be filled
+        combined = SequenceSearchResult.concatenate(search_result)
+        query_numbers, queries = combined.name_numbers(SequenceSearchResult.QUERY_ID_FIELD)
+        hit_from = combined.column(SequenceSearchResult.HIT_FROM_FIELD)
+        hit_to = combined.column(SequenceSearchResult.HIT_TO_FIELD)
+        query_from = combined.column(SequenceSearchResult.QUERY_FROM_FIELD)
+        query_to = combined.column(SequenceSearchResult.QUERY_TO_FIELD)
+        directions = combined.column(SequenceSearchResult.ALIGNMENT_DIRECTION)
+        ft_starts = np.minimum(hit_from, hit_to) # span of each hit on the query
+        ft_ends = np.maximum(hit_from, hit_to)
+        qs_starts = np.minimum(query_from, query_to) # span of each hit on the HMM
+        qs_ends = np.maximum(query_from, query_to)
+        keep = ft_starts != ft_ends  # hits which cover none of the query are skipped (seen this before)
+
+        # Reads with a single hit need no linking, so are added directly
+        hits = np.bincount(query_numbers[keep], minlength=len(queries))
+        single = keep & (hits[query_numbers] == 1)
+        for q, start, end, qs_start, qs_end, c in zip(
+            query_numbers[single].tolist(),
+            ft_starts[single].tolist(),
+            ft_ends[single].tolist(),
+            qs_starts[single].tolist(),
+            qs_ends[single].tolist(),
+            directions[single].tolist()):
+            splits[queries[q]] = {'span'      : [[start, end]],
+                                  'strand'    : [c],
+                                  'query_span': [[qs_start, qs_end]]}
+
+        # The hits of other reads are linked a read at a time, in their
+        # original order
+        rows = np.flatnonzero(keep & ~single)
+        rows = rows[np.argsort(query_numbers[rows], kind='mergesort')]
+        reads, firsts = np.unique(query_numbers[rows], return_index=True)
+        firsts = firsts.tolist()
+        hits = zip(ft_starts[rows].tolist(),
+                   ft_ends[rows].tolist(),
+                   qs_starts[rows].tolist(),
+                   qs_ends[rows].tolist(),
+                   directions[rows].tolist())
+        for q, first, last in zip(reads.tolist(), firsts, firsts[1:]+[len(rows)]):
+            splits[queries[q]] = self._link_hits(hits[first:last], max_range)
+        return {key: {"entry":entry['span'], 'strand': entry['strand']} for key, entry in splits.iteritems()}  # return the dict, without strand information which isn't required.
+
+    def _link_hits(self, hits, max_range):
+        '''Link the hits of a single read, as described in _get_read_names.
+        Overlaps are measured by interval arithmetic, so the time taken does
+        not depend on the length of the hits.
+
+        Parameters
+        ----------
+        hits : list
+            (start, end) of each hit on the read, (start, end) of the hit
+            on the HMM, and the direction of the hit, each with start < end,
+            in the order the hits were found.
+        max_range : int
+            as per _get_read_names
+
+        Returns
+        -------
+            dict of the 'span', 'strand' and 'query_span' of each linked hit
+        '''
         spans = []
-        for result in search_result:  # Create a table (list of rows contain span, and complement information
-            spans += list(
-                         result.each(
-                                    [SequenceSearchResult.QUERY_ID_FIELD,
-                                        SequenceSearchResult.ALIGNMENT_DIRECTION,
-                                        SequenceSearchResult.HIT_FROM_FIELD,
-                                        SequenceSearchResult.HIT_TO_FIELD,
-                                        SequenceSearchResult.QUERY_FROM_FIELD,
-                                        SequenceSearchResult.QUERY_TO_FIELD]
-                                       )
-                         )
-
-        for hit in spans:  # For each of these rows (i.e. hits)
-            i = hit[0]  # set id to i
-            c = hit[1]  # set complement to c
-            ft = [min(hit[2:4]), max(hit[2:4])]  # set span as ft (i.e. from - to) - This is the amount covering the query
-            qs = [min(hit[4:6]), max(hit[4:6])]  # seq the query span to qs - This is the amount covering the HMM
-
-            if ft[0] == ft[1]: continue  # if the span covers none of the query, skip that entry (seen this before)
-
-            if i not in splits:  # If the hit hasnt been seen yet
-                splits[i] = {'span'       : [ft],
-                             'strand'     : [c],
-                             'query_span' : [qs]}  # add the span and complement as new entry
-
-            else:  # otherwise (if it has been seen)
-                for idx, entry in enumerate(splits[i]['span']):  # for each previously added entry
-                    if splits[i]['strand'][idx] != c:  # If the hit is on the same complement strand
-                        splits[i]['span'].append(ft)  # Add the new range to be split out in the future
-                        splits[i]['strand'].append(c)  # Add the complement strand as well
-                        splits[i]['query_span'].append(qs)
+        strands = []
+        query_spans = []
+        for ft_start, ft_end, qs_start, qs_end, c in hits:
+            ft = [ft_start, ft_end]  # span over the read
+            for idx, entry in enumerate(spans):
+                if strands[idx] != c:  # hits on different strands are not linked
+                    break
+
+                previous_qs = query_spans[idx]
+                query_overlap = min(previous_qs[1], qs_end) - max(previous_qs[0], qs_start)
+                if query_overlap > 0:
+                    # Hits which overlap by at least PREVIOUS_SPAN_CUTOFF on the
+                    # read are the same hit, and ignored
+                    intersection = float(min(entry[1], ft_end) - max(entry[0], ft_start))
+                    if intersection / (entry[1] - entry[0]) >= PREVIOUS_SPAN_CUTOFF:
+                        ft = None
+                        break
+                    elif intersection / (ft_end - ft_start) >= PREVIOUS_SPAN_CUTOFF:
+                        ft = None
+                        break
+                    # Hits which do not overlap on the read but cover the same
+                    # region of the HMM are separate hits
+                    elif query_overlap > (qs_end - qs_start)*PREVIOUS_SPAN_CUTOFF and \
+                        idx+1 == len(spans):
                         break
 
-                    previous_qs      = splits[i]['query_span'][idx] # Get the query span of the previous hit
-
-                    previous_q_range = set(range(previous_qs[0], previous_qs[1])) # Get the range of each
-                    current_q_range  = set(range(qs[0], qs[1]))
-                    query_overlap    = set(previous_q_range).intersection(current_q_range) # Find the intersection between the two ranges
-
-                    previous_ft_span = set(range(entry[0], entry[1]))
-                    current_ft_span  = set(range(ft[0], ft[1]))
-                    if any(query_overlap): # If there is an overlap
-                        ####################################################
-                        # if the span over the actual read that hit the HMM
-                        # for each hit overlap by > 25%, they are considered
-                        # the same hit, and ignored
-                        ####################################################
-                        intersection_fraction = float(len(previous_ft_span.intersection(current_ft_span)))
-
-                        if intersection_fraction / float(len(previous_ft_span)) >= PREVIOUS_SPAN_CUTOFF:
-                            break
-                        elif intersection_fraction / float(len(current_ft_span)) >= PREVIOUS_SPAN_CUTOFF:
-                            break
-                        else: # else (i.e. if the hit covers less that 25% of the sequence of the previous hit)
-                            ####################################################
-                            # If they made it this far, it means that the hits do not overlap.
-                            # But one last check must be made to ensure they do not cover the same
-                            # region in the HMM.
-                            ####################################################
-                            if len(query_overlap) > (len(current_q_range)*PREVIOUS_SPAN_CUTOFF): # if the overlap on the query HMM does not span over 25%
-                                if (idx+1) == len(splits[i]['span']):
-                                    splits[i]['span'].append(ft) # Add from-to as another entry, this is another hit.
-                                    splits[i]['strand'].append(c) # Add strand info as well
-                                    splits[i]['query_span'].append(qs)
-                                    break # And break
-
-                    if min(entry) < min(ft):  # if/else to determine which entry comes first (e.g. 1-5, 6-10 not 6-10, 1-5)
-                        if max(ft) - min(entry) < max_range:  # Check if they lie within range of eachother
-                            entry[1] = max(ft)  # ammend the entry if they are
-                            break  # And break the loop
-                    else:
-                        if max(entry) - min(ft) < max_range:  # Check if they lie within range of eachother
-                            entry[0] = min(ft)  # ammend the entry if they are
-                            break  # And break the loop
-
-                else:  # if no break occured (no overlap)
-                    splits[i]['span'].append(ft)  # Add the new range to be split out in the future
-                    splits[i]['strand'].append(c)  # Add the complement strand as well
-                    splits[i]['query_span'].append(qs)
-        return {key: {"entry":entry['span'], 'strand': entry['strand']} for key, entry in splits.iteritems()}  # return the dict, without strand information which isn't required.
+                # Link hits which lie within range of each other
+                if entry[0] < ft_start:
+                    if ft_end - entry[0] < max_range:
+                        entry[1] = ft_end
+                        ft = None
+                        break
+                else:
+                    if entry[1] - ft_start < max_range:
+                        entry[0] = ft_start
+                        ft = None
+                        break
+
+            if ft is not None:  # Add the hit as a new entry
+                spans.append(ft)
+                strands.append(c)
+                query_spans.append([qs_start, qs_end])
+        return {'span': spans, 'strand': strands, 'query_span': query_spans}
 
     def _check_for_slash_endings(self, readnames):
         '''
@@ -893,38 +1192,50 @@ deal with these, so please remove/rename sequences with duplicate keys.")
         
         '''
 
-        orfm = OrfM(min_orf_length=min_orf_length,
-                     restrict_read_length=restrict_read_length)
+        if self.builtin_orf_caller:
+            orfm = OrfCaller(min_orf_length=min_orf_length,
+                             restrict_read_length=restrict_read_length)
+        else:
+            orfm = OrfM(min_orf_length=min_orf_length,
+                        restrict_read_length=restrict_read_length)
         extracting_orfm = OrfM(min_orf_length=min_orf_length,
                       restrict_read_length=restrict_read_length)
 
-        if search_method == 'hmmsearch':
-            # run hmmsearch
-            search_result = self.hmmsearch(
-                                           output_search_file,
-                                           unpack.get_file_as_process(),
-                                           unpack,
-                                           unpack.sequence_type(),
-                                           threads,
-                                           evalue,
-                                           orfm
-                                           )
-
-        elif search_method == 'diamond':
-            # run diamond
-            search_result = Diamond(
-                                     database=diamond_database,
-                                     threads=threads,
-                                     evalue=evalue,
-                                     ).run(
-                                           unpack.get_file_as_process(),
-                                           unpack.sequence_type(),
-                                           daa_file_basename=output_search_file
-                                           )
-            search_result = [search_result]
-
-        else:  # if the search_method isn't recognised
-            raise Exception("Programming error: unexpected search_method %s" % search_method)
+        # The index of the captured reads is loaded during the search
+        capture_index = self._capture_index_loader(unpack)
+        try:
+            if search_method == 'hmmsearch':
+                # run hmmsearch
+                search_result = self.hmmsearch(
+                                               output_search_file,
+                                               unpack.get_file_as_process(),
+                                               unpack,
+                                               unpack.sequence_type(),
+                                               threads,
+                                               evalue,
+                                               orfm
+                                               )
+
+            elif search_method == 'diamond':
+                # run diamond
+                search_result = Diamond(
+                                         database=diamond_database,
+                                         threads=threads,
+                                         evalue=evalue,
+                                         ).run(
+                                               unpack.get_file_as_process(),
+                                               unpack.sequence_type(),
+                                               daa_file_basename=output_search_file,
+                                               keep_daa=self.keep_diamond_daa
+                                               )
+                search_result = [search_result]
+
+            else:  # if the search_method isn't recognised
+                raise Exception("Programming error: unexpected search_method %s" % search_method)
+        except:
+            if capture_index is not None:
+                capture_index.stop()
+            raise
 
         orfm_regex = OrfM.regular_expression()
         
@@ -942,7 +1253,9 @@ deal with these, so please remove/rename sequences with duplicate keys.")
                                                        hit_readnames,
                                                        unpack.get_file_as_process(),
                                                        unpack.format(),
-                                                       hits
+                                                       hits,
+                                                       unpack.read_capture(),
+                                                       capture_index
                                                        )
 
         
@@ -956,7 +1269,15 @@ deal with these, so please remove/rename sequences with duplicate keys.")
             return result, direction_information
 
 
-        if unpack.sequence_type() == 'nucleotide':
+        if unpack.sequence_type() == 'nucleotide' and \
+            isinstance(orfm, OrfCaller) and search_method == 'hmmsearch':
+            # The ORFs that hit were kept when they were called for the
+            # search
+            unpack.orf_capture().extract(orf_hit_readnames,
+                                         hit_reads_orfs_fasta)
+            hit_reads_fasta = hit_reads_orfs_fasta
+            diamond_result = None
+        elif unpack.sequence_type() == 'nucleotide':
             # Extract the orfs of these reads that hit the original search
             self._extract_orfs(
                                hit_reads_fasta,
@@ -972,11 +1293,19 @@ deal with these, so please remove/rename sequences with duplicate keys.")
                                )
             
             hit_reads_fasta = hit_reads_orfs_fasta
+            diamond_result = None
+        elif search_method == 'diamond':
+            # The hit sequences are those searched, so their diamond hits
+            # can be reused
+            diamond_result = search_result[0]
+        else:
+            diamond_result = None
         slash_endings=self._check_for_slash_endings(hit_readnames)
         result = DBSearchResult(hit_reads_fasta,
                                 search_result,
                                 [0, len([itertools.chain(*hits.values())])],  # array of hits [euk hits, true hits]. Euk hits alway 0 unless searching from 16S
-                                slash_endings)  # Any reads that end in /1 or /2     
+                                slash_endings,  # Any reads that end in /1 or /2     
+                                diamond_result)
 
         if maximum_range:
             n_hits = sum([len(x["strand"]) for x in hits.values()])
@@ -1073,14 +1402,22 @@ deal with these, so please remove/rename sequences with duplicate keys.")
         information
         '''
 
+        capture_index = None
         if search_method == "hmmsearch":
-            # First search the reads using the HMM
-            search_result, table_list = self.nhmmer(
-                                                    hmmsearch_output_table,
-                                                    unpack,
-                                                    threads,
-                                                    evalue
-                                                    )
+            # The index of the captured reads is loaded during the search
+            capture_index = self._capture_index_loader(unpack)
+            try:
+                # First search the reads using the HMM
+                search_result, _ = self.nhmmer(
+                                               hmmsearch_output_table,
+                                               unpack,
+                                               threads,
+                                               evalue
+                                               )
+            except:
+                if capture_index is not None:
+                    capture_index.stop()
+                raise
 
 
         elif search_method == 'diamond':
@@ -1096,24 +1433,34 @@ deal with these, so please remove/rename sequences with duplicate keys.")
         else:   
             hits = self._get_sequence_directions(search_result)
 
-        hit_readnames = hits.keys()
-        
-        if euk_check:
-            euk_reads = self._check_euk_contamination(table_list)
-            hit_readnames = set([read for read in hit_readnames if read not in euk_reads])
-            hits = {key:item for key, item in  hits.iteritems() if key in hit_readnames}
-            hit_read_count = [len(euk_reads), len(hit_readnames)]
+        # When checking for eukaryotic reads in stages, only the reads
+        # which hit are searched with the 18S HMM, once they are extracted
+        staged_euk_check = euk_check and self.staged_euk_hmm is not None
+        if euk_check and not staged_euk_check:
+            hits, hit_read_count = self._remove_euk_reads(search_result, hits)
         else:
-            hit_read_count = [0, len(hit_readnames)]
-        
-        hit_reads_fasta, direction_information = self._extract_from_raw_reads(
-                                                       hit_reads_fasta,
-                                                       hit_readnames,
-                                                       unpack.get_file_as_process(),
-                                                       unpack.format(),
-                                                       hits
-                                                       )
-        
+            hit_read_count = [0, len(hits)]
+
+        with tempfile.NamedTemporaryFile(prefix='_raw_extracted_reads.fa') as tmp:
+            self._extract_reads(tmp.name,
+                                hits.keys(),
+                                unpack.get_file_as_process(),
+                                unpack.read_capture(),
+                                capture_index)
+            if staged_euk_check:
+                if hits:
+                    euk_result = self._staged_euk_search(hmmsearch_output_table,
+                                                         tmp.name,
+                                                         unpack,
+                                                         threads,
+                                                         evalue)
+                else:
+                    euk_result = HMMSearchResult.import_from_nhmmer_rows([])
+                search_result = search_result + [euk_result]
+                hits, hit_read_count = self._remove_euk_reads(search_result, hits)
+            direction_information = self._extract_multiple_hits(hits, tmp.name, hit_reads_fasta)  # split them into multiple reads
+        hit_readnames = hits.keys()
+
         if not hit_readnames:
             result = DBSearchResult(None,
                                   search_result,
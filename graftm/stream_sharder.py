@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+'''Split a stream of FASTA records between several commands.
+
+Records read from STDIN are sent in chunks of whole records to each of the
+commands in turn, so that e.g. several hmmsearch processes can search
+different parts of a single read file at the same time. Each command is run
+by bash, and is only started once there is input for it, so that commands
+are not run on empty input (unless the whole input is empty, in which case
+the first command is run on it). The exit status is that of the first
+command which failed, or 0.
+
+Only the standard library is used so that the script can be run without
+graftm being importable.
+'''
+
+import os
+import sys
+import pipes
+import argparse
+import subprocess
+from signal import signal, SIGPIPE, SIG_DFL
+
+# Number of bytes of records sent to a command at a time
+CHUNK_SIZE = 1024*1024
+
+def command_line(commands):
+    '''Return a string which, when run by bash, splits STDIN between the
+    given commands'''
+    script = os.path.splitext(os.path.abspath(__file__))[0]+'.py'
+    return "'%s' '%s' %s" % (sys.executable, script,
+                             ' '.join([pipes.quote(c) for c in commands]))
+
+def each_chunk(input_io, chunk_size=CHUNK_SIZE):
+    '''Iterate over str chunks of whole FASTA records read from input_io'''
+    leftover = ''
+    while True:
+        data = input_io.read(chunk_size)
+        if not data: break
+        if leftover:
+            data = leftover+data
+        end = data.rfind('\n>')+1
+        if end == 0:
+            leftover = data
+            continue
+        leftover = data[end:]
+        yield data[:end]
+    if leftover:
+        yield leftover
+
+def shard(input_io, commands, chunk_size=CHUNK_SIZE):
+    '''Send the FASTA records in input_io to the commands in turn, returning
+    the exit status of the first command which failed, or 0'''
+    processes = [None]*len(commands)
+    def start(i):
+        processes[i] = subprocess.Popen(
+            ['bash', '-c', commands[i]], stdin=subprocess.PIPE,
+            preexec_fn=lambda: signal(SIGPIPE, SIG_DFL))
+
+    try:
+        for i, chunk in enumerate(each_chunk(input_io, chunk_size)):
+            i = i % len(commands)
+            if processes[i] is None:
+                start(i)
+            processes[i].stdin.write(chunk)
+    except IOError:
+        # A command exited early, which is reported by its exit status.
+        # SIGPIPE is ignored here so that this is an error rather than the
+        # end of this process.
+        pass
+    if not any(processes):
+        start(0)
+
+    for process in processes:
+        if process is not None:
+            try:
+                process.stdin.close()
+            except IOError:
+                pass
+    returncodes = [p.wait() for p in processes if p is not None]
+    failures = [r for r in returncodes if r != 0]
+    return failures[0] if failures else 0
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Split FASTA records from STDIN between commands')
+    parser.add_argument('commands', nargs='+',
+                        help='commands to run, each reading from STDIN')
+    args = parser.parse_args()
+    sys.exit(shard(sys.stdin, args.commands))
+
+if __name__ == '__main__':
+    main()
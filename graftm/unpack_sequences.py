@@ -1,10 +1,16 @@
 import logging
-import subprocess
-from signal import signal, SIGPIPE, SIG_DFL
 import os
 import itertools
+import shutil
+import tempfile
 from string import lower
 
+from graftm.read_decoder import ReadDecoder, ReadCapture
+from graftm.input_profile import InputProfiler
+from graftm.read_cache import ReadCache
+from graftm.orf_caller import OrfCaller, DEFAULT_MIN_ORF_LENGTH
+from graftm import read_dereplicator
+
 class UnpackRawReads:
     class UnexpectedFileFormatException(Exception): pass
 
@@ -12,6 +18,12 @@ class UnpackRawReads:
     FORMAT_FASTQ    = "FORMAT_FASTQ"
     FORMAT_FASTQ_GZ = "FORMAT_FASTQ_GZ"
     FORMAT_FASTA_GZ = "FORMAT_FASTA_GZ"
+    FORMAT_FASTQ_BZ2 = "FORMAT_FASTQ_BZ2"
+    FORMAT_FASTA_BZ2 = "FORMAT_FASTA_BZ2"
+    FORMAT_FASTQ_XZ = "FORMAT_FASTQ_XZ"
+    FORMAT_FASTA_XZ = "FORMAT_FASTA_XZ"
+    FORMAT_FASTQ_ZST = "FORMAT_FASTQ_ZST"
+    FORMAT_FASTA_ZST = "FORMAT_FASTA_ZST"
 
     PROTEIN_SEQUENCE_TYPE = 'aminoacid'
     NUCLEOTIDE_SEQUENCE_TYPE = 'nucleotide'
@@ -31,9 +43,48 @@ class UnpackRawReads:
                                '.faa.gz': FORMAT_FASTA_GZ,
                                '.fna.gz': FORMAT_FASTA_GZ,
                                '.fasta.gz': FORMAT_FASTA_GZ,
+
+                               '.fq.bz2': FORMAT_FASTQ_BZ2,
+                               '.fastq.bz2': FORMAT_FASTQ_BZ2,
+
+                               '.fa.bz2': FORMAT_FASTA_BZ2,
+                               '.faa.bz2': FORMAT_FASTA_BZ2,
+                               '.fna.bz2': FORMAT_FASTA_BZ2,
+                               '.fasta.bz2': FORMAT_FASTA_BZ2,
+
+                               '.fq.xz': FORMAT_FASTQ_XZ,
+                               '.fastq.xz': FORMAT_FASTQ_XZ,
+
+                               '.fa.xz': FORMAT_FASTA_XZ,
+                               '.faa.xz': FORMAT_FASTA_XZ,
+                               '.fna.xz': FORMAT_FASTA_XZ,
+                               '.fasta.xz': FORMAT_FASTA_XZ,
+
+                               '.fq.zst': FORMAT_FASTQ_ZST,
+                               '.fastq.zst': FORMAT_FASTQ_ZST,
+
+                               '.fa.zst': FORMAT_FASTA_ZST,
+                               '.faa.zst': FORMAT_FASTA_ZST,
+                               '.fna.zst': FORMAT_FASTA_ZST,
+                               '.fasta.zst': FORMAT_FASTA_ZST,
                                }
 
-    def __init__(self, read_file, known_sequence_type=None, interleaved=False):
+    _FASTQ_FORMATS = (FORMAT_FASTQ, FORMAT_FASTQ_GZ, FORMAT_FASTQ_BZ2,
+                      FORMAT_FASTQ_XZ, FORMAT_FASTQ_ZST)
+
+    _FORMAT_TO_COMPRESSION = {FORMAT_FASTQ_GZ: ReadDecoder.GZIP_COMPRESSION,
+                              FORMAT_FASTA_GZ: ReadDecoder.GZIP_COMPRESSION,
+                              FORMAT_FASTQ_BZ2: ReadDecoder.BZIP2_COMPRESSION,
+                              FORMAT_FASTA_BZ2: ReadDecoder.BZIP2_COMPRESSION,
+                              FORMAT_FASTQ_XZ: ReadDecoder.XZ_COMPRESSION,
+                              FORMAT_FASTA_XZ: ReadDecoder.XZ_COMPRESSION,
+                              FORMAT_FASTQ_ZST: ReadDecoder.ZSTD_COMPRESSION,
+                              FORMAT_FASTA_ZST: ReadDecoder.ZSTD_COMPRESSION,
+                              }
+
+    def __init__(self, read_file, known_sequence_type=None, interleaved=False,
+                 threads=1, capture_directory=None, cache_directory=None,
+                 dereplicate=False):
         '''New object from a read file.
 
         read_file: str
@@ -42,6 +93,23 @@ class UnpackRawReads:
             PROTEIN_SEQUENCE_TYPE, NUCLEOTIDE_SEQUENCE_TYPE or None
             Whether input is nucleotide, amino acid, or should be guessed by
         peeking at the input sequence file.
+        interleaved: bool
+            True if the reads are interleaved forward and reverse pairs
+        threads: int
+            number of processes used when decoding the reads
+        capture_directory: str
+            if not None, keep the decoded reads in a temporary directory
+            inside this directory as they are streamed by command_line(), so
+            that reads can be extracted afterwards without decoding the input
+            again. See read_capture().
+        cache_directory: str
+            if not None, nucleotide reads are packed into a ReadCache in this
+            directory the first time they are used, and streamed from the
+            cache by later runs on the same file. See read_cache().
+        dereplicate: bool
+            if True, reads whose sequence is identical to that of an earlier
+            read are left out of the reads streamed by command_line(). See
+            duplicates().
 
         '''
         logging.debug("Loading %s, type %s, interleaved %s", read_file,
@@ -49,6 +117,14 @@ class UnpackRawReads:
         self.read_file = read_file
         self.known_sequence_type = known_sequence_type
         self.interleaved = interleaved
+        self.threads = threads
+        self.capture_directory = capture_directory
+        self.cache_directory = cache_directory
+        self._read_capture = None
+        self._orf_capture = None
+        self._read_cache = None
+        self.dereplicate = dereplicate
+        self._duplicates_path = None
 
     def _guess_sequence_type_from_string(self, seq):
         '''Return 'protein' if there is >10% amino acid residues in the
@@ -83,19 +159,32 @@ class UnpackRawReads:
         if self.known_sequence_type is not None:
             return self.known_sequence_type
         else:
-            # If its Gzipped and fastq make a small sample of the sequence to be
-            # read
-            cmd='%s | head -n 2' % (self.command_line())
-            first_seq = subprocess.check_output(
-                                                cmd,
-                                                shell=True,
-                                                preexec_fn=lambda:signal(SIGPIPE, SIG_DFL)
-                                                )
-            _, seq = tuple(first_seq.strip().split('\n'))
-            self.type = self._guess_sequence_type_from_string(seq)
+            self.type = self.profile().sequence_type
             logging.debug("Detected sequence type as %s" % self.type)
             return self.type
 
+    def profile(self):
+        '''Return an InputProfile of the read file, which is estimated from
+        a sample of the file the first time it is requested'''
+        return InputProfiler().profile(self.read_decoder(),
+                                       self._guess_sequence_type_from_string)
+
+    def estimated_orf_count(self, orf_caller):
+        '''Return the approximate number of ORFs that orf_caller, an OrfM or
+        OrfCaller, calls on the reads, or None if unknown. This is estimated
+        by calling ORFs on the sample of reads the file is profiled from.'''
+        read_count = self.profile().estimated_read_count
+        if read_count is None:
+            return None
+        # OrfCaller names, numbers and filters ORFs as OrfM does
+        orfs_per_read = InputProfiler().orfs_per_read(
+            self.read_decoder(),
+            OrfCaller(orf_caller.min_orf_length or DEFAULT_MIN_ORF_LENGTH,
+                      orf_caller.restrict_read_length))
+        if orfs_per_read is None:
+            return read_count
+        return int(round(read_count * orfs_per_read))
+
     def guess_sequence_input_file_format(self, sequence_file_path):
         '''Given a sequence file, guess the format and return. Raise an
         exception if it cannot be guessed'''
@@ -108,6 +197,11 @@ class UnpackRawReads:
         return self.guess_sequence_input_file_format(self.read_file) in \
             (self.FORMAT_FASTA_GZ, self.FORMAT_FASTQ_GZ)
 
+    def compression(self):
+        '''Return the ReadDecoder compression of the read file, or None if
+        it is not compressed'''
+        return self._FORMAT_TO_COMPRESSION.get(self.format())
+
     def basename(self):
         '''Return the name of the file with the '.fasta' or 'fq.gz' etc
         removed'''
@@ -118,27 +212,147 @@ class UnpackRawReads:
             if sequence_file_path.endswith(ext): return ext
         raise self.UnexpectedFileFormatException("Unable to guess file format of sequence file: %s" % sequence_file_path)
 
-    def get_interleaved_cmd(self):
-        """ return cmd snippet to make sure interleaved reads have unique
-        names """
-        return r""" | perl -pe 'if (m/^>/) {$i++; if ($i % 2 == 1) { if (m/^(\S+)(?<!\/1)(\s+\S.*)?(\s*)$/) { $_ = "$1/1$2$3" }} elsif ($i % 2 == 0) { if (m/^(\S+)(?<!\/2)(\s+\S.*)?(\s*)$/) { $_ = "$1/2$2$3" }}}'"""
+    def _is_passed_through(self):
+        '''Return True if decoding leaves the reads unchanged'''
+        return self.format() == self.FORMAT_FASTA and not self.interleaved
+
+    def read_cache(self):
+        '''Return the PackedReads of the read file from the ReadCache in
+        cache_directory, caching the reads if they are not already, or None
+        if there is no cache_directory or the reads are not nucleotide'''
+        if self.cache_directory is None:
+            return None
+        if self._read_cache is None:
+            if self.sequence_type() != self.NUCLEOTIDE_SEQUENCE_TYPE:
+                logging.debug("Not caching %s since it is not nucleotide" % \
+                              self.read_file)
+                return None
+            cache = ReadCache(self.cache_directory)
+            packed_reads = cache.packed_reads(self.read_file, self.interleaved)
+            if packed_reads.is_complete():
+                logging.debug("Using cached reads %s" % packed_reads.path)
+            else:
+                cache.build(packed_reads, self.read_decoder())
+            self._read_cache = packed_reads
+        return self._read_cache
+
+    def read_capture(self):
+        '''Return the ReadCapture that command_line() keeps the reads in, or
+        None if there is no capture_directory. Reads which are cached are
+        not captured again, and their PackedReads are returned instead.'''
+        if self.read_cache() is not None:
+            return self.read_cache()
+        if self.capture_directory is None:
+            return None
+        if self._read_capture is None:
+            directory = tempfile.mkdtemp(prefix='graftm_read_capture',
+                                         dir=self.capture_directory)
+            index_path = os.path.join(directory, 'reads.idx')
+            if self._is_passed_through():
+                # Offsets can refer to the input file directly
+                self._read_capture = ReadCapture(index_path, self.read_file,
+                                                 copy_reads=False)
+            else:
+                self._read_capture = ReadCapture(
+                    index_path, os.path.join(directory, 'reads.fa'))
+        return self._read_capture
+
+    def remove_read_capture(self):
+        '''Delete the captured reads, if any'''
+        if self._read_capture is not None:
+            shutil.rmtree(os.path.dirname(self._read_capture.index_path))
+            self._read_capture = None
+
+    def orf_capture(self):
+        '''Return the ReadCapture that orf_command_line() keeps the ORFs in.
+        This is in a temporary directory inside capture_directory, or the
+        default temporary directory if there is no capture_directory.'''
+        if self._orf_capture is None:
+            directory = tempfile.mkdtemp(prefix='graftm_orf_capture',
+                                         dir=self.capture_directory)
+            logging.info("Keeping the ORFs of %s in %s while they are searched" % \
+                         (self.read_file, directory))
+            self._orf_capture = ReadCapture(os.path.join(directory, 'orfs.idx'),
+                                            os.path.join(directory, 'orfs.faa'))
+        return self._orf_capture
+
+    def remove_orf_capture(self):
+        '''Delete the captured ORFs, if any'''
+        if self._orf_capture is not None:
+            shutil.rmtree(os.path.dirname(self._orf_capture.index_path))
+            self._orf_capture = None
+
+    def duplicates(self):
+        '''Return a dict of the name of each read which was streamed by
+        command_line() to a list of the names of the reads which were left
+        out because they have the same sequence. Reads without duplicates
+        are not included.'''
+        if self._duplicates_path is None or \
+            not os.path.exists(self._duplicates_path):
+            return {}
+        return read_dereplicator.read_duplicates(self._duplicates_path)
+
+    def remove_duplicates(self):
+        '''Delete the record of duplicate reads, if any'''
+        if self._duplicates_path is not None:
+            if os.path.exists(self._duplicates_path):
+                os.remove(self._duplicates_path)
+            self._duplicates_path = None
+
+    def read_decoder(self, capture=None, orf_caller=None, orf_capture=None):
+        '''Return a ReadDecoder which converts the read file to FASTA, keeping
+        the reads in the given ReadCapture if it is not None, and writing
+        their ORFs instead if orf_caller is not None'''
+        file_format = self.format()
+        logging.debug("Detected file format %s" % file_format)
+        return ReadDecoder(self.read_file,
+                           fastq=file_format in self._FASTQ_FORMATS,
+                           compression=self.compression(),
+                           interleaved=self.interleaved,
+                           threads=self.threads,
+                           capture=capture,
+                           orf_caller=orf_caller,
+                           orf_capture=orf_capture)
 
     def command_line(self):
         '''Return a string to open read files with'''
-        file_format=self.guess_sequence_input_file_format(self.read_file)
-        logging.debug("Detected file format %s" % file_format)
-        if file_format == self.FORMAT_FASTA:
+        capture = self.read_capture()
+        if self.read_cache() is not None:
+            cmd = self.read_cache().command_line()
+        elif self._is_passed_through() and capture is None:
             cmd="""cat '%s'""" % (self.read_file)
-        elif file_format == self.FORMAT_FASTQ_GZ:
-            cmd="""zcat '%s' | awk '{print ">" substr($0,2);getline;print;getline;getline}' -""" % (self.read_file)
-        elif file_format == self.FORMAT_FASTA_GZ:
-            cmd="""zcat '%s'""" % (self.read_file)
-        elif file_format == self.FORMAT_FASTQ:
-            cmd="""awk '{print ">" substr($0,2);getline;print;getline;getline}' '%s'""" % (self.read_file)
-        if self.interleaved:
-            cmd+=self.get_interleaved_cmd()
+        else:
+            cmd=self.read_decoder(capture).command_line()
+        if self.dereplicate:
+            if self._duplicates_path is None:
+                handle, self._duplicates_path = tempfile.mkstemp(
+                    prefix='graftm_duplicates', suffix='.tsv')
+                os.close(handle)
+                # The file only exists once dereplication is complete
+                os.remove(self._duplicates_path)
+            cmd = "%s | %s" % (cmd, read_dereplicator.command_line(
+                self._duplicates_path))
         logging.debug("raw read unpacking command chunk: %s" % cmd)
         return cmd
 
+    def orf_command_line(self, orf_caller):
+        '''Return a string which writes the ORFs of the reads, found by
+        orf_caller, rather than the reads as command_line() does. The ORFs
+        are kept in orf_capture(), so the ORFs of hit reads can be extracted
+        from there rather than called again. ORFs are called by the decoder
+        as the reads are decoded, unless the reads are streamed from the read
+        cache or dereplicated, when the FASTA streamed is passed through a
+        second decoder.'''
+        if self.read_cache() is None and not self.dereplicate:
+            cmd = self.read_decoder(self.read_capture(), orf_caller,
+                                    self.orf_capture()).command_line()
+        else:
+            cmd = "%s | %s" % (
+                self.command_line(),
+                ReadDecoder('/dev/stdin', orf_caller=orf_caller,
+                            orf_capture=self.orf_capture()).command_line())
+        logging.debug("ORF calling command chunk: %s" % cmd)
+        return cmd
+
     def get_file_as_process(self):
         return "<(%s)" % (self.command_line())
@@ -200,6 +200,17 @@ class Update(Create):
         new_gpkg.diamond_database = "%s.dmnd" % (new_gpkg.name)
         self._create_dmnd_database(new_gpkg.unaligned_sequences, new_gpkg.name)
 
+        ####################################
+        ### Re-construct k-mer prefilter ###
+        if old_gpkg.kmer_prefilter_path():
+            logging.info("Recreating k-mer prefilter")
+            new_gpkg.kmer_prefilter = "%s.kmers" % (new_gpkg.name)
+            self._create_kmer_prefilter(new_gpkg.unaligned_sequences,
+                                        new_gpkg.kmer_prefilter,
+                                        new_gpkg.package_type)
+        else:
+            new_gpkg.kmer_prefilter = None
+
         ####################
         ### Compile gpkg ###
         logging.info("Compiling GraftM package")
@@ -208,7 +219,8 @@ class Update(Create):
                                       new_gpkg.hmm, new_gpkg.diamond_database,
                                       self._define_range(new_gpkg.unaligned_sequences),
                                       new_gpkg.unaligned_sequences,
-                                      search_hmm_files=old_gpkg.search_hmm_paths())
+                                      search_hmm_files=old_gpkg.search_hmm_paths(),
+                                      kmer_prefilter=new_gpkg.kmer_prefilter)
 
         ###################
         ### Test it out ###
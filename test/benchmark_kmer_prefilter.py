@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+
+#=======================================================================
+# Authors: Ben Woodcroft, Joel Boyd
+#
+# Benchmark of the recall and speed of KmerPrefilter on a package's unaligned
+# sequences. Not run as part of the tests. A fraction of the sequences are
+# held out of the index, and fragments of them the length of ORFs from short
+# reads are filtered, as are translations of random DNA, which stand in for
+# the ORFs of other genes and non-coding frames which cannot hit the package.
+#
+# Usage: python benchmark_kmer_prefilter.py [--sequences FASTA] [--seeds SEED ..]
+#
+# Copyright
+#
+# This is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.	See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License.
+# If not, see <http://www.gnu.org/licenses/>.
+#=======================================================================
+
+import os
+import sys
+import time
+import random
+import argparse
+from StringIO import StringIO
+
+sys.path = [os.path.join(os.path.dirname(os.path.realpath(__file__)),'..')]+sys.path
+from graftm.sequence_io import SequenceIO
+from graftm.kmer_prefilter import KmerPrefilter, DEFAULT_SEED
+
+def fragments(sequences, length, num_fragments):
+    random.seed(42)
+    sequences = [s for s in sequences if len(s) >= length]
+    for i in xrange(num_fragments):
+        s = random.choice(sequences)
+        start = random.randint(0, len(s)-length)
+        yield s[start:start+length]
+
+# The standard genetic code, with codons in TCAG order
+_CODONS = [a+b+c for a in 'TCAG' for b in 'TCAG' for c in 'TCAG']
+_CODE = dict(zip(_CODONS,
+                 'FFLLSSSSYY**CC*WLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG'))
+
+def random_orfs(length, num_orfs):
+    '''Translations of random DNA without stop codons'''
+    random.seed(7)
+    sense = [c for c in _CODONS if _CODE[c] != '*']
+    for i in xrange(num_orfs):
+        yield ''.join([_CODE[random.choice(sense)] for _ in xrange(length)])
+
+def time_filter(prefilter, sequences):
+    fasta = ''.join(['>s%i\n%s\n' % (i, s) for i, s in enumerate(sequences)])
+    output = StringIO()
+    start = time.time()
+    prefilter.filter(StringIO(fasta), output)
+    return len(fasta) / (time.time() - start) / 1e6
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark KmerPrefilter')
+    parser.add_argument('--sequences', help='unaligned protein sequences',
+                        default=os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                             'data', 'S1.2.ribosomal_protein_L3_rplC',
+                                             'graftm_VEYiP.faa'))
+    parser.add_argument('--seeds', nargs='+',
+                        default=['11111111', DEFAULT_SEED, '111111111', '1111111111'])
+    parser.add_argument('--held_out_fraction', type=float, default=0.1)
+    parser.add_argument('--fragment_length', type=int, default=40,
+                        help='length of ORFs called from short reads')
+    parser.add_argument('--num_fragments', type=int, default=200000)
+    args = parser.parse_args()
+
+    sequences = [s for _, s, _ in SequenceIO().each(open(args.sequences))]
+    random.seed(1)
+    random.shuffle(sequences)
+    num_held_out = int(len(sequences) * args.held_out_fraction)
+    held_out = sequences[:num_held_out]
+    indexed = sequences[num_held_out:]
+    homologs = list(fragments(held_out, args.fragment_length,
+                              args.num_fragments))
+    unrelated = list(random_orfs(args.fragment_length, args.num_fragments))
+
+    print "%d sequences indexed, %d fragments of length %d from %d held out" % \
+        (len(indexed), len(homologs), args.fragment_length, len(held_out))
+    print "%-12s %7s %8s %8s %12s %10s" % ('seed', 'filled', 'recall',
+                                           'passed', 'build', 'MB/s')
+    for seed in args.seeds:
+        start = time.time()
+        prefilter = KmerPrefilter.build(indexed, seed)
+        build = time.time() - start
+        recall = prefilter.matches(homologs).mean()
+        passed = prefilter.matches(unrelated).mean()
+        print "%-12s %7.4f %8.4f %8.4f %11.2fs %10.1f" % \
+            (seed, prefilter.fraction_filled(), recall, passed, build,
+             time_filter(prefilter, unrelated))
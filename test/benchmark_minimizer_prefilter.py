@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+
+#=======================================================================
+# Authors: Ben Woodcroft, Joel Boyd
+#
+# Benchmark of the recall and speed of MinimizerPrefilter on the reference
+# sequences of a nucleotide package, by default test/data/61_otus.gpkg. Not
+# run as part of the tests. Reads are simulated from either strand of the
+# reference sequences with increasing numbers of substitutions, which stand
+# in for reads of relatives of the reference sequences, and from random DNA,
+# which stand in for reads which cannot hit the package.
+#
+# Usage: python benchmark_minimizer_prefilter.py [--graftm_package GPKG]
+#
+# Copyright
+#
+# This is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.	See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License.
+# If not, see <http://www.gnu.org/licenses/>.
+#=======================================================================
+
+import os
+import sys
+import time
+import random
+import argparse
+from StringIO import StringIO
+
+sys.path = [os.path.join(os.path.dirname(os.path.realpath(__file__)),'..')]+sys.path
+from graftm.sequence_io import SequenceIO
+from graftm.graftm_package import GraftMPackage
+from graftm.kmer_prefilter import MinimizerPrefilter, DEFAULT_K, DEFAULT_WINDOW
+
+_COMPLEMENT = {'A': 'T', 'C': 'G', 'G': 'C', 'T': 'A'}
+
+def simulated_reads(sequences, length, num_reads, divergence):
+    random.seed(42)
+    sequences = [s for s in sequences if len(s) >= length]
+    for i in xrange(num_reads):
+        s = random.choice(sequences)
+        start = random.randint(0, len(s)-length)
+        read = list(s[start:start+length].upper())
+        for j in xrange(len(read)):
+            if random.random() < divergence:
+                read[j] = random.choice([b for b in 'ACGT' if b != read[j]])
+        if random.random() < 0.5:
+            read = [_COMPLEMENT.get(b, 'N') for b in reversed(read)]
+        yield ''.join(read)
+
+def random_reads(length, num_reads):
+    random.seed(7)
+    for i in xrange(num_reads):
+        yield ''.join([random.choice('ACGT') for _ in xrange(length)])
+
+def time_filter(prefilter, sequences):
+    fasta = ''.join(['>s%i\n%s\n' % (i, s) for i, s in enumerate(sequences)])
+    output = StringIO()
+    start = time.time()
+    prefilter.filter(StringIO(fasta), output)
+    return len(fasta) / (time.time() - start) / 1e6
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark MinimizerPrefilter')
+    parser.add_argument('--graftm_package',
+                        default=os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                             'data', '61_otus.gpkg'))
+    parser.add_argument('--parameters', nargs='+', metavar='K,WINDOW',
+                        default=['12,6', '14,8', '%i,%i' % (DEFAULT_K, DEFAULT_WINDOW),
+                                 '16,12', '20,10'])
+    parser.add_argument('--divergences', nargs='+', type=float,
+                        default=[0, 0.05, 0.1, 0.15, 0.2])
+    parser.add_argument('--read_length', type=int, default=150)
+    parser.add_argument('--num_reads', type=int, default=10000)
+    args = parser.parse_args()
+
+    gpkg = GraftMPackage.acquire(args.graftm_package)
+    references = [s.replace('-', '').replace('.', '') for _, s, _ in \
+                  SequenceIO().each(open(gpkg.alignment_fasta_path()))]
+    unrelated = list(random_reads(args.read_length, args.num_reads))
+
+    print "%d reference sequences, %d reads of length %d" % \
+        (len(references), args.num_reads, args.read_length)
+    print "%-8s %10s %8s %s %8s %8s" % \
+        ('k,window', 'minimizers', 'build',
+         ' '.join(['%6s' % ('%g%%' % (d*100)) for d in args.divergences]),
+         'random', 'MB/s')
+    for parameters in args.parameters:
+        k, window = [int(p) for p in parameters.split(',')]
+        start = time.time()
+        prefilter = MinimizerPrefilter.build(references, k, window)
+        build = time.time() - start
+        recalls = [prefilter.matches(list(simulated_reads(
+            references, args.read_length, args.num_reads, d))).mean() \
+                   for d in args.divergences]
+        print "%-8s %10d %7.2fs %s %8.4f %8.1f" % \
+            (parameters, len(prefilter._index), build,
+             ' '.join(['%6.4f' % r for r in recalls]),
+             prefilter.matches(unrelated).mean(),
+             time_filter(prefilter, unrelated))
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+
+#=======================================================================
+# Authors: Ben Woodcroft, Joel Boyd
+#
+# Benchmark of the recall and speed of KmerPrefilter on a package's unaligned
+# sequences. Not run as part of the tests. A fraction of the sequences are
+# held out of the index, and fragments of them the length of ORFs from short
+# reads are filtered, as are translations of random DNA, which stand in for
+# the ORFs of other genes and non-coding frames which cannot hit the package.
+#
+# Usage: python benchmark_kmer_prefilter.py [--sequences FASTA] [--seeds SEED ..]
+#
+# Copyright
+#
+# This is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.	See the
+
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path = [os.path.join(os.path.dirname(os.path.realpath(__file__)),'..')]+sys.path
+from graftm.sequence_searcher import SequenceSearcher, PREVIOUS_SPAN_CUTOFF
+from graftm.sequence_search_results import HMMSearchResult
+
+def contig_hits(num_contigs, hits_per_contig, contig_length, hmm_length):
+    '''nhmmer rows of hits of an HMM to genes scattered along contigs'''
+    random.seed(42)
+    rows = []
+    for contig in xrange(num_contigs):
+        for _ in xrange(hits_per_contig):
+            hmm_from = random.randint(1, hmm_length-50)
+            hmm_to = random.randint(hmm_from+10, hmm_length)
+            length = (hmm_to-hmm_from)*3
+            start = random.randint(1, contig_length-length)
+            if random.random() < 0.5:
+                ali_from, ali_to = start, start+length
+            else:
+                ali_from, ali_to = start+length, start
+            rows.append(['contig%i' % contig, '-', 'hmm', '-', str(hmm_from),
+                         str(hmm_to), str(ali_from), str(ali_to), '-', '-',
+                         '-', '-', '-', '50.0'])
+    random.shuffle(rows)
+    return HMMSearchResult.import_from_nhmmer_rows(rows)
+
+def set_range_link(hits, max_range):
+    '''The linking of _get_read_names before it used interval arithmetic,
+    which builds a set for the span of every pair of hits compared'''
+    spans = []
+    strands = []
+    query_spans = []
+    for ft_start, ft_end, qs_start, qs_end, c in hits:
+        ft = [ft_start, ft_end]
+        qs = [qs_start, qs_end]
+        for idx, entry in enumerate(spans):
+            if strands[idx] != c:
+                break
+            previous_qs = query_spans[idx]
+            current_q_range = set(range(qs[0], qs[1]))
+            query_overlap = set(range(previous_qs[0], previous_qs[1])).intersection(current_q_range)
+            previous_ft_span = set(range(entry[0], entry[1]))
+            current_ft_span = set(range(ft[0], ft[1]))
+            if any(query_overlap):
+                intersection = float(len(previous_ft_span.intersection(current_ft_span)))
+                if intersection / len(previous_ft_span) >= PREVIOUS_SPAN_CUTOFF:
+                    ft = None
+                    break
+                elif intersection / len(current_ft_span) >= PREVIOUS_SPAN_CUTOFF:
+                    ft = None
+                    break
+                elif len(query_overlap) > len(current_q_range)*PREVIOUS_SPAN_CUTOFF and \
+                    idx+1 == len(spans):
+                    break
+            if entry[0] < ft[0]:
+                if ft[1] - entry[0] < max_range:
+                    entry[1] = ft[1]
+                    ft = None
+                    break
+            else:
+                if entry[1] - ft[0] < max_range:
+                    entry[0] = ft[0]
+                    ft = None
+                    break
+        if ft is not None:
+            spans.append(ft)
+            strands.append(c)
+            query_spans.append(qs)
+    return {'span': spans, 'strand': strands, 'query_span': query_spans}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='Benchmark linking of hits in SequenceSearcher._get_read_names')
+    parser.add_argument('--num_contigs', type=int, default=200)
+    parser.add_argument('--hits_per_contig', type=int, nargs='+',
+                        default=[1, 10, 50, 200])
+    parser.add_argument('--contig_length', type=int, default=100000)
+    parser.add_argument('--hmm_length', type=int, default=500)
+    parser.add_argument('--maximum_range', type=int, default=1500,
+                        help='as in the CONTENTS.json of a graftm package')
+    args = parser.parse_args()
+
+    searcher = SequenceSearcher(None)
+    print "%d contigs of length %d, maximum range %d" % \
+        (args.num_contigs, args.contig_length, args.maximum_range)
+    print "%12s %10s %12s %12s" % ('hits/contig', 'entries', 'intervals', 'set(range)')
+    for hits_per_contig in args.hits_per_contig:
+        result = contig_hits(args.num_contigs, hits_per_contig,
+                             args.contig_length, args.hmm_length)
+        start = time.time()
+        linked = searcher._get_read_names([result], args.maximum_range)
+        intervals = time.time() - start
+
+        link_hits = searcher._link_hits
+        searcher._link_hits = set_range_link
+        try:
+            start = time.time()
+            expected = searcher._get_read_names([result], args.maximum_range)
+            set_range = time.time() - start
+        finally:
+            searcher._link_hits = link_hits
+        if expected != linked:
+            raise Exception("Linking differs from the set(range) linking")
+        print "%12d %10d %11.3fs %11.3fs" % \
+            (hits_per_contig, sum([len(e['entry']) for e in linked.values()]),
+             intervals, set_range)
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+
+#=======================================================================
+# Authors: Ben Woodcroft, Joel Boyd
+#
+# Benchmark of SequenceIO parsing and writing. Not run as part of the tests.
+#
+# Usage: python benchmark_sequence_io.py [--num_sequences N]
+#
+# Copyright
+#
+# This is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.	See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License.
+# If not, see <http://www.gnu.org/licenses/>.
+#=======================================================================
+
+import os
+import sys
+import time
+import gzip
+import random
+import argparse
+import tempfile
+
+sys.path = [os.path.join(os.path.dirname(os.path.realpath(__file__)),'..')]+sys.path
+from graftm.sequence_io import SequenceIO
+
+def write_test_files(num_sequences, fasta, fastq, aligned, fastq_gz):
+    random.seed(42)
+    for i in xrange(num_sequences):
+        seq = ''.join([random.choice('ACGT') for _ in xrange(150)])
+        fasta.write('>read%i comment\n%s\n%s\n' % (i, seq[:80], seq[80:]))
+        fastq.write('@read%i comment\n%s\n+\n%s\n' % (i, seq, 'I'*len(seq)))
+        aligned.write('>read%i\n%s\n' % (i, seq.replace('A', '-')))
+    for f in (fasta, fastq, aligned):
+        f.flush()
+    with open(fastq.name) as f:
+        gz = gzip.GzipFile(fileobj=fastq_gz, mode='w')
+        gz.write(f.read())
+        gz.close()
+    fastq_gz.flush()
+
+def time_parse(path, parse):
+    start = time.time()
+    with (gzip.open(path) if path.endswith('.gz') else open(path)) as f:
+        count = sum(1 for _ in parse(f))
+    return count, time.time() - start
+
+def old_write_fasta(sequence_objects, io):
+    for s in sequence_objects:
+        io.write(">")
+        io.write(s.name)
+        io.write("\n")
+        io.write(s.seq)
+        io.write("\n")
+
+def time_write(sequences, write):
+    start = time.time()
+    with open(os.devnull, 'w') as f:
+        write(sequences, f)
+    return time.time() - start
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark SequenceIO')
+    parser.add_argument('--num_sequences', type=int, default=500000)
+    args = parser.parse_args()
+
+    seqio = SequenceIO()
+    with tempfile.NamedTemporaryFile(suffix='.fa') as fasta, \
+            tempfile.NamedTemporaryFile(suffix='.fq') as fastq, \
+            tempfile.NamedTemporaryFile(suffix='.aln.fa') as aligned, \
+            tempfile.NamedTemporaryFile(suffix='.fq.gz') as fastq_gz:
+        write_test_files(args.num_sequences, fasta, fastq, aligned, fastq_gz)
+        print "%-20s %12s %12s %8s" % ('input', 'line-by-line', 'buffered', 'speedup')
+        for name, f in (('wrapped FASTA', fasta),
+                        ('FASTQ', fastq),
+                        ('gzipped FASTQ', fastq_gz),
+                        ('aligned FASTA', aligned)):
+            count1, old = time_parse(f.name, seqio._each_line_by_line)
+            count2, new = time_parse(f.name, seqio.each)
+            assert count1 == count2 == args.num_sequences
+            print "%-20s %11.2fs %11.2fs %7.1fx" % (name, old, new, old/new)
+
+        sequences = seqio.read_fasta_file(aligned.name)
+        old = time_write(sequences, old_write_fasta)
+        new = time_write(sequences, seqio.write_fasta)
+        print "%-20s %11.2fs %11.2fs %7.1fx" % ('write_fasta', old, new, old/new)
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+
+#=======================================================================
+# Authors: Ben Woodcroft, Joel Boyd
+#
+# Unit tests.
+#
+# Copyright
+#
+# This is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.	See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License.
+# If not, see <http://www.gnu.org/licenses/>.
+#=======================================================================
+
+
+import unittest
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+sys.path = [os.path.join(os.path.dirname(os.path.realpath(__file__)),'..')]+sys.path
+from graftm.read_decoder import ReadCapture, _CaptureWriter
+from graftm.capture_index import CaptureIndexLoader
+
+class Tests(unittest.TestCase):
+    def test_load_while_capturing(self):
+        directory = tempfile.mkdtemp()
+        try:
+            capture = ReadCapture(os.path.join(directory, 'reads.idx'),
+                                  os.path.join(directory, 'reads.fa'))
+            loader = CaptureIndexLoader(capture)
+            time.sleep(0.1)
+            writer = _CaptureWriter(capture)
+            for block in ['>a x\nAC\nGT\n>b\nA\n', '>c\nG\n',
+                          '>b\nT\n>d\nCC\n']:
+                writer.write(block)
+                time.sleep(0.1)
+            writer.close()
+            with tempfile.NamedTemporaryFile() as out:
+                self.assertEqual(3, loader.extract(['c', 'b', 'e'], out.name))
+                self.assertEqual('>b\nA\n>c\nG\n>b\nT\n', open(out.name).read())
+                self.assertEqual(1, loader.extract(['d'], out.name))
+                self.assertEqual('>d\nCC\n', open(out.name).read())
+        finally:
+            shutil.rmtree(directory)
+
+    def test_stop(self):
+        directory = tempfile.mkdtemp()
+        try:
+            loader = CaptureIndexLoader(ReadCapture(
+                os.path.join(directory, 'reads.idx'),
+                os.path.join(directory, 'reads.fa')))
+            loader.stop()
+            self.assertFalse(loader._thread.is_alive())
+        finally:
+            shutil.rmtree(directory)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -25,12 +25,16 @@ import unittest
 import os
 import sys
 import tempfile
+import shutil
+import random
 import extern
 
 sys.path = [os.path.join(os.path.dirname(os.path.realpath(__file__)),'..')]+sys.path
-from graftm.decoy_filter import DecoyFilter
+from graftm.decoy_filter import DecoyFilter, MergedDecoyFilter, MergedDecoyDatabase
 from graftm.sequence_io import SequenceIO
 from graftm.diamond import Diamond
+from graftm.unpack_sequences import UnpackRawReads
+from graftm.sequence_search_results import SequenceSearchResult
 
 class Tests(unittest.TestCase):
     eg1 = """>PROKKA_03952 Electron transfer flavoprotein-ubiquinone oxidoreductase
@@ -102,6 +106,122 @@ RCPAPLVPEAIERLLRQYLATRLRDENLRAWFSRHSNDELRAHLAGE
                 self.assertEqual("PROKKA_03952", seqs[0].name)
         # clean up
         os.remove(f1.name+".dmnd")
-        
+
+    def test_merged(self):
+        with tempfile.NamedTemporaryFile(prefix='graftm_decoy_test') as f1:
+            with tempfile.NamedTemporaryFile(prefix='graftm_decoy_test') as f2:
+                f1.write(self.eg1)
+                f1.flush()
+                extern.run("diamond makedb --in %s --db %s.dmnd" %\
+                           (f1.name, f1.name))
+                f2.write(self.eg2)
+                f2.flush()
+                extern.run("diamond makedb --in %s --db %s.dmnd" %\
+                           (f2.name, f2.name))
+                cache = tempfile.mkdtemp(prefix='graftm_decoy_test')
+                try:
+                    merged = MergedDecoyDatabase(cache)
+                    db = merged.acquire(f1.name+".dmnd", f2.name+".dmnd")
+                    self.assertEqual(db, merged.acquire(f1.name+".dmnd",
+                                                        f2.name+".dmnd"))
+                    self.assertEqual([db], [os.path.join(cache, f) \
+                                            for f in os.listdir(cache)])
+                    with tempfile.NamedTemporaryFile(prefix='graftm_decoy_test') as f3:
+                        with tempfile.NamedTemporaryFile(prefix='graftm_decoy_test') as f4:
+                            f3.write(self.eg1)
+                            f3.write(self.eg2)
+                            f3.flush()
+                            decoy_filter = MergedDecoyFilter(db, f1.name+".dmnd")
+                            ret = decoy_filter.filter(f3.name, f4.name)
+                            self.assertEqual(True, ret)
+                            seqs = SequenceIO().read_fasta_file(f4.name)
+                            self.assertEqual(["PROKKA_03952"],
+                                             [s.name for s in seqs])
+                            self.assertEqual(self.eg1.split('\n', 1)[1].replace('\n', ''),
+                                             seqs[0].seq)
+                            # Written as the candidate records, as by
+                            # DecoyFilter
+                            self.assertEqual(self.eg1, open(f4.name).read())
+                            self.assertEqual(["PROKKA_03952"],
+                                             decoy_filter.proper_hits.queries())
+                            # E-values are of the non-decoy database, so the
+                            # hits can be reused for assignment
+                            self.assertTrue(Diamond(f1.name+".dmnd").covers(
+                                decoy_filter.proper_hits))
+                finally:
+                    shutil.rmtree(cache)
+                # clean up
+                os.remove(f1.name+".dmnd")
+                os.remove(f2.name+".dmnd")
+
+    def test_merged_delimited_decoy_ids(self):
+        # A decoy with a UniProt style ID hits better than the non-decoy
+        # sequence, which differs from the query at every 5th residue
+        sequence = self.eg1.split('\n', 1)[1].replace('\n', '')
+        proper = ''.join([('A' if i % 5 == 0 else c) \
+                          for i, c in enumerate(sequence)])
+        directory = tempfile.mkdtemp(prefix='graftm_decoy_test')
+        try:
+            for name, contents in (('proper', '>proper1\n%s\n' % proper),
+                                   ('decoy', '>sp|P12345|DECOY_NAME a decoy\n%s\n' % sequence)):
+                with open(os.path.join(directory, name+'.faa'), 'w') as f:
+                    f.write(contents)
+                extern.run("diamond makedb --in %s.faa --db %s.dmnd" % \
+                           ((os.path.join(directory, name),)*2))
+            proper_db = os.path.join(directory, 'proper.dmnd')
+            db = MergedDecoyDatabase(os.path.join(directory, 'cache')).acquire(
+                proper_db, os.path.join(directory, 'decoy.dmnd'))
+            with tempfile.NamedTemporaryFile(prefix='graftm_decoy_test') as query:
+                query.write(self.eg1)
+                query.flush()
+                decoy_filter = MergedDecoyFilter(db, proper_db)
+                self.assertFalse(decoy_filter.filter(
+                    query.name, os.path.join(directory, 'filtered.faa')))
+                self.assertEqual([['proper1']],
+                                 list(decoy_filter.proper_hits.each(
+                                     [SequenceSearchResult.HIT_ID_FIELD])))
+        finally:
+            shutil.rmtree(directory)
+
+    def test_merged_borderline_evalue(self):
+        # A weak hit to the non-decoy sequences, which the many decoy
+        # sequences would push over the E-value cutoff if E-values were
+        # calculated for the size of the merged database
+        proper = self.eg1.split('\n', 1)[1].replace('\n', '')
+        query = ''.join([('A' if i % 3 == 0 else c) \
+                         for i, c in enumerate(proper[:60])])
+        random.seed(1)
+        decoys = ''.join(['>decoy%i\n%s\n' % \
+                          (i, ''.join([random.choice('ACDEFGHIKLMNPQRSTVWY') \
+                                       for _ in range(len(proper))])) \
+                          for i in range(100)])
+        directory = tempfile.mkdtemp(prefix='graftm_decoy_test')
+        try:
+            for name, contents in (('proper', self.eg1), ('decoy', decoys),
+                                   ('query', '>query\n%s\n' % query)):
+                with open(os.path.join(directory, name+'.faa'), 'w') as f:
+                    f.write(contents)
+            for name in ('proper', 'decoy'):
+                extern.run("diamond makedb --in %s.faa --db %s.dmnd" % \
+                           ((os.path.join(directory, name),)*2))
+            proper_db = os.path.join(directory, 'proper.dmnd')
+            query_path = os.path.join(directory, 'query.faa')
+            alone = Diamond(proper_db, evalue=10).run(
+                query_path, UnpackRawReads.PROTEIN_SEQUENCE_TYPE)
+            evalue = alone.column(SequenceSearchResult.EVALUE_FIELD)[0]
+            self.assertTrue(evalue > 0)
+
+            db = MergedDecoyDatabase(os.path.join(directory, 'cache')).acquire(
+                proper_db, os.path.join(directory, 'decoy.dmnd'))
+            self.assertEqual(len(proper), MergedDecoyDatabase.proper_size(db))
+            decoy_filter = MergedDecoyFilter(db, proper_db, evalue=evalue*10)
+            self.assertTrue(decoy_filter.filter(
+                query_path, os.path.join(directory, 'filtered.faa')))
+            self.assertEqual(
+                [evalue],
+                decoy_filter.proper_hits.column(SequenceSearchResult.EVALUE_FIELD).tolist())
+        finally:
+            shutil.rmtree(directory)
+
 if __name__ == "__main__":
     unittest.main()
@@ -87,6 +87,12 @@ class Tests(unittest.TestCase):
                                              {'1': ['one','two','three','1'],
                                               '2': ['one','two','three','2'],
                                               '3': ['one','two','three','3']}))
+
+    def test_duplicates_share_sequence(self):
+        seqs = [Sequence('1', 'AAA'), Sequence('2', ''.join(['AA','A']))]
+        self.assertFalse(seqs[0].seq is seqs[1].seq)
+        dees = self.d.deduplicate(seqs)
+        self.assertTrue(dees[0][0].seq is dees[0][1].seq)
         
 if __name__ == "__main__":
     unittest.main()
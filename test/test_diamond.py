@@ -28,6 +28,7 @@ import tempfile
 from graftm.unpack_sequences import UnpackRawReads
 
 sys.path = [os.path.join(os.path.dirname(os.path.realpath(__file__)),'..')]+sys.path
+from graftm.sequence_search_results import DiamondSearchResult
 from graftm.diamond import Diamond
 
 path_to_data = os.path.join(os.path.dirname(os.path.realpath(__file__)),'data')
@@ -65,8 +66,8 @@ VAFATGNSNAGINGWYLSQILHKEYHSRLGFYGYDLQDQCGAANSLSIRSDEGLLHECRG'''
             # seq2    638201361    100.0    472    0    0    1    472    1    472    2.9e-283    963.0
             self.assertEqual(
 
-                             [['seq1', '637699780', '100.0', '548', '0', 1, 548, 1, 548, '0.0e+00', '1103.6', True],
-                              ['seq2', '638201361', '100.0', '472', '0', 1, 472, 1, 472, '1.1e-282', '961.1', True]],
+                             [['seq1', '637699780', 100.0, 548, 0, 1, 548, 1, 548, 0.0, 1103.6, True],
+                              ['seq2', '638201361', 100.0, 472, 0, 1, 472, 1, 472, 1.1e-282, 961.1, True]],
                              list([x[:-1] for x in res.each(res.fields)])
                              )
 
@@ -83,13 +84,78 @@ VAFATGNSNAGINGWYLSQILHKEYHSRLGFYGYDLQDQCGAANSLSIRSDEGLLHECRG'''
             # seq2    638201361    100.0    472    0    0    1    472    1    472    2.9e-283    963.0
 
             self.assertEqual(
-                             [['seq1', '637699780', '100.0', '548', '0', 1, 548, 1, 548, '0.0e+00', '1103.6', True],
-                              ['seq2', '638201361', '100.0', '472', '0', 1, 472, 1, 472, '1.1e-282', '961.1', True]],
+                             [['seq1', '637699780', 100.0, 548, 0, 1, 548, 1, 548, 0.0, 1103.6, True],
+                              ['seq2', '638201361', 100.0, 472, 0, 1, 472, 1, 472, 1.1e-282, 961.1, True]],
                              list([x[:-1] for x in res.each(res.fields)])
                              )
             self.assertTrue(os.path.exists(daa))
             os.remove("%s.daa" % base)
 
+    def test_run_batch(self):
+        seq1, seq2 = ['>'+s for s in self._protein_query.split('>')[1:]]
+        with tempfile.NamedTemporaryFile() as f1:
+            with tempfile.NamedTemporaryFile() as f2:
+                with tempfile.NamedTemporaryFile() as empty:
+                    f1.write(seq2+'\n')
+                    f1.flush()
+                    f2.write(seq1)
+                    f2.flush()
+                    d = Diamond(os.path.join(path_to_data,'diamond','mcra.faa.dmnd'))
+                    results = d.run_batch([f1.name, empty.name, f2.name],
+                                          UnpackRawReads.PROTEIN_SEQUENCE_TYPE,
+                                          ['sample1', 'sample2', 'sample3'])
+        self.assertEqual([[['seq2', '638201361', 100.0, 472, 0, 1, 472, 1, 472, 1.1e-282, 961.1, True, 'sample1.daa']],
+                          [],
+                          [['seq1', '637699780', 100.0, 548, 0, 1, 548, 1, 548, 0.0, 1103.6, True, 'sample3.daa']]],
+                         [list(res.each(res.fields)) for res in results])
+
+    def test_basename_without_daa(self):
+        with tempfile.NamedTemporaryFile() as f:
+            f.write(self._protein_query)
+            f.flush()
+            d = Diamond(os.path.join(path_to_data,'diamond','mcra.faa.dmnd'))
+            base = 'mybase'
+            res = d.run(f.name, UnpackRawReads.PROTEIN_SEQUENCE_TYPE,
+                        daa_file_basename=base, keep_daa=False)
+            self.assertEqual(
+                             [['seq1', '637699780', 100.0, 548, 0, 1, 548, 1, 548, 0.0, 1103.6, True, 'mybase.daa'],
+                              ['seq2', '638201361', 100.0, 472, 0, 1, 472, 1, 472, 1.1e-282, 961.1, True, 'mybase.daa']],
+                             list(res.each(res.fields))
+                             )
+            self.assertFalse(os.path.exists("%s.daa" % base))
+
+    def test_covers(self):
+        db = os.path.join(path_to_data,'diamond','mcra.faa.dmnd')
+        res = DiamondSearchResult.import_from_tabular([], 'mcra.faa.dmnd')
+        Diamond(db, evalue='1e-5')._describe(res)
+        self.assertTrue(Diamond(db, evalue=1e-5).covers(res))
+        self.assertTrue(Diamond(db, evalue=1e-10).covers(res))
+        self.assertFalse(Diamond(db, evalue=1e-3).covers(res))
+        self.assertFalse(Diamond(db).covers(res))
+        self.assertFalse(Diamond(db+'.other', evalue=1e-5).covers(res))
+        Diamond(db)._describe(res)
+        self.assertTrue(Diamond(db).covers(res))
+        self.assertTrue(Diamond(db, evalue=1e-5).covers(res))
+
+    def test_dbsize(self):
+        cmd = Diamond('a.dmnd', dbsize=1234)._command_list(
+            'q.faa', UnpackRawReads.PROTEIN_SEQUENCE_TYPE)
+        self.assertEqual(['--dbsize', '1234'], cmd[-2:])
+        res = DiamondSearchResult.import_from_tabular([], 'a.dmnd')
+        Diamond('a.dmnd', dbsize=1234)._describe(res)
+        self.assertFalse(Diamond('a.dmnd').covers(res))
+
+    def test_covers_other_database_size(self):
+        # Hits of the database found in a search of a larger database, as
+        # by MergedDecoyFilter, have E-values of the larger database
+        db = os.path.join(path_to_data,'diamond','mcra.faa.dmnd')
+        res = DiamondSearchResult.import_from_tabular([], 'merged.dmnd')
+        Diamond(db+'.merged')._describe(res)
+        res.database = db
+        self.assertFalse(Diamond(db).covers(res))
+        res.evalue_database = db
+        self.assertTrue(Diamond(db).covers(res))
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+
+#=======================================================================
+# Authors: Ben Woodcroft
+#
+# Unit tests.
+#
+# Copyright
+#
+# This is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.	See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License.
+# If not, see <http://www.gnu.org/licenses/>.
+#=======================================================================
+
+import sys, os, unittest, tempfile
+sys.path = [os.path.join(os.path.dirname(os.path.realpath(__file__)),'..')]+sys.path
+
+from graftm.fasta_index import FastaIndex
+
+class Tests(unittest.TestCase):
+    def index(self, fasta):
+        f = tempfile.NamedTemporaryFile()
+        f.write(fasta)
+        f.flush()
+        self.addCleanup(f.close)
+        index = FastaIndex(f.name)
+        self.addCleanup(index.close)
+        return index
+
+    def test_records(self):
+        index = self.index('>1\nATG\n>2 comment\nAA\nAAA\n>3\nC\n')
+        self.assertEqual(3, len(index))
+        self.assertEqual(['>1\nATG\n', '>3\nC\n'], index.records(['3','1','4']))
+        self.assertEqual(['>2 comment\nAA\nAAA\n'], index.records(['2']))
+        self.assertTrue('2' in index)
+        self.assertFalse('2 comment' in index)
+
+    def test_duplicate_names(self):
+        index = self.index('>a\nA\n>b\nC\n>a\nG\n')
+        self.assertEqual(['>a\nA\n', '>a\nG\n'], index.records(['a']))
+
+    def test_no_trailing_newline(self):
+        index = self.index('>a\nA\n>b\nC')
+        self.assertEqual(['>a\nA\n', '>b\nC\n'], index.records(['b','a']))
+
+    def test_empty(self):
+        index = self.index('')
+        self.assertEqual(0, len(index))
+        self.assertEqual([], index.records(['a']))
+
+if __name__ == "__main__":
+    unittest.main()
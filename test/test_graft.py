@@ -39,6 +39,12 @@ path_to_samples = os.path.join(os.path.dirname(os.path.realpath(__file__)),'samp
 class Tests(unittest.TestCase):
 
     def test_euk_check(self):
+        self.assert_euk_reads_removed('--euk_check')
+
+    def test_staged_euk_check(self):
+        self.assert_euk_reads_removed('--staged_euk_check')
+
+    def assert_euk_reads_removed(self, euk_check_flag):
         reads = """>euk1
 TCAAATGTCTGCCCTATCAACTATTGATGGTAGTGTAGAGGACTACCATGGTTGCGACGGGTAACGGGGAATCAGGGTTCGATTCCGGAGAGGGAGCCTG
 >euk2
@@ -62,10 +68,11 @@ CCCCGCCTTCCTCCCCTTTGTCAGAGGCAGTTCTGCTAGAGTGCGCCCCGATTGCTCGGGGGTAGCAACTAACCGTAAGG
             package = os.path.join(path_to_data,'61_otus.gpkg')
 
             with tempdir.TempDir() as tmp:
-                cmd = '%s graft --verbosity 5 --forward %s --graftm_package %s --output_directory %s --force --euk_check' % (path_to_script,
+                cmd = '%s graft --verbosity 5 --forward %s --graftm_package %s --output_directory %s --force %s' % (path_to_script,
                                                                                                    data,
                                                                                                    package,
-                                                                                                   tmp)
+                                                                                                   tmp,
+                                                                                                   euk_check_flag)
                 extern.run(cmd)
 
                 sample_name = os.path.basename(fasta.name[:-3])
@@ -153,7 +160,7 @@ GATCGTATATGTCAGGCGGTGTCGGTTTCACGCAGTACGCAACTGCAGCATACACCGATAACATCCTCGACGACTACAGC
             data = fasta.name
             package = os.path.join(path_to_data,'mcrA_with_dmnd.gpkg/')
             with tempdir.TempDir() as tmp:                
-                cmd = '%s graft --verbosity 2 --search_method diamond --forward %s --graftm_package %s --output_directory %s --force --search_and_align_only' % (path_to_script,
+                cmd = '%s graft --verbosity 2 --search_method diamond --forward %s --graftm_package %s --output_directory %s --force --search_and_align_only --keep_diamond_daa' % (path_to_script,
                                                                                                                  data,
                                                                                                                  package,
                                                                                                                  tmp)
@@ -1166,7 +1173,7 @@ ATGGCTACTGAAAAAACACAAAAGATGTTCCTCGAGGCGATGAAAAAGAAGTTCGCAGAGGACCCTACTTCAAACAAGAC
             fasta.flush()
             sample_name = os.path.basename(fasta.name[:-3])
             with tempdir.TempDir() as tmp:
-                cmd = '%s graft --verbosity 5 --search_method diamond --forward %s --output_directory %s --force --assignment_method diamond --graftm_package %s' % (path_to_script,
+                cmd = '%s graft --verbosity 5 --search_method diamond --forward %s --output_directory %s --force --assignment_method diamond --keep_diamond_daa --graftm_package %s' % (path_to_script,
                                                                                                                  fasta.name,
                                                                                                                  tmp,
                                                                                                                  os.path.join(path_to_data,'mcrA.gpkg'))
@@ -1510,6 +1517,43 @@ FADPHLVFDFREPKMCIAKATLRQFMPAGERDPTLPPH
         # clean up
         os.remove(f.name+".dmnd")
 
+    def test_diamond_assignment_with_decoy_cache(self):
+        # Hits reused from the search of the merged decoy database must give
+        # the same assignments as a search of the package's database
+        testing_read = '''>2518787893 METHANOFLORENS STORDALENMIRENSIS MCRA
+MATEKTQKMFLEAMKKKFAEDPTSNKTTYKREGWTQSKDKREFQEWGAKIAKDRGIPAY
+NVNVHLGMTLGQRQLMPYNVSGTDVMCEGDDLHYVNNPAMQQMWDEIRRTVIVGLDTAH
+ETLTRRLGKEVTPETINGYLEALNHTMPGAAIVQEHMVETHPALVEDCFVKVFTGDDDLA'''
+        decoy_sequence = '''>unrelated decoy
+MSVESTTAPSPAPDLDRQTMEVDIACAGFGPAMGGFLTTLTRAWSENPADPAFESKAAPG
+MPLQVLCYERADDIAAGVSGVVTRAQGIRASFPGLNPAEIPMAVEVTHERVLYLLDPIGA
+'''
+        gpkg = os.path.join(path_to_data, 'mcrA.gpkg')
+        with tempfile.NamedTemporaryFile(suffix='.fa') as fasta:
+            fasta.write(testing_read)
+            fasta.flush()
+            with tempfile.NamedTemporaryFile(prefix='graftmdec', suffix='.fa') as f:
+                f.write(decoy_sequence)
+                f.flush()
+                extern.run("diamond makedb --in %s --db %s.dmnd" %\
+                           (f.name, f.name))
+                tables = []
+                with tempdir.TempDir() as cache:
+                    for extra in ('', ' --decoy_cache_directory %s' % cache):
+                        with tempdir.TempDir() as tmp:
+                            cmd = '%s graft --verbosity 2 --forward %s '\
+                                  '--output_directory %s --force '\
+                                  '--assignment_method diamond '\
+                                  '--graftm_package %s --decoy_database %s%s' %\
+                                  (path_to_script, fasta.name, tmp, gpkg,
+                                   f.name+'.dmnd', extra)
+                            extern.run(cmd)
+                            tables.append(open(os.path.join(
+                                tmp, 'combined_count_table.txt')).read())
+                os.remove(f.name+'.dmnd')
+        self.assertEqual(tables[0], tables[1])
+        self.assertTrue('Methanoflorens' in tables[0])
+
     def test_too_short_orfs(self):
         fna_file = os.path.join(path_to_data, 'mcrA.gpkg/mcrA_1.1.fna')
         gpkg=os.path.join(path_to_data, "mcrA.gpkg")
@@ -1527,6 +1571,23 @@ FADPHLVFDFREPKMCIAKATLRQFMPAGERDPTLPPH
                     self.assertEqual(128, e.returncode)
                     raise e
 
+    def test_too_short_orfs_removes_captures(self):
+        fna_file = os.path.join(path_to_data, 'mcrA.gpkg/mcrA_1.1.fna')
+        gpkg=os.path.join(path_to_data, "mcrA.gpkg")
+        with tempdir.TempDir() as tmp:
+            with tempdir.TempDir() as capture:
+                cmd = '%s graft --verbosity 5 --forward %s --graftm_package '\
+                      '%s --output_directory %s --force --min_orf_length 900 '\
+                      '--builtin_orf_caller --read_capture_directory %s' %\
+                      (path_to_script,
+                       fna_file,
+                       gpkg,
+                       tmp,
+                       capture)
+                with self.assertRaises(extern.ExternCalledProcessError):
+                    extern.run(cmd)
+                self.assertEqual([], os.listdir(capture))
+
     def test_protein_input_for_pplacer(self):
         testing_read = '''>Methanoflorens_stordalmirensis_v4.3.2_01362 Methyl-coenzyme M reductase subunit alpha
 MATEKTQKMFLEAMKKKFAEDPTSNKTTYKREGWTQSKDKREFQEWGAKIAKDRGIPAYN
@@ -28,8 +28,69 @@ import sys
 
 sys.path = [os.path.join(os.path.dirname(os.path.realpath(__file__)),'..')]+sys.path
 from graftm.sequence_searcher import SequenceSearcher
+from graftm.sequence_search_results import HMMSearchResult
 
 class Tests(unittest.TestCase):
+    def nhmmer_result(self, hits):
+        # nhmmer tblout rows of (read, bit score) hits
+        return HMMSearchResult.import_from_nhmmer_rows(
+            [[read, '-', 'hmm', '-', '1', '50', '1', '50', '1', '50', '150',
+              '+', '1e-10', bit_score, '0.1', '-'] for read, bit_score in hits])
+
+    def test_check_euk_contamination(self):
+        bacterial = self.nhmmer_result([('both_euk_better', '40.0'),
+                                        ('both_bacterial_better', '90.0'),
+                                        ('both_bacterial_better', '30.0'),
+                                        ('bacterial_only', '50.0')])
+        euk = self.nhmmer_result([('both_euk_better', '60.0'),
+                                  ('both_bacterial_better', '50.0'),
+                                  ('euk_only', '50.0')])
+        # The lowest scoring hit of each read is compared, as it was when
+        # hits were read from the nhmmer tables
+        self.assertEqual(set(['both_euk_better', 'both_bacterial_better',
+                              'euk_only']),
+                         SequenceSearcher(['bac', 'euk'])._check_euk_contamination(
+                             [bacterial, euk]))
+        self.assertEqual(set(['both_euk_better', 'euk_only']),
+                         SequenceSearcher(['bac', 'euk'])._check_euk_contamination(
+                             [self.nhmmer_result([('both_euk_better', '40.0'),
+                                                  ('both_bacterial_better', '90.0'),
+                                                  ('bacterial_only', '50.0')]),
+                              euk]))
+
+    def test_check_euk_contamination_multiple_hmms(self):
+        first = self.nhmmer_result([('euk_better', '40.0'),
+                                    ('second_better', '40.0'),
+                                    ('first_only', '70.0')])
+        second = self.nhmmer_result([('euk_better', '45.0'),
+                                     ('second_better', '80.0'),
+                                     ('second_only', '10.0')])
+        euk = self.nhmmer_result([('euk_better', '50.0'),
+                                  ('second_better', '50.0'),
+                                  ('first_only', '50.0')])
+        # Reads missing from any of the other HMMs' hits are eukaryotic
+        self.assertEqual(set(['euk_better', 'first_only']),
+                         SequenceSearcher(['a', 'b', 'euk'])._check_euk_contamination(
+                             [first, second, euk]))
+
+    def test_get_read_names(self):
+        # (read, hmmfrom, hmmto, alifrom, alito) of each hit
+        hits = [('contig1', 1, 100, 1, 300),
+                ('contig1', 101, 200, 400, 700), # linked, within range
+                ('contig1', 1, 100, 5000, 5300), # out of range
+                ('contig1', 1, 100, 350, 50), # other strand
+                ('contig1', 1, 100, 10, 250), # same hit, ignored
+                ('contig2', 1, 100, 1, 300),
+                ('contig3', 1, 100, 5, 5)] # covers none of the read
+        result = HMMSearchResult.import_from_nhmmer_rows(
+            [[read, '-', 'hmm', '-', str(hmmfrom), str(hmmto), str(alifrom),
+              str(alito), '-', '-', '-', '-', '-', '50.0'] \
+             for read, hmmfrom, hmmto, alifrom, alito in hits])
+        self.assertEqual({'contig1': {'entry': [[1, 700], [5000, 5300], [50, 350]],
+                                      'strand': [True, True, False]},
+                          'contig2': {'entry': [[1, 300]], 'strand': [True]}},
+                         SequenceSearcher(None)._get_read_names([result], 1000))
+
     def test_merg_aln(self):
         forward_reads='''>no_overlap
 -------CGTATGCAACCTACCTT---------------------------------------
@@ -49,6 +49,11 @@ class HmmsearcherTests(unittest.TestCase):
         cmd = searcher._hmm_command('orfm some', [(['hmm1','out1'],1), (['hmm2','out2'],2)])
         self.assertEqual('orfm some | tee >(hmmsearch  --cpu 1 -o /dev/null --noali --domtblout out1 hmm1 -) | hmmsearch  --cpu 2 -o /dev/null --noali --domtblout out2 hmm2 -', cmd)
         
+    def test_generates_cmd_reading_file(self):
+        searcher = graftm.hmmsearcher.HmmSearcher(1)
+        cmd = searcher._individual_hmm_command('hmm1', 'out1', 2, '/tmp/input.fa')
+        self.assertEqual('hmmsearch  --cpu 2 -o /dev/null --noali --domtblout out1 hmm1 /tmp/input.fa', cmd)
+
     def test_munch_off_batch_single_cpu(self):
         searcher = graftm.hmmsearcher.HmmSearcher(1)
         queue = [['hmm1','out1'],['hmm2','out2']]
@@ -98,6 +103,129 @@ example_partial_mcra8 -            162 mcrA.fasta           -            557
         cmd = searcher._hmm_command('cat some', [(['hmm1','out1'],10)])
         self.assertEqual('cat some | nhmmer  --cpu 10 -o /dev/null --noali --tblout out1 hmm1 -', cmd)        
 
+    def test_sharded_cmd(self):
+        searcher = graftm.hmmsearcher.HmmSearcher(4, num_shards=2)
+        cmd = searcher._sharded_hmm_command('cat some', [(['hmm1','out1'],2)])
+        self.assertTrue(cmd.startswith('cat some | '))
+        self.assertTrue(cmd.endswith(
+            "stream_sharder.py' 'hmmsearch  --cpu 2 -o /dev/null --noali --domtblout out1.shard0 hmm1 -' "
+            "'hmmsearch  --cpu 2 -o /dev/null --noali --domtblout out1.shard1 hmm1 -'"))
+
+    def test_merge_shard_outputs(self):
+        searcher = graftm.hmmsearcher.HmmSearcher(4, num_shards=3)
+        with tempfile.NamedTemporaryFile() as output:
+            for shard, contents in ((0, '# h\n# h\n#\n# f0\n'),
+                                    (1, '# h\nhit1\n#\n# f1\n'),
+                                    (2, '# h\nhit2\n#\n# f2\n')):
+                with open('%s.shard%i' % (output.name, shard), 'w') as f:
+                    f.write(contents)
+            rows = searcher._merge_shard_outputs([output.name])
+            self.assertEqual('# h\nhit1\nhit2\n#\n# f1\n',
+                             open(output.name).read())
+            self.assertEqual({output.name: [['hit1'], ['hit2']]}, rows)
+            self.assertFalse(os.path.exists('%s.shard0' % output.name))
+
+    def test_sharded_domain_evalue_cmd(self):
+        searcher = graftm.hmmsearcher.HmmSearcher(4, ' -Z 10', num_shards=2,
+                                                  domain_evalue='1e-5')
+        self.assertEqual('hmmsearch --domE 1e+300  -Z 10 --cpu 2 -o /dev/null --noali --domtblout out1 hmm1 -',
+                         searcher._individual_hmm_command('hmm1', 'out1', 2))
+        searcher = graftm.hmmsearcher.HmmSearcher(4, ' -Z 10',
+                                                  domain_evalue='1e-5')
+        self.assertEqual('hmmsearch --domE 1e-5  -Z 10 --cpu 2 -o /dev/null --noali --domtblout out1 hmm1 -',
+                         searcher._individual_hmm_command('hmm1', 'out1', 2))
+
+    def test_merge_shard_domain_evalues(self):
+        searcher = graftm.hmmsearcher.HmmSearcher(4, num_shards=2,
+                                                  domain_evalue='1e-5')
+        row = '%-4s -  100 hmmA -  50  1e-20  70.0  0.1   %i   2   %s   %s  60.0  0.1  1  50  1  50  1  50 0.99 -\n'
+        with tempfile.NamedTemporaryFile() as output:
+            # 3 sequences are reported in all, 2 by the first shard
+            with open('%s.shard0' % output.name, 'w') as f:
+                f.write('# h\n' +
+                        row % ('seq1', 1, '  1e-06', '  1e-06') +
+                        row % ('seq1', 2, '  4e-06', '  8e-06') +
+                        row % ('seq2', 1, '  1e-07', '  2e-06'))
+            with open('%s.shard1' % output.name, 'w') as f:
+                f.write('# h\n' + row % ('seq3', 1, '  1e-06', '  3e-06'))
+            rows = searcher._merge_shard_outputs([output.name])
+            self.assertEqual('# h\n' +
+                             row % ('seq1', 1, '1.5e-06', '1.5e-06') +
+                             row % ('seq2', 1, '1.5e-07', '  3e-06') +
+                             row % ('seq3', 1, '  3e-06', '  9e-06'),
+                             open(output.name).read())
+            self.assertEqual(['seq1', 'seq2', 'seq3'],
+                             [r[0] for r in rows[output.name]])
+
+    def test_dereplicated_domain_evalues(self):
+        # seq1 stands for 3 sequences, so 4 are reported in all
+        searcher = graftm.hmmsearcher.HmmSearcher(
+            4, domain_evalue='1e-5',
+            target_weight=lambda name: 3 if name == 'seq1' else 1)
+        self.assertTrue(searcher._search_args().startswith('--domE 1e+300 '))
+        row = '%-4s -  100 hmmA -  50  1e-20  70.0  0.1   1   1   %s   %s  60.0  0.1  1  50  1  50  1  50 0.99 -\n'
+        with tempfile.NamedTemporaryFile() as output:
+            output.write('# h\n' + row % ('seq1', '  1e-06', '  1e-06') +
+                         row % ('seq2', '  1e-06', '  6e-06') + '# f\n')
+            output.flush()
+            rows = searcher._write_table(output.name,
+                                         [searcher._read_table(output.name)])
+            self.assertEqual('# h\n' + row % ('seq1', '  2e-06', '  2e-06') +
+                             '# f\n', open(output.name).read())
+            self.assertEqual(['seq1'], [r[0] for r in rows])
+
+    def test_database_hmm_names(self):
+        searcher = graftm.hmmsearcher.HmmDatabaseSearcher
+        mcra = os.path.join(self.path_to_data, 'mcrA.gpkg/mcrA.hmm')
+        s19 = os.path.join(self.path_to_data, 's19.hmm')
+        self.assertEqual(['mcrA.fasta'], searcher.hmm_names(mcra))
+        self.assertTrue(searcher.names_are_unique([mcra, s19]))
+        self.assertFalse(searcher.names_are_unique([mcra, mcra]))
+
+    def test_database_split_table(self):
+        for scan, rows, out1_row in (
+                (False, ['seq1  - 100 hmmA  - 50 1e-10 rest',
+                         'seq2 - 90 hmmB - 60 1e-5 rest'],
+                 'seq1  - 100 hmmA  - 50 1e-10 rest\n'),
+                (True, ['hmmA  - 50 seq1  - 100 1e-10 rest',
+                        'hmmB - 60 seq2 - 90 1e-5 rest'],
+                 'seq1 - 100 hmmA - 50 1e-10 rest\n')):
+            searcher = graftm.hmmsearcher.HmmDatabaseSearcher(1, scan=scan)
+            with tempfile.NamedTemporaryFile() as table:
+                table.write('# header\n'+'\n'.join(rows)+'\n#\n# footer\n')
+                table.flush()
+                with tempfile.NamedTemporaryFile() as out1:
+                    with tempfile.NamedTemporaryFile() as out2:
+                        with tempfile.NamedTemporaryFile() as out3:
+                            searcher._split_table(
+                                table.name,
+                                {'hmmA': out1.name, 'hmmB': out2.name,
+                                 'hmmC': out3.name},
+                                [out1.name, out2.name, out3.name])
+                            self.assertEqual('# header\n'+out1_row+'#\n# footer\n',
+                                             open(out1.name).read())
+                            self.assertEqual('# header\nseq2 - 90 hmmB - 60 1e-5 rest\n#\n# footer\n',
+                                             open(out2.name).read())
+                            self.assertEqual('# header\n#\n# footer\n',
+                                             open(out3.name).read())
+
+    def test_database_split_table_results(self):
+        row = 'seq1 - 162 hmmA - 557 2e-88 286.6 5.0 1 1 2.5e-89 2.2e-88 '\
+            '286.4 5.0 332 487 1 162 1 162 0.99 a description'
+        searcher = graftm.hmmsearcher.HmmDatabaseSearcher(1)
+        with tempfile.NamedTemporaryFile() as table:
+            table.write('# header\n'+row+'\n')
+            table.flush()
+            with tempfile.NamedTemporaryFile() as out1:
+                rows = searcher._split_table(table.name, {'hmmA': out1.name},
+                                             [out1.name])
+                self.assertEqual('# header\n'+row+'\n', open(out1.name).read())
+        self.assertEqual([row.split(None, 22)], rows[out1.name])
+        result = graftm.hmmsearcher.HMMSearchResult.import_from_hmmsearch_rows(
+            rows[out1.name])
+        self.assertEqual([['seq1', 'hmmA', '-', 557, 161, 332, 487, 1, 162,
+                           286.6, True]], result.results)
+
     def test_no_input_exception(self):
         searcher = graftm.hmmsearcher.HmmSearcher(2)
         fna_file = os.path.join(self.path_to_data, 'mcrA.gpkg/mcrA_1.1.fna')
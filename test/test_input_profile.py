@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+
+#=======================================================================
+# Authors: Ben Woodcroft, Joel Boyd
+#
+# Unit tests.
+#
+# Copyright
+#
+# This is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.	See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License.
+# If not, see <http://www.gnu.org/licenses/>.
+#=======================================================================
+
+import unittest
+import tempfile
+import gzip
+import os
+import random
+import sys
+
+sys.path = [os.path.join(os.path.dirname(os.path.realpath(__file__)),'..')]+sys.path
+from graftm.unpack_sequences import UnpackRawReads
+
+class Tests(unittest.TestCase):
+    def write(self, contents, suffix):
+        f = tempfile.NamedTemporaryFile(suffix=suffix)
+        self.addCleanup(f.close)
+        if suffix.endswith('.gz'):
+            g = gzip.GzipFile(fileobj=f, mode='w')
+            g.write(contents)
+            g.close()
+        else:
+            f.write(contents)
+        f.flush()
+        return f.name
+
+    def test_whole_file(self):
+        path = self.write('@1\nATG\n+\nIII\n@2\nMPPLKMPPLK\n+\nIIIIIIIIII\n'
+                          '@3\n'+'A'*60+'\n+\n'+'I'*60+'\n@4\nMPPL\n+\nIIII\n',
+                          '.fq.gz')
+        profile = UnpackRawReads(path).profile()
+        self.assertEqual(4, profile.estimated_read_count)
+        self.assertEqual(4, profile.num_sampled_reads)
+        self.assertEqual(True, profile.complete)
+        self.assertEqual({0: 3, 50: 1}, profile.read_length_histogram)
+        self.assertEqual(19.25, profile.mean_read_length)
+        self.assertTrue(profile.compression_ratio > 0)
+        # Two reads of each type, so the first read decides
+        self.assertEqual(UnpackRawReads.NUCLEOTIDE_SEQUENCE_TYPE,
+                         profile.sequence_type)
+
+    def test_estimate_from_sample(self):
+        random.seed(1)
+        reads = ''.join(['>%i\n%s\n' % \
+                         (i, ''.join([random.choice('ACGT') for _ in range(100)]))
+                         for i in range(20000)])
+        path = self.write(reads, '.fa.gz')
+        profile = UnpackRawReads(path).profile()
+        self.assertFalse(profile.complete)
+        self.assertTrue(profile.num_sampled_reads < 20000)
+        self.assertEqual({100: profile.num_sampled_reads},
+                         profile.read_length_histogram)
+        self.assertTrue(19000 < profile.estimated_read_count < 21000)
+        self.assertTrue(profile.compression_ratio > 2)
+
+    def test_profile_is_remembered(self):
+        path = self.write('>1\nMPPLK\n', '.fa')
+        unpack = UnpackRawReads(path)
+        self.assertEqual(UnpackRawReads.PROTEIN_SEQUENCE_TYPE,
+                         unpack.sequence_type())
+        self.assertTrue(unpack.profile() is unpack.profile())
+
+    def test_unexpected_characters(self):
+        # Reads with characters which are neither bases nor amino acids do
+        # not vote, rather than stopping the profiling
+        path = self.write('>1\nACGT\n>2\nAC-GT\n>3\nACGTN\n>4\nMPP.LK\n', '.fa')
+        profile = UnpackRawReads(path).profile()
+        self.assertEqual(UnpackRawReads.NUCLEOTIDE_SEQUENCE_TYPE,
+                         profile.sequence_type)
+        self.assertEqual(4, profile.estimated_read_count)
+
+    def test_only_unexpected_characters(self):
+        path = self.write('>1\nAC-GT\n', '.fa')
+        with self.assertRaises(Exception):
+            UnpackRawReads(path).profile()
+
+    def test_empty(self):
+        profile = UnpackRawReads(self.write('', '.fa')).profile()
+        self.assertEqual(0, profile.estimated_read_count)
+        self.assertEqual(None, profile.sequence_type)
+        self.assertEqual(None, profile.mean_read_length)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+
+#=======================================================================
+# Authors: Ben Woodcroft, Joel Boyd
+#
+# Unit tests.
+#
+# Copyright
+#
+# This is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.	See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License.
+# If not, see <http://www.gnu.org/licenses/>.
+#=======================================================================
+
+
+import unittest
+import os
+import sys
+import tempfile
+from StringIO import StringIO
+
+sys.path = [os.path.join(os.path.dirname(os.path.realpath(__file__)),'..')]+sys.path
+from graftm import kmer_prefilter
+from graftm.kmer_prefilter import KmerPrefilter, MinimizerPrefilter
+
+class Tests(unittest.TestCase):
+    reference = 'MAKKIHLTEEVGCKLAGRPTVHQWLDEMFSN'
+
+    def test_matches_reduced_alphabet(self):
+        prefilter = KmerPrefilter.build([self.reference], seed='10111')
+        self.assertEqual([True, True, False, False, False],
+                         list(prefilter.matches([
+                             # exact fragment
+                             'GRPTVHQ',
+                             # HLTEE with T->S and E->D, which are the
+                             # same letter in the reduced alphabet, and L,
+                             # which is not in the seed, changed
+                             'HWSDE',
+                             # too short to contain a k-mer
+                             'GRPT',
+                             # unrelated
+                             'CCCCCCCCCCC',
+                             # each k-mer is broken by an X
+                             'GRPTXHQ'])))
+
+    def test_no_kmers_across_sequences(self):
+        prefilter = KmerPrefilter.build(['MAKKI', 'HLTEE'], seed='111')
+        self.assertEqual([True, False, True],
+                         list(prefilter.matches(['AKK', 'KIH', 'TEE'])))
+
+    def test_write_read(self):
+        prefilter = KmerPrefilter.build([self.reference])
+        with tempfile.NamedTemporaryFile() as f:
+            prefilter.write(f.name)
+            read = kmer_prefilter.read(f.name)
+        self.assertEqual(prefilter.seed, read.seed)
+        self.assertEqual(prefilter.alphabet, read.alphabet)
+        self.assertEqual(prefilter.fraction_filled(), read.fraction_filled())
+        self.assertEqual([True, False],
+                         list(read.matches([self.reference[5:25],
+                                            'C'*20])))
+
+    def test_filter(self):
+        prefilter = KmerPrefilter.build([self.reference], seed='1111')
+        output = StringIO()
+        self.assertEqual((4, 2), prefilter.filter(
+            StringIO('>hit1 comment\nMAKK\nIH\n>miss\nCCCC\n'
+                     '>miss2\n\n>hit2\nVHQWL'), output))
+        self.assertEqual('>hit1 comment\nMAKK\nIH\n>hit2\nVHQWL\n',
+                         output.getvalue())
+
+    def test_minimizer_matches(self):
+        reference = 'ACGTTGCAAGGCTTACGATCCGATGACTGAAC'
+        prefilter = MinimizerPrefilter.build([reference], k=6, window=4)
+        self.assertEqual([True, True, True, False, False],
+                         list(prefilter.matches([
+                             # a whole window of the reference
+                             'TTTTTGCAAGGCTTTTTT',
+                             # the same, reverse complemented
+                             'AAAAAAAGCCTTGCAAAAA',
+                             # lower case
+                             'gcaaggctt',
+                             # every k-mer has a mismatch or N
+                             'TTGCTAGGCTTNCGATCAGATGA',
+                             # shorter than k
+                             'ACGTT'])))
+
+    def test_minimizer_write_read(self):
+        reference = 'ACGTTGCAAGGCTTACGATCCGATGACTGAAC'
+        prefilter = kmer_prefilter.build(['ACGTTGCAA--GGCTTACGATCC.GATGACTGAAC'],
+                                         False)
+        self.assertTrue(isinstance(prefilter, MinimizerPrefilter))
+        with tempfile.NamedTemporaryFile() as f:
+            prefilter.write(f.name)
+            read = kmer_prefilter.read(f.name)
+        self.assertEqual((prefilter.k, prefilter.window),
+                         (read.k, read.window))
+        self.assertEqual([True, False],
+                         list(read.matches([reference[3:30], 'A'*30])))
+
+if __name__ == "__main__":
+    unittest.main()
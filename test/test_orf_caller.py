@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+
+#=======================================================================
+# Authors: Ben Woodcroft, Joel Boyd
+#
+# Unit tests.
+#
+# Copyright
+#
+# This is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.	See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License.
+# If not, see <http://www.gnu.org/licenses/>.
+#=======================================================================
+
+import unittest
+import os
+import sys
+import subprocess
+from StringIO import StringIO
+
+sys.path = [os.path.join(os.path.dirname(os.path.realpath(__file__)),'..')]+sys.path
+from graftm.orf_caller import OrfCaller
+
+path_to_data = os.path.join(os.path.dirname(os.path.realpath(__file__)),'data')
+
+class Tests(unittest.TestCase):
+    def test_six_frames(self):
+        self.assertEqual('>r1_1_1_1 a comment\nMK\n'
+                         '>r1_3_3_2 a comment\nEI\n'
+                         '>r1_1_4_3 a comment\nLFH\n'
+                         '>r1_2_5_4 a comment\nIS\n'
+                         '>r1_3_6_5 a comment\nYF\n',
+                         OrfCaller(6).orfs(['r1 a comment\nATGAAA\nTAA']))
+
+    def test_min_orf_length(self):
+        self.assertEqual('>r1_1_4_1\nLFH\n',
+                         OrfCaller(9).orfs(['r1\nATGAAATAA']))
+
+    def test_restrict_read_length(self):
+        self.assertEqual('>r1_1_1_1\nMK\n>r1_1_4_2\nFH\n',
+                         OrfCaller(6, 6).orfs(['r1\nATGAAATAA']))
+
+    def test_ambiguous_bases(self):
+        self.assertEqual('>r1_1_1_1\nMX\n>r1_1_4_2\nXH\n',
+                         OrfCaller(6, 6).orfs(['r1\nATGNAA']))
+
+    def test_short_and_empty_reads(self):
+        self.assertEqual('', OrfCaller().orfs([]))
+        self.assertEqual('>r3_1_1_1\nMK\n>r3_1_4_2\nFH\n',
+                         OrfCaller(6).orfs(['r1\nAT', 'r2\n', 'r3\nATGAAA']))
+
+    def test_orfm_names(self):
+        # ORF names given by OrfM in test_graft
+        reads = open(os.path.join(path_to_data, 'mcrA.gpkg',
+                                  'mcrA_1.1.fna')).read()[1:].strip()
+        orfs = OrfCaller().orfs([reads]).split('\n')
+        self.assertTrue('>example_partial_mcra_1_1_8' in orfs)
+        self.assertTrue(orfs[orfs.index('>example_partial_mcra_1_1_8')+1].startswith(
+            'GGVGFTQYATAAYTDDILDNNVYYNIDYINDKYK'))
+
+    def test_each_block(self):
+        fasta = '>a x\nATGAAA\nTAA\n>b\nTTTATGAAATAG\n>c\nATGAAA\n'
+        caller = OrfCaller(6)
+        expected = caller.orfs(['a x\nATGAAA\nTAA', 'b\nTTTATGAAATAG',
+                                'c\nATGAAA'])
+        for size in (1, 5, 13, len(fasta)):
+            blocks = [fasta[i:i+size] for i in range(0, len(fasta), size)]
+            self.assertEqual(expected, ''.join(caller.each_block(blocks)))
+
+    def test_command_line(self):
+        caller = OrfCaller(6)
+        output = subprocess.Popen(caller.command_line(), shell=True,
+                                  stdin=subprocess.PIPE,
+                                  stdout=subprocess.PIPE).communicate(
+                                      '>a\nATGAAATAA\n')[0]
+        self.assertEqual(caller.orfs(['a\nATGAAATAA']), output)
+
+    def test_call(self):
+        output = StringIO()
+        OrfCaller(6, 6).call(StringIO('>r1\nATGAAATAA\n'), output)
+        self.assertEqual('>r1_1_1_1\nMK\n>r1_1_4_2\nFH\n', output.getvalue())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+
+#=======================================================================
+# Authors: Ben Woodcroft, Joel Boyd
+#
+# Unit tests.
+#
+# Copyright
+#
+# This is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.	See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License.
+# If not, see <http://www.gnu.org/licenses/>.
+#=======================================================================
+
+import unittest
+import tempfile
+import shutil
+import gzip
+import os
+import sys
+import subprocess
+
+sys.path = [os.path.join(os.path.dirname(os.path.realpath(__file__)),'..')]+sys.path
+from graftm.unpack_sequences import UnpackRawReads
+
+class Tests(unittest.TestCase):
+    fastq = '@read1 comment\nACGTNacgtA\n+\nIIIIIIIIII\n@read2\nGG\n+\nII\n'\
+        '@read3\n\n+\n\n@read2\nTTTCA\n+\nIIIII\n'
+    fasta = '>read1 comment\nACGTNacgtA\n>read2\nGG\n>read3\n\n>read2\nTTTCA\n'
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.cache_directory = os.path.join(self.directory, 'cache')
+
+    def write_fastq_gz(self, contents):
+        path = os.path.join(self.directory, 'reads.fq.gz')
+        g = gzip.open(path, 'w')
+        g.write(contents)
+        g.close()
+        return path
+
+    def test_stream_and_extract(self):
+        path = self.write_fastq_gz(self.fastq)
+        unpack = UnpackRawReads(path, cache_directory=self.cache_directory)
+        self.assertEqual(self.fasta,
+                         subprocess.check_output(unpack.command_line(), shell=True))
+        capture = unpack.read_capture()
+        self.assertTrue(capture.is_complete())
+        output = os.path.join(self.directory, 'out.fa')
+        self.assertEqual(2, capture.extract(['read2', 'read4'], output))
+        self.assertEqual('>read2\nGG\n>read2\nTTTCA\n', open(output).read())
+        unpack.remove_read_capture()
+        self.assertTrue(capture.is_complete())
+
+    def test_cache_reused_until_content_changes(self):
+        path = self.write_fastq_gz(self.fastq)
+        first = UnpackRawReads(path, cache_directory=self.cache_directory).read_cache()
+        second = UnpackRawReads(path, cache_directory=self.cache_directory).read_cache()
+        self.assertEqual(first.path, second.path)
+
+        path = self.write_fastq_gz('@other\nA\n+\nI\n')
+        os.utime(path, (0, 0))
+        third = UnpackRawReads(path, cache_directory=self.cache_directory)
+        self.assertNotEqual(first.path, third.read_cache().path)
+        self.assertEqual('>other\nA\n',
+                         subprocess.check_output(third.command_line(), shell=True))
+
+    def test_interleaved_cached_separately(self):
+        path = self.write_fastq_gz(self.fastq)
+        cache = UnpackRawReads(path, interleaved=True,
+                               cache_directory=self.cache_directory).read_cache()
+        self.assertEqual('>read1/1 comment\nACGTNacgtA\n>read2/2\nGG\n',
+                         ''.join(cache.each_block())[:40])
+
+    def test_protein_not_cached(self):
+        path = os.path.join(self.directory, 'proteins.fa')
+        with open(path, 'w') as f:
+            f.write('>1\nMPPLKMPPLK\n')
+        unpack = UnpackRawReads(path, cache_directory=self.cache_directory)
+        self.assertEqual(None, unpack.read_cache())
+        self.assertEqual("cat '%s'" % path, unpack.command_line())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+
+#=======================================================================
+# Authors: Ben Woodcroft, Joel Boyd
+#
+# Unit tests.
+#
+# Copyright
+#
+# This is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.	See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License.
+# If not, see <http://www.gnu.org/licenses/>.
+#=======================================================================
+
+import unittest
+import tempfile
+import gzip
+import bz2
+import os
+import sys
+import shutil
+import subprocess
+from distutils.spawn import find_executable
+
+sys.path = [os.path.join(os.path.dirname(os.path.realpath(__file__)),'..')]+sys.path
+from graftm.read_decoder import ReadDecoder, ReadCapture, DecodingException
+from graftm.unpack_sequences import UnpackRawReads
+from graftm.orf_caller import OrfCaller
+
+class Tests(unittest.TestCase):
+    fastq = '''@read1 comment
+ATGC
++
+IIII
+@read2
+AAAA
++read2
+IIII
+'''
+
+    def decode(self, contents, suffix, interleaved=False, threads=1):
+        with tempfile.NamedTemporaryFile(suffix=suffix) as f:
+            if suffix.endswith('.gz'):
+                g = gzip.GzipFile(fileobj=f, mode='w')
+                g.write(contents)
+                g.close()
+            else:
+                f.write(contents)
+            f.flush()
+            unpack = UnpackRawReads(f.name, interleaved=interleaved,
+                                    threads=threads)
+            in_process = ''.join(unpack.read_decoder().each_block())
+            piped = subprocess.check_output(unpack.command_line(), shell=True)
+            self.assertEqual(in_process, piped)
+            return in_process
+
+    def test_fastq(self):
+        self.assertEqual('>read1 comment\nATGC\n>read2\nAAAA\n',
+                         self.decode(self.fastq, '.fq'))
+
+    def test_fastq_gz(self):
+        self.assertEqual('>read1 comment\nATGC\n>read2\nAAAA\n',
+                         self.decode(self.fastq, '.fq.gz'))
+
+    def test_fastq_gz_multiple_processes(self):
+        self.assertEqual('>read1 comment\nATGC\n>read2\nAAAA\n',
+                         self.decode(self.fastq, '.fq.gz', threads=2))
+
+    def test_fasta_gz(self):
+        self.assertEqual('>1\nAC\nGT\n>2\nA\n',
+                         self.decode('>1\nAC\nGT\n>2\nA\n', '.fa.gz'))
+
+    def compressed_file(self, contents, suffix, command):
+        f = tempfile.NamedTemporaryFile(suffix=suffix)
+        self.addCleanup(f.close)
+        process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=f)
+        process.communicate(contents)
+        return f.name
+
+    def test_bzip2(self):
+        # Two concatenated streams, as written by parallel compressors
+        with tempfile.NamedTemporaryFile(suffix='.fq.bz2') as f:
+            f.write(bz2.compress(self.fastq[:20])+bz2.compress(self.fastq[20:]))
+            f.flush()
+            decoder = UnpackRawReads(f.name).read_decoder()
+            self.assertEqual('>read1 comment\nATGC\n>read2\nAAAA\n',
+                             ''.join(decoder.each_block()))
+            # Also without external decompressors
+            decoder._decompression_commands = lambda: []
+            self.assertEqual('>read1 comment\nATGC\n>read2\nAAAA\n',
+                             ''.join(decoder.each_block()))
+
+    def test_xz(self):
+        if not find_executable('xz'): self.skipTest('xz not installed')
+        path = self.compressed_file(self.fastq, '.fastq.xz', ['xz', '-c'])
+        self.assertEqual('>read1 comment\nATGC\n>read2\nAAAA\n',
+                         ''.join(UnpackRawReads(path).read_decoder().each_block()))
+
+    def test_zstd(self):
+        if not find_executable('zstd'): self.skipTest('zstd not installed')
+        path = self.compressed_file('>1\nAC\n', '.fa.zst', ['zstd', '-cq'])
+        self.assertEqual('>1\nAC\n',
+                         ''.join(UnpackRawReads(path).read_decoder().each_block()))
+
+    def test_interleaved_fastq(self):
+        self.assertEqual('>read1/1 comment\nATGC\n>read2/2\nAAAA\n',
+                         self.decode(self.fastq, '.fq.gz', interleaved=True))
+
+    def test_interleaved_fasta_with_existing_suffixes(self):
+        self.assertEqual('>a/1\nA\n>a/2 c\nA\n>b/2/1\nA\n>b/2\nA\n',
+                         self.decode('>a/1\nA\n>a c\nA\n>b/2\nA\n>b\nA\n', '.fa',
+                                     interleaved=True))
+
+    def test_no_trailing_newline(self):
+        self.assertEqual('>read1\nAT\n',
+                         self.decode('@read1\nAT\n+\nII', '.fq'))
+
+    def test_truncated_fastq(self):
+        with tempfile.NamedTemporaryFile(suffix='.fq') as f:
+            f.write('@read1\nAT\n+\n')
+            f.flush()
+            with self.assertRaises(DecodingException):
+                list(ReadDecoder(f.name, fastq=True).each_block())
+
+    def test_sequence_type_of_gzipped_fastq(self):
+        with tempfile.NamedTemporaryFile(suffix='.fq.gz') as f:
+            g = gzip.GzipFile(fileobj=f, mode='w')
+            g.write('@read1\nMPPLK\n+\nIIIII\n')
+            g.close()
+            f.flush()
+            self.assertEqual(UnpackRawReads.PROTEIN_SEQUENCE_TYPE,
+                             UnpackRawReads(f.name).sequence_type())
+
+    def capture_and_extract(self, contents, suffix, read_names):
+        capture_directory = tempfile.mkdtemp()
+        try:
+            with tempfile.NamedTemporaryFile(suffix=suffix) as f:
+                if suffix.endswith('.gz'):
+                    g = gzip.GzipFile(fileobj=f, mode='w')
+                    g.write(contents)
+                    g.close()
+                else:
+                    f.write(contents)
+                f.flush()
+                unpack = UnpackRawReads(f.name,
+                                        capture_directory=capture_directory)
+                streamed = subprocess.check_output(unpack.command_line(),
+                                                   shell=True)
+                capture = unpack.read_capture()
+                self.assertTrue(capture.is_complete())
+                with tempfile.NamedTemporaryFile() as out:
+                    capture.extract(read_names, out.name)
+                    extracted = open(out.name).read()
+                unpack.remove_read_capture()
+                self.assertEqual([], os.listdir(capture_directory))
+                return streamed, extracted
+        finally:
+            shutil.rmtree(capture_directory)
+
+    def test_capture_fastq_gz(self):
+        streamed, extracted = self.capture_and_extract(self.fastq, '.fq.gz',
+                                                       ['read2', 'read3'])
+        self.assertEqual('>read1 comment\nATGC\n>read2\nAAAA\n', streamed)
+        self.assertEqual('>read2\nAAAA\n', extracted)
+
+    def test_capture_fasta_in_place(self):
+        fasta = '>a x\nAC\nGT\n>b\nA\n>c\nG\n>b\nT\n'
+        streamed, extracted = self.capture_and_extract(fasta, '.fa',
+                                                       ['c', 'b'])
+        self.assertEqual(fasta, streamed)
+        self.assertEqual('>b\nA\n>c\nG\n>b\nT\n', extracted)
+
+    def test_orf_capture(self):
+        fastq = '@r1 x\nATGAAATAA\n+\nIIIIIIIII\n@r2\nATGAAA\n+\nIIIIII\n'
+        orf_caller = OrfCaller(6)
+        with tempfile.NamedTemporaryFile(suffix='.fq.gz') as f:
+            g = gzip.GzipFile(fileobj=f, mode='w')
+            g.write(fastq)
+            g.close()
+            f.flush()
+            unpack = UnpackRawReads(f.name)
+            streamed = subprocess.check_output(
+                unpack.orf_command_line(orf_caller), shell=True)
+            capture = unpack.orf_capture()
+            self.assertTrue(capture.is_complete())
+            with tempfile.NamedTemporaryFile() as out:
+                capture.extract(['r2_1_4_2', 'r1_3_3_2'], out.name)
+                extracted = open(out.name).read()
+            unpack.remove_read_capture()
+            unpack.remove_orf_capture()
+        self.assertEqual(orf_caller.orfs(['r1 x\nATGAAATAA', 'r2\nATGAAA']),
+                         streamed)
+        self.assertEqual('>r1_3_3_2 x\nEI\n>r2_1_4_2\nFH\n', extracted)
+
+    def test_incomplete_capture(self):
+        self.assertFalse(ReadCapture('/nonexistent.idx',
+                                     '/nonexistent.fa').is_complete())
+
+if __name__ == "__main__":
+    unittest.main()
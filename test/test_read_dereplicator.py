@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+
+#=======================================================================
+# Authors: Ben Woodcroft, Joel Boyd
+#
+# Unit tests.
+#
+# Copyright
+#
+# This is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.	See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License.
+# If not, see <http://www.gnu.org/licenses/>.
+#=======================================================================
+
+import unittest
+import tempfile
+import os
+import sys
+import subprocess
+import argparse
+from StringIO import StringIO
+
+sys.path = [os.path.join(os.path.dirname(os.path.realpath(__file__)),'..')]+sys.path
+from graftm.read_dereplicator import ReadDereplicator
+from graftm.unpack_sequences import UnpackRawReads
+from graftm.run import Run
+
+class Tests(unittest.TestCase):
+    def dereplicate(self, fasta):
+        output = StringIO()
+        duplicates = StringIO()
+        ReadDereplicator(duplicates).dereplicate(StringIO(fasta), output)
+        return output.getvalue(), duplicates.getvalue()
+
+    def test_dereplicate(self):
+        self.assertEqual(('>a x\nACGT\n>b\nAC\nGG\n>d\nT\n',
+                          'c\ta\ne\tb\n'),
+                         self.dereplicate('>a x\nACGT\n>b\nAC\nGG\n>c y\nACGT\n'
+                                          '>d\nT\n>e\nACGG'))
+
+    def test_no_reads(self):
+        self.assertEqual(('', ''), self.dereplicate(''))
+
+    def test_unpack(self):
+        with tempfile.NamedTemporaryFile(suffix='.fq') as f:
+            f.write('@r1\nAAA\n+\nIII\n@r2\nAAA\n+\nIII\n@r3\nAAA\n+\nIII\n'
+                    '@r4\nTTT\n+\nIII\n')
+            f.flush()
+            unpack = UnpackRawReads(f.name, dereplicate=True)
+            self.assertEqual({}, unpack.duplicates())
+            self.assertEqual('>r1\nAAA\n>r4\nTTT\n',
+                             subprocess.check_output(unpack.command_line(),
+                                                     shell=True))
+            self.assertEqual({'r1': ['r2', 'r3']}, unpack.duplicates())
+            unpack.remove_duplicates()
+            self.assertEqual({}, unpack.duplicates())
+
+    def test_restore_duplicate_reads(self):
+        assignments = {'base': {'r1': ['a'], 'r2_10_2_3': ['b'],
+                                'r3_split_2': ['c'], 'r4_1_1_1_split_1': ['d'],
+                                'r5': ['e']}}
+        Run(argparse.Namespace(subparser_name='test'))._restore_duplicate_reads(
+            assignments, {'base': {'r1': ['d1'], 'r2': ['d2'], 'r3': ['d3'],
+                                   'r4': ['d4', 'd5']}})
+        self.assertEqual({'r1': ['a'], 'd1': ['a'],
+                          'r2_10_2_3': ['b'], 'd2_10_2_3': ['b'],
+                          'r3_split_2': ['c'], 'd3_split_2': ['c'],
+                          'r4_1_1_1_split_1': ['d'], 'd4_1_1_1_split_1': ['d'],
+                          'd5_1_1_1_split_1': ['d'],
+                          'r5': ['e']}, assignments['base'])
+
+if __name__ == "__main__":
+    unittest.main()
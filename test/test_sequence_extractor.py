@@ -23,6 +23,7 @@
 
 
 import sys, os, unittest, logging, tempfile
+from StringIO import StringIO
 sys.path = [os.path.join(os.path.dirname(os.path.realpath(__file__)),'..')]+sys.path
 
 from graftm.sequence_extractor import SequenceExtractor
@@ -60,7 +61,19 @@ AAAAA
                 self.assertEqual(['>1','ATG','>1','CAT','>2 comment','TTTTT',''],
                                  open(g.name).read().split("\n"))
 
-                            
+    def test_extract_from_stream(self):
+        fasta = '''>1
+ATG
+>2 comment
+AAAAA
+>3
+C
+'''
+        out = StringIO()
+        SequenceExtractor().extract_from_stream(['2','3'], StringIO(fasta), out)
+        self.assertEqual(['>2 comment','AAAAA','>3','C',''],
+                         out.getvalue().split("\n"))
+
 if __name__ == "__main__":
     logging.basicConfig(level=logging.ERROR)
     unittest.main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+
+#=======================================================================
+# Authors: Ben Woodcroft
+#
+# Unit tests.
+#
+# Copyright
+#
+# This is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.	See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License.
+# If not, see <http://www.gnu.org/licenses/>.
+#=======================================================================
+
+import sys, os, unittest, tempfile, gzip
+from StringIO import StringIO
+sys.path = [os.path.join(os.path.dirname(os.path.realpath(__file__)),'..')]+sys.path
+
+from graftm.sequence_io import SequenceIO, Sequence
+
+class Tests(unittest.TestCase):
+    def each(self, text, buffer_size=3):
+        seqio = SequenceIO()
+        seqio._BUFFER_SIZE = buffer_size
+        return list(seqio.each(StringIO(text)))
+
+    def test_fasta(self):
+        self.assertEqual([('1','ATGC',None), ('2','',None), ('3','A',None)],
+                         self.each('ignored\n>1 comment\nAT\nGC\n>2\n>3\nA'))
+
+    def test_fastq(self):
+        self.assertEqual([('1','ATG','III'), ('2','A','#')],
+                         self.each('@1 comment\nATG\n+\nIII\n@2\nA\n+2\n#\n'))
+
+    def test_wrapped_fastq(self):
+        self.assertEqual([('1','ATGC','I@II'), ('2','A','#')],
+                         self.each('@1\nAT\nGC\n+\nI@\nII\n@2\nA\n+\n#\n'))
+
+    def test_lines(self):
+        self.assertEqual([('1','ATGC',None)],
+                         list(SequenceIO().each(['>1\n','AT\n','GC\n'])))
+
+    def test_read_gzip_fasta_file(self):
+        with tempfile.NamedTemporaryFile(suffix='.fa.gz') as f:
+            g = gzip.GzipFile(fileobj=f, mode='w')
+            g.write('>1\nATG\n>2\nC\n')
+            g.close()
+            f.flush()
+            seqs = SequenceIO().read_fasta_file(f.name)
+            self.assertEqual(['1','2'], [s.name for s in seqs])
+            self.assertEqual(['ATG','C'], [s.seq for s in seqs])
+
+    def test_write_fasta(self):
+        seqio = SequenceIO()
+        seqio._WRITE_BATCH_SIZE = 2
+        out = StringIO()
+        seqio.write_fasta([Sequence(str(i), 'A'*i) for i in range(1,4)], out)
+        self.assertEqual('>1\nA\n>2\nAA\n>3\nAAA\n', out.getvalue())
+
+if __name__ == "__main__":
+    unittest.main()
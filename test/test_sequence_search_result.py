@@ -27,7 +27,8 @@ import os
 import sys
 
 sys.path = [os.path.join(os.path.dirname(os.path.realpath(__file__)),'..')]+sys.path
-from graftm.sequence_search_results import HMMSearchResult, SequenceSearchResult
+from StringIO import StringIO
+from graftm.sequence_search_results import HMMSearchResult, SequenceSearchResult, DiamondSearchResult
 
 class Tests(unittest.TestCase):
     def test_whacky_directions(self):
@@ -54,7 +55,80 @@ class Tests(unittest.TestCase):
             lres = list(res.each([SequenceSearchResult.QUERY_ID_FIELD,
                                     SequenceSearchResult.ALIGNMENT_DIRECTION]))
             self.assertEqual([['2524288035',True],['2524285235',True]], lres)
-        
+
+    def test_diamond_tabular(self):
+        res = DiamondSearchResult.import_from_tabular(StringIO(
+            'seq1\t637699780\t100.0\t548\t0\t0\t1\t548\t1\t548\t0.0e+00\t1103.6\n'
+            'seq2\t638201361\t99.5\t472\t2\t0\t472\t1\t1\t472\t1.1e-282\t961.1\n'),
+            'a.daa')
+        self.assertEqual([['seq1', '637699780', 100.0, 548, 0, 1, 548, 1, 548, 0.0, 1103.6, True, 'a.daa'],
+                          ['seq2', '638201361', 99.5, 472, 2, 472, 1, 1, 472, 1.1e-282, 961.1, False, 'a.daa']],
+                         res.results)
+
+    def nhmmer_result(self, hits):
+        # hits are (read, hmm, alifrom, alito, bit score)
+        return HMMSearchResult.import_from_nhmmer_rows(
+            [[read, '-', hmm, '-', '1', '50', str(alifrom), str(alito),
+              '-', '-', '-', '-', '-', str(bit_score)] \
+             for read, hmm, alifrom, alito, bit_score in hits])
+
+    def test_typed_columns(self):
+        res = self.nhmmer_result([('read1', 'hmmA', 10, 1, 20.5)])
+        self.assertEqual([['read1', 'hmmA', 9, 1, 50, 10, 1, 20.5, False]],
+                         res.results)
+        self.assertEqual(1, len(res))
+
+    def test_best_rows(self):
+        res = self.nhmmer_result([('read1', 'hmmA', 1, 10, 20.5),
+                                  ('read2', 'hmmA', 1, 10, 30.0),
+                                  ('read1', 'hmmB', 1, 10, 40.0),
+                                  ('read1', 'hmmC', 1, 10, 40.0),
+                                  ('read2', 'hmmB', 1, 10, 10.0)])
+        self.assertEqual(['read1', 'read2'], res.queries())
+        self.assertEqual([2, 1], res.best_rows().tolist())
+        self.assertEqual([0, 4], res.best_rows(lowest=True).tolist())
+        self.assertEqual([3, 4], res.last_rows().tolist())
+        self.assertEqual([3, 2], res.hits_per_query().tolist())
+        self.assertEqual({'hmmA': 2, 'hmmB': 2, 'hmmC': 1},
+                         res.hits_per_name())
+        self.assertEqual({'hmmA': 1, 'hmmB': 1},
+                         res.hits_per_name(rows=res.best_rows()))
+
+    def test_best_rows_empty(self):
+        res = self.nhmmer_result([])
+        self.assertEqual([], res.best_rows().tolist())
+        self.assertEqual([], res.last_rows().tolist())
+        self.assertEqual({}, res.hits_per_name())
+
+    def test_concatenate(self):
+        res = SequenceSearchResult.concatenate(
+            [self.nhmmer_result([('read1', 'hmmA', 1, 10, 20.5),
+                                 ('read2', 'hmmA', 1, 10, 30.0)]),
+             self.nhmmer_result([('read3', 'hmmB', 1, 10, 40.0),
+                                 ('read1', 'hmmB', 10, 1, 50.0)])])
+        self.assertEqual(['read1', 'read2', 'read3'], res.queries())
+        self.assertEqual([['read1', 'hmmA', True], ['read2', 'hmmA', True],
+                          ['read3', 'hmmB', True], ['read1', 'hmmB', False]],
+                         list(res.each([SequenceSearchResult.QUERY_ID_FIELD,
+                                        SequenceSearchResult.HMM_NAME_FIELD,
+                                        SequenceSearchResult.ALIGNMENT_DIRECTION])))
+        self.assertEqual([3, 1, 2], res.best_rows().tolist())
+
+    def test_subset(self):
+        res = self.nhmmer_result([('read1', 'hmmA', 1, 10, 20.5),
+                                  ('read2', 'hmmA', 1, 10, 30.0),
+                                  ('read3', 'hmmB', 1, 10, 40.0),
+                                  ('read1', 'hmmB', 10, 1, 50.0)])
+        sub = res.subset([2, 0])
+        self.assertEqual(['read3', 'read1'], sub.queries())
+        self.assertEqual([['read3', 'hmmB', 40.0], ['read1', 'hmmA', 20.5]],
+                         list(sub.each([SequenceSearchResult.QUERY_ID_FIELD,
+                                        SequenceSearchResult.HMM_NAME_FIELD,
+                                        SequenceSearchResult.ALIGNMENT_BIT_SCORE])))
+        self.assertEqual([0, 1], sub.best_rows().tolist())
+        self.assertEqual(0, len(res.subset([])))
+        self.assertEqual([], res.subset([]).queries())
+
         
         
 if __name__ == "__main__":
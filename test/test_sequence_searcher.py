@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+
+#=======================================================================
+# Authors: Ben Woodcroft, Joel Boyd
+#
+# Unit tests.
+#
+# Copyright
+#
+# This is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.	See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License.
+# If not, see <http://www.gnu.org/licenses/>.
+#=======================================================================
+
+import unittest
+import tempfile
+import shutil
+import subprocess
+import os
+import sys
+
+sys.path = [os.path.join(os.path.dirname(os.path.realpath(__file__)),'..')]+sys.path
+from graftm.sequence_searcher import SequenceSearcher
+from graftm.sequence_io import SequenceIO
+from graftm.unpack_sequences import UnpackRawReads
+from graftm.orf_caller import OrfCaller
+from graftm.orfm import OrfM
+
+path_to_data = os.path.join(os.path.dirname(os.path.realpath(__file__)),'data')
+
+class Tests(unittest.TestCase):
+    def reads(self):
+        '''Return the path to a FASTA file of reads, some with mcrA ORFs'''
+        f = tempfile.NamedTemporaryFile(suffix='.fa')
+        self.addCleanup(f.close)
+        for i, path in enumerate([
+                os.path.join(path_to_data, 'mcrA.gpkg', 'mcrA_1.1.fna'),
+                os.path.join(path_to_data, 'mcrA.gpkg', 'mcrA_2.1.fna'),
+                os.path.join(path_to_data, 'random_paired.fna'),
+                os.path.join(path_to_data, 'aa_orf_split_bug.fna')]):
+            for seq in SequenceIO().read_fasta_file(path):
+                f.write('>read%i\n%s\n' % (i, seq.seq))
+        f.flush()
+        return f.name
+
+    def num_orfs(self, path, orf_caller):
+        return orf_caller.orfs(['%s\n%s' % (s.name, s.seq) for s in \
+                                SequenceIO().read_fasta_file(path)]).count('\n') / 2
+
+    def test_orf_database_size(self):
+        path = self.reads()
+        searcher = SequenceSearcher([os.path.join(path_to_data, 'mcrA.gpkg',
+                                                  'mcrA.hmm')],
+                                    search_shards=2)
+        num_orfs = self.num_orfs(path, OrfCaller())
+        self.assertTrue(num_orfs > 4)
+        self.assertEqual((2, ' -Z %i' % num_orfs),
+                         searcher._sharding_arguments(UnpackRawReads(path),
+                                                      False, OrfCaller()))
+        self.assertEqual((2, ' -Z %i' % num_orfs),
+                         searcher._sharding_arguments(UnpackRawReads(path),
+                                                      False, OrfM()))
+        self.assertEqual((2, ' -Z %i' % self.num_orfs(path, OrfCaller(300))),
+                         searcher._sharding_arguments(UnpackRawReads(path),
+                                                      False,
+                                                      OrfM(min_orf_length=300)))
+        self.assertEqual((2, ' -Z 4'),
+                         searcher._sharding_arguments(UnpackRawReads(path),
+                                                      False))
+
+    def test_prefiltered_orf_database_size(self):
+        path = self.reads()
+        searcher = SequenceSearcher([os.path.join(path_to_data, 'mcrA.gpkg',
+                                                  'mcrA.hmm')],
+                                    kmer_prefilter='prefilter.kmers')
+        self.assertEqual((1, ' -Z %i' % self.num_orfs(path, OrfCaller())),
+                         searcher._sharding_arguments(UnpackRawReads(path),
+                                                      False, OrfM()))
+
+    def test_dereplicated_orf_database_size(self):
+        path = self.reads()
+        searcher = SequenceSearcher([os.path.join(path_to_data, 'mcrA.gpkg',
+                                                  'mcrA.hmm')])
+        self.assertEqual((1, ''), searcher._sharding_arguments(
+            UnpackRawReads(path), False, OrfM()))
+        self.assertEqual((1, ' -Z %i' % self.num_orfs(path, OrfCaller())),
+                         searcher._sharding_arguments(
+                             UnpackRawReads(path, dereplicate=True), False,
+                             OrfM()))
+
+    def test_dereplicated_target_weight(self):
+        with tempfile.NamedTemporaryFile(suffix='.fa') as f:
+            f.write('>r1\nATGAAATAA\n>r2\nATGAAATAA\n>r3\nATGAAATAA\n'
+                    '>r_4\nATGCCC\n')
+            f.flush()
+            searcher = SequenceSearcher([os.path.join(path_to_data,
+                                                      'mcrA.gpkg', 'mcrA.hmm')])
+            self.assertEqual(None, searcher._target_weight(UnpackRawReads(f.name),
+                                                           OrfCaller()))
+            unpack = UnpackRawReads(f.name, dereplicate=True)
+            self.addCleanup(unpack.remove_duplicates)
+            subprocess.check_output(unpack.command_line(), shell=True)
+            weight = searcher._target_weight(unpack, OrfCaller())
+            self.assertEqual([3, 1, 1, 1],
+                             [weight(name) for name in \
+                              ['r1_1_1_1', 'r_4_1_1_1', 'r_4', 'r2_1_1_1']])
+            weight = searcher._target_weight(unpack, None)
+            self.assertEqual([3, 1], [weight('r1'), weight('r1_1_1_1')])
+
+    def hmms(self, num_hmms):
+        '''Return paths to num_hmms copies of the mcrA HMM with unique names'''
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        hmm = open(os.path.join(path_to_data, 'mcrA.gpkg', 'mcrA.hmm')).read()
+        paths = []
+        for i in range(num_hmms):
+            paths.append(os.path.join(directory, 'hmm%i.hmm' % i))
+            with open(paths[-1], 'w') as f:
+                f.write(hmm.replace('NAME  mcrA.fasta', 'NAME  hmm%i' % i))
+        return paths
+
+    def test_hmmscan_orf_database_size(self):
+        # 4 reads with 42 ORFs
+        path = self.reads()
+        searcher = SequenceSearcher(self.hmms(30))._hmm_searcher(
+            UnpackRawReads(path), 1, '--cut_tc', '', 1, OrfCaller())
+        self.assertFalse(searcher._scan)
+        hmms = self.hmms(50)
+        searcher = SequenceSearcher(hmms)._hmm_searcher(
+            UnpackRawReads(path), 1, '--cut_tc', '', 1, OrfCaller())
+        self.assertTrue(searcher._scan)
+        self.assertEqual('--cut_tc -Z 42', searcher._extra_args)
+        # hmmscan's domain E-values differ from hmmsearch's
+        searcher = SequenceSearcher(hmms)._hmm_searcher(
+            UnpackRawReads(path), 1, '', '', 1, OrfCaller(),
+            domain_evalue='1e-5')
+        self.assertFalse(searcher._scan)
+
+    def search_orfs(self, search_shards):
+        path = self.reads()
+        searcher = SequenceSearcher([os.path.join(path_to_data, 'mcrA.gpkg',
+                                                  'mcrA.hmm')],
+                                    search_shards=search_shards)
+        with tempfile.NamedTemporaryFile(suffix='.txt') as output:
+            results = searcher.hmmsearch(output.name, path,
+                                         UnpackRawReads(path), 'nucleotide',
+                                         2, '1e-5', OrfCaller())
+        return sorted(sum([r.column(r.QUERY_ID_FIELD).tolist() \
+                           for r in results], []))
+
+    def test_sharded_orf_search(self):
+        unsharded = self.search_orfs(1)
+        self.assertTrue(len(unsharded) > 0)
+        self.assertEqual(unsharded, self.search_orfs(2))
+
+if __name__ == "__main__":
+    unittest.main()
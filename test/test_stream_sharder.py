@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+
+#=======================================================================
+# Authors: Ben Woodcroft, Joel Boyd
+#
+# Unit tests.
+#
+# Copyright
+#
+# This is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.	See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License.
+# If not, see <http://www.gnu.org/licenses/>.
+#=======================================================================
+
+import unittest
+import tempfile
+import shutil
+import os
+import sys
+from StringIO import StringIO
+
+sys.path = [os.path.join(os.path.dirname(os.path.realpath(__file__)),'..')]+sys.path
+from graftm import stream_sharder
+
+class Tests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def shard(self, fasta, num_shards, chunk_size):
+        outputs = [os.path.join(self.directory, str(i)) for i in range(num_shards)]
+        status = stream_sharder.shard(StringIO(fasta),
+                                      ["cat > '%s'" % o for o in outputs],
+                                      chunk_size)
+        return status, [open(o).read() if os.path.exists(o) else None \
+                        for o in outputs]
+
+    def test_whole_records_in_turn(self):
+        fasta = '>1\nAAAA\n>2\nCC\nCC\n>3\nG\n>4\nT\n'
+        status, outputs = self.shard(fasta, 2, 6)
+        self.assertEqual(0, status)
+        self.assertEqual(['>1\nAAAA\n>3\nG\n', '>2\nCC\nCC\n>4\nT\n'], outputs)
+
+    def test_unused_shards_not_started(self):
+        status, outputs = self.shard('>1\nA\n', 3, 1024)
+        self.assertEqual(0, status)
+        self.assertEqual(['>1\nA\n', None, None], outputs)
+
+    def test_empty_input(self):
+        status, outputs = self.shard('', 2, 1024)
+        self.assertEqual(0, status)
+        self.assertEqual(['', None], outputs)
+
+    def test_failure(self):
+        self.assertEqual(3, stream_sharder.shard(StringIO('>1\nA\n>2\nA\n'),
+                                                 ['cat >/dev/null', 'exit 3'],
+                                                 6))
+
+    def test_command_line(self):
+        fasta = ''.join(['>%i\nACGT\n' % i for i in range(1000)])
+        outputs = [os.path.join(self.directory, str(i)) for i in range(2)]
+        cmd = "printf '%s' | %s" % (fasta, stream_sharder.command_line(
+            ["cat > '%s'" % o for o in outputs]))
+        self.assertEqual(0, os.system("bash -c %s" % stream_sharder.pipes.quote(cmd)))
+        self.assertEqual(fasta, ''.join([open(o).read() for o in outputs]))
+
+if __name__ == "__main__":
+    unittest.main()